@@ -1,11 +1,35 @@
 #!/usr/bin/env python
 
-from setuptools import setup
+import os
+from setuptools import setup, Extension
 import numpy as np
 
+# Compiled cross section integrands. If Cython or a compiler is not available,
+# PETITE falls back to the NumPy implementation in xsec_integrands_numpy.py
+# Set PETITE_OPENMP=1 to run their loops in parallel (requires a compiler with OpenMP support)
+openmp_args = ["-fopenmp"] if os.environ.get("PETITE_OPENMP") == "1" else []
+try:
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        [
+            Extension(
+                "PETITE.xsec_integrands",
+                ["src/PETITE/xsec_integrands.pyx"],
+                include_dirs=[np.get_include()],
+                extra_compile_args=openmp_args,
+                extra_link_args=openmp_args,
+                optional=True,
+            )
+        ],
+        compiler_directives={"language_level": 3},
+    )
+except ImportError:
+    ext_modules = []
 
 setup_args = dict(
     include_dirs=[np.get_include()],
+    ext_modules=ext_modules,
 )
 
 # NOTE: Using .cfg file
@@ -1,20 +1,45 @@
+"""Submodules (and the convenience names below) are imported lazily on first access
+(PEP 562), so that `import PETITE` is cheap and e.g. a worker that only runs SM showers
+never loads the dark-sector modules and tables.
+"""
+
 __version__ = "1.1.0"
 
-# Checking order of imports
-from PETITE import all_processes
-from PETITE import atomic_annihilation
-from PETITE import dark_shower
-from PETITE import kinematics
-from PETITE import lumi_integral_data
-from PETITE import moliere
-from PETITE import particle
-from PETITE import physical_constants
-from PETITE import radiative_return
-from PETITE import shower
+import importlib
+
+_submodules = [
+    "all_processes",
+    "atomic_annihilation",
+    "dark_shower",
+    "kinematics",
+    "library",
+    "lumi_integral_data",
+    "moliere",
+    "particle",
+    "physical_constants",
+    "radiative_return",
+    "shower",
+    "targets",
+]
 
 # Convenience imports
-from PETITE.shower import Shower
-from PETITE.targets import Target
-from PETITE.particle import Particle
+_convenience_imports = {
+    "Shower": "shower",
+    "Target": "targets",
+    "Particle": "particle",
+    "target_information": "targets",
+}
+
+__all__ = _submodules + list(_convenience_imports)
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("PETITE." + name)
+    if name in _convenience_imports:
+        return getattr(importlib.import_module("PETITE." + _convenience_imports[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-from PETITE.targets import target_information
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -5,15 +5,30 @@ import random as rnd
 
 from PETITE.physical_constants import m_electron, m_proton, GeV, alpha_em
 from PETITE.radiative_return import lepton_luminosity_integrand
-from PETITE.radiative_return import transformed_lepton_luminosity_integrand
 
-import pyximport
-
-pyximport.install(inplace=True)
-from PETITE.xsec_integrands import (
-    c_dsigma_brem_dimensionless,
-    c_dsigma_pairprod_dimensionless,
-)
+# Compiled integrands are built at install time (see setup.py), fall back to NumPy otherwise
+try:
+    from PETITE.xsec_integrands import (
+        c_dsigma_brem_dimensionless,
+        c_dsigma_pairprod_dimensionless,
+        c_dsigma_compton_dCT,
+        c_dsigma_annihilation_dCT,
+        c_dsigma_moller_dCT,
+        c_dsigma_bhabha_dCT,
+        c_dsigma_radiative_return_du,
+        c_dsig_dx_dcostheta_dark_brem_exact_tree_level,
+    )
+except ImportError:
+    from PETITE.xsec_integrands_numpy import (
+        c_dsigma_brem_dimensionless,
+        c_dsigma_pairprod_dimensionless,
+        c_dsigma_compton_dCT,
+        c_dsigma_annihilation_dCT,
+        c_dsigma_moller_dCT,
+        c_dsigma_bhabha_dCT,
+        c_dsigma_radiative_return_du,
+        c_dsig_dx_dcostheta_dark_brem_exact_tree_level,
+    )
 
 
 # --------------------------------------------------------------------------
@@ -240,6 +255,7 @@ class dsigma_brem_dimensionless:
         # return dSigs
 
 
+@vg.lbatchintegrand
 class dsig_dx_dcostheta_dark_brem_exact_tree_level:
     def __init__(self, event_info, ndim):
         """
@@ -262,136 +278,19 @@ class dsig_dx_dcostheta_dark_brem_exact_tree_level:
 
     def __call__(self, phase_space_par_list):
 
-        x0, x1, x2 = phase_space_par_list.T
-
-        me = m_electron
-        mV = self.event_info["mV"]
-        Ebeam = self.event_info["E_inc"]
-        MTarget = self.event_info["mT"]
-
         if not ("Method" in self.event_info.keys()):
             self.event_info["Method"] = "Log"
-        if self.event_info["Method"] == "Log":
-            x, l1mct, lttilde = x0, x1, x2
-            one_minus_costheta = 10**l1mct
-            costheta = 1.0 - one_minus_costheta
-            ttilde = 10**lttilde
-            Jacobian = one_minus_costheta * ttilde * np.log(10.0) ** 2
-        elif self.event_info["Method"] == "Standard":
-            x, costheta, ttilde = x0, x1, x2
-            Jacobian = 1.0
-
-        k = np.sqrt((x * Ebeam) ** 2 - mV**2)
-        p = np.sqrt(Ebeam**2 - me**2)
-        V = np.sqrt(p**2 + k**2 - 2 * p * k * costheta)
-
-        utilde = -2 * (x * Ebeam**2 - k * p * costheta) + mV**2
-
-        discr = (
-            utilde**2
-            + 4 * MTarget * utilde * ((1 - x) * Ebeam + MTarget)
-            + 4 * MTarget**2 * V**2
-        )
-
-        # NOTE: safe sqrt -- points with discr < 0 are killed afterwards
-        # NOTE: a better way to specify the kinematical bounds is to do it within the integrand
-        Qplus = V * (utilde + 2 * MTarget * ((1 - x) * Ebeam + MTarget)) + (
-            (1 - x) * Ebeam + MTarget
-        ) * np.sqrt(np.abs(discr))
-        Qplus = Qplus / (2 * ((1 - x) * Ebeam + MTarget) ** 2 - 2 * V**2)
-
-        Qminus = V * (utilde + 2 * MTarget * ((1 - x) * Ebeam + MTarget)) - (
-            (1 - x) * Ebeam + MTarget
-        ) * np.sqrt(np.abs(discr))
-        Qminus = Qminus / (2 * ((1 - x) * Ebeam + MTarget) ** 2 - 2 * V**2)
-
-        Qplus = np.fabs(Qplus)
-        Qminus = np.fabs(Qminus)
-
-        tplus = 2 * MTarget * (np.sqrt(MTarget**2 + Qplus**2) - MTarget)
-        tminus = 2 * MTarget * (np.sqrt(MTarget**2 + Qminus**2) - MTarget)
-
-        tconv = (
-            2
-            * MTarget
-            * (MTarget + Ebeam)
-            * np.sqrt(Ebeam**2 + m_electron**2)
-            / (MTarget * (MTarget + 2 * Ebeam) + m_electron**2)
-        ) ** 2
-
-        t = ttilde * tconv
-
-        q0 = -t / (2 * MTarget)
-        q = np.sqrt(t**2 / (4 * MTarget**2) + t)
-        costhetaq = -(V**2 + q**2 + me**2 - (Ebeam + q0 - x * Ebeam) ** 2) / (2 * V * q)
-
-        mVsq2mesq = mV**2 + 2 * me**2
-        Am2 = (
-            -8
-            * MTarget
-            * (4 * Ebeam**2 * MTarget - t * (2 * Ebeam + MTarget))
-            * mVsq2mesq
-        )
-        A1 = 8 * MTarget**2 / utilde
-        Am1 = (8 / utilde) * (
-            MTarget**2
-            * (
-                2 * t * utilde
-                + utilde**2
-                + 4 * Ebeam**2 * (2 * (x - 1) * mVsq2mesq - t * ((x - 2) * x + 2))
-                + 2 * t * (-(mV**2) + 2 * me**2 + t)
-            )
-            - 2 * Ebeam * MTarget * t * ((1 - x) * utilde + (x - 2) * (mVsq2mesq + t))
-            + t**2 * (utilde - mV**2)
-        )
-        A0 = (8 / utilde**2) * (
-            MTarget**2
-            * (2 * t * utilde + (t - 4 * Ebeam**2 * (x - 1) ** 2) * mVsq2mesq)
-            + 2 * Ebeam * MTarget * t * (utilde - (x - 1) * mVsq2mesq)
-        )
-        Y = -t + 2 * q0 * Ebeam - 2 * q * p * (p - k * costheta) * costhetaq / V
-        W = (
-            Y**2
-            - 4 * q**2 * p**2 * k**2 * (1 - costheta**2) * (1 - costhetaq**2) / V**2
-        )
-
-        # if W == 0.0:
-        #     print("x, costheta, t = ", [x, costheta, t])
-        #     print(
-        #         "Y, q, p, k, costheta, costhetaq, V",
-        #         [Y, q, p, k, costheta, costhetaq, V],
-        #     )
-
-        phi_integral = (A0 + Y * A1 + Am1 / np.sqrt(W) + Y * Am2 / W**1.5) / (
-            8 * MTarget**2
-        )
-
-        formfactor_separate_over_tsquared = Gelastic_inelastic_over_tsquared(
-            self.event_info, t
-        )
 
-        ans = (
-            formfactor_separate_over_tsquared
-            * np.power(alpha_em, 3)
-            * k
-            * Ebeam
-            * phi_integral
-            / (p * np.sqrt(k**2 + p**2 - 2 * p * k * costheta))
-        )
-
-        # kinematic boundaries
-        allowed_kinematics = (
-            (x * Ebeam >= mV)
-            & (discr >= 0)
-            & (tplus > tminus)
-            & (t > tminus)
-            & (t < tplus)
-            & (np.fabs(costhetaq) <= 1.0)
-            & (W > 0)
+        return c_dsig_dx_dcostheta_dark_brem_exact_tree_level(
+            np.ascontiguousarray(phase_space_par_list, dtype=float),
+            self.event_info["E_inc"],
+            self.event_info["mV"],
+            self.event_info["mT"],
+            self.event_info["Z_T"],
+            self.event_info["A_T"],
+            self.event_info["Method"] == "Log",
         )
 
-        return np.where(allowed_kinematics, ans * tconv * Jacobian, 0)
-
 
 def dsigma_radiative_return_dx(event_info, x):
     """
@@ -443,24 +342,8 @@ class dsigma_radiative_return_du:
         Ee = self.event_info["E_inc"]
 
         s = 2.0 * m_electron * (Ee + m_electron)
-        if s < mV**2:
-            if len(np.shape(phase_space_par_list)) <= 1:
-                return 0.0
-            else:
-                return np.zeros(shape=len(phase_space_par_list))
-
-        beta = (2.0 * alpha_em / np.pi) * (np.log(s / m_electron**2) - 1.0)
-        umax = np.power(1.0 - mV**2 / s, beta / 2.0)
-
-        betaf = np.sqrt(1.0 - 4.0 * (m_electron**2) / (mV**2))
-        prefac = (
-            (4.0 * np.pi**2)
-            * alpha_em
-            * betaf
-            * (3.0 / 2.0 - betaf**2 / 2.0)
-            / s
-            * umax
-        )
+        if s < mV**2 and len(np.shape(phase_space_par_list)) <= 1:
+            return 0.0
 
         """
             this needs to be integrated over x in [sqrt(y), 1], where y=mV^2/s and multiplied by 2
@@ -468,21 +351,10 @@ class dsigma_radiative_return_du:
             the factor of 2 comes from splitting the [y,1] integration into [y,sqrt(y)] + [sqrt(y),1], 
             and using x-> y/x in the first part comes from splitting the [y,1] integration into [y,sqrt(y)] + [sqrt(y),1]
         """
-        u0 = phase_space_par_list
-        x1 = 1.0 - np.power(u0 * umax, 2.0 / beta)
-        x2 = mV**2 / (x1 * s)
-
-        allowed_kinematics = (x2 < 1.0) & (x1 > 0.0) & (u0 < 1.0)
-        dSigs = np.where(
-            allowed_kinematics,
-            2.0
-            * prefac
-            * transformed_lepton_luminosity_integrand(s, mV**2 / s, u0 * umax),
-            0,
+        return c_dsigma_radiative_return_du(
+            np.ascontiguousarray(phase_space_par_list, dtype=float), Ee, mV
         )
 
-        return dSigs
-
 
 @vg.lbatchintegrand
 class dsigma_annihilation_dCT:
@@ -511,35 +383,14 @@ class dsigma_annihilation_dCT:
             EgMin = self.event_info["Eg_min"]
         else:
             EgMin = 0.0
-        ctMax = (
-            np.sqrt((Ee + m_electron) / (Ee - m_electron))
-            * (2 * m_electron * (Ee - 2 * EgMin + m_electron) - mV**2)
-            / (2 * m_electron * (Ee + m_electron) - mV**2)
-        )
 
-        if s < mV**2:
-            if len(np.shape(phase_space_par_list)) == 1:
-                return 0.0
-            else:
-                return np.zeros(shape=len(phase_space_par_list))
-
-        b = np.sqrt(1.0 - 4.0 * m_electron**2 / s)
-
-        ct = phase_space_par_list[:, 0]
-        forbidden_kinematics = ct > ctMax
+        if s < mV**2 and len(np.shape(phase_space_par_list)) == 1:
+            return 0.0
 
-        dSigs = np.where(
-            forbidden_kinematics,
-            0.0,
-            4.0
-            * np.pi
-            * alpha_em**2
-            / (s * (1 - b**2 * ct**2))
-            * ((s - mV**2) / (2 * s) * (1 + ct**2) + 2.0 * mV**2 / (s - mV**2)),
+        return c_dsigma_annihilation_dCT(
+            np.ascontiguousarray(phase_space_par_list, dtype=float), Ee, mV, EgMin
         )
 
-        return dSigs
-
 
 @vg.lbatchintegrand
 class dsigma_pairprod_dimensionless:
@@ -654,98 +505,11 @@ class dsigma_compton_dCT:
 
     def __call__(self, phase_space_par_list):
 
-        Eg = self.event_info["E_inc"]
-
-        s = m_electron**2 + 2 * Eg * m_electron
-        allowed_kinematics = s > (m_electron + self.mV) ** 2
-
-        ct = phase_space_par_list[:, 0]
-
-        jacobian = (
-            (s - m_electron**2)
-            / (2 * s)
-            * np.sqrt(
-                (s - self.mV**2) ** 2
-                - 2 * m_electron**2 * (s + self.mV**2)
-                + m_electron**4
-            )
-        )
-
-        t = (
-            -1
-            / 2
-            * (
-                m_electron**4
-                + s
-                * (
-                    -(self.mV**2)
-                    + s
-                    + ct
-                    * np.sqrt(
-                        m_electron**4
-                        + (self.mV**2 - s) ** 2
-                        - 2 * m_electron**2 * (self.mV**2 + s)
-                    )
-                )
-                - m_electron**2
-                * (
-                    self.mV**2
-                    + 2 * s
-                    + ct
-                    * np.sqrt(
-                        m_electron**4
-                        + (self.mV**2 - s) ** 2
-                        - 2 * m_electron**2 * (self.mV**2 + s)
-                    )
-                )
-            )
-            / s
+        return c_dsigma_compton_dCT(
+            np.ascontiguousarray(phase_space_par_list, dtype=float),
+            self.event_info["E_inc"],
+            self.mV,
         )
-        PF = 2.0 * np.pi * alpha_em**2 / (s - m_electron**2) ** 2
-
-        if self.mV == 0.0:
-            T1 = (6.0 * m_electron**2 * s + 3.0 * m_electron**4 - s**2) / (
-                (m_electron**2 - s) * (-(m_electron**2) + s + t)
-            )
-            T2 = 4 * m_electron**4 / (s + t - m_electron**2) ** 2
-            T3 = (t * (s - m_electron**2) + (s + m_electron**2) ** 2) / (
-                s - m_electron**2
-            ) ** 2
-        else:
-            T1 = (
-                2.0 * m_electron**2 * (self.mV**2 - 3 * s)
-                - 3 * m_electron**4
-                - 2 * self.mV**2 * s
-                + 2 * self.mV**4
-                + s**2
-            ) / ((m_electron**2 - s) * (m_electron**2 + self.mV**2 - s - t))
-            T2 = (2 * m_electron**2 * (2 * m_electron**2 + self.mV**2)) / (
-                m_electron**2 + self.mV**2 - s - t
-            ) ** 2
-            T3 = (
-                (m_electron**2 + s) * (m_electron**2 + self.mV**2 + s)
-                + t * (s - m_electron**2)
-            ) / (m_electron**2 - s) ** 2
-
-        # NOTE: AFAI can tell, there's no hardcoded kinematic condition here
-        dSigs = np.where(allowed_kinematics, PF * jacobian * (T1 + T2 + T3), 0)
-
-        if np.isnan(dSigs).sum() > 0:
-            bad_entries = np.isnan(dSigs)
-            print(
-                dSigs[bad_entries],
-                PF[bad_entries],
-                jacobian[bad_entries],
-                T1[bad_entries],
-                T2[bad_entries],
-                T3[bad_entries],
-                ct[bad_entries],
-                s[bad_entries],
-                t[bad_entries],
-                phase_space_par_list[bad_entries],
-            )
-
-        return dSigs
 
 
 @vg.lbatchintegrand
@@ -768,34 +532,10 @@ class dsigma_moller_dCT:
         else:
             DE = 0.010
 
-        delta_ct_limit = 2.0 * DE / (Ee - m_electron)
-
-        ct = phase_space_par_list[:, 0]
-        allowed_kinematics = (ct > -1 + delta_ct_limit) & (ct < 1.0 - delta_ct_limit)
-        s = m_electron**2 + 2 * Ee * m_electron
-        dSigs = np.where(
-            allowed_kinematics,
-            16
-            * np.pi**2
-            * alpha_em**2
-            * (
-                s**2 * (3 + ct**2) ** 2
-                - 8 * m_electron**2 * s * (7 + ct**4)
-                + 16 * m_electron**4 * (6 - 3 * ct**2 + ct**4)
-            )
-            / (
-                8
-                * np.pi
-                * s
-                * (s - 4 * m_electron**2) ** 2
-                * (1 - ct) ** 2
-                * (1 + ct) ** 2
-            ),
-            0,
+        return c_dsigma_moller_dCT(
+            np.ascontiguousarray(phase_space_par_list, dtype=float), Ee, DE
         )
 
-        return dSigs
-
 
 def sigma_moller(event_info):
     """Total cross section for Moller scattering"""
@@ -856,42 +596,11 @@ class dsigma_bhabha_dCT:
             DE = self.event_info["Ee_min"]
         else:
             DE = 0.010
-        delta_ct_limit = 2.0 * DE / (Ee - m_electron)
-
-        ct = phase_space_par_list[:, 0]
-
-        allowed_kinematics = (ct > -1 + delta_ct_limit) & (ct < 1.0 - delta_ct_limit)
-        s = m_electron**2 + 2 * Ee * m_electron
 
-        dSigs = np.where(
-            allowed_kinematics,
-            (
-                alpha_em**2
-                * np.pi
-                * (
-                    256 * (-1 + ct) ** 2 * ct**2 * m_electron**8
-                    - 128
-                    * (-1 + ct)
-                    * (1 + ct * (1 + ct) * (-3 + 2 * ct))
-                    * m_electron**6
-                    * s
-                    + 16
-                    * (7 + ct * (2 + ct * (-5 + 6 * (-1 + ct) * ct)))
-                    * m_electron**4
-                    * s**2
-                    - 8
-                    * (7 + ct * (-3 + ct * (3 + ct * (-1 + 2 * ct))))
-                    * m_electron**2
-                    * s**3
-                    + (3 + ct**2) ** 2 * s**4
-                )
-            )
-            / (2 * (-1 + ct) ** 2 * s**3 * (-4 * m_electron**2 + s) ** 2),
-            0,
+        return c_dsigma_bhabha_dCT(
+            np.ascontiguousarray(phase_space_par_list, dtype=float), Ee, DE
         )
 
-        return dSigs
-
 
 def sigma_bhabha(event_info):
     """Total cross section for Bhabha scattering"""
@@ -1155,3 +864,191 @@ def vegas_integration(event_info, process, verbose=False, mode="XSec"):
         elif mode == "UnweightedSample":
             tr = np.array([integral, get_points(pts, n_points)], dtype=object)
         return tr
+
+
+# Processes whose integrands depend on the target material (Z_T, A_T, mT) only through the
+# elastic form factor g2_elastic(Z_T, q^2), with their momentum transfer squared q^2
+form_factor_q_sq = {
+    "PairProd": pair_production_q_sq_dimensionless,
+    "Brem": brem_q_sq_dimensionless,
+}
+# Processes whose kinematics depend on the target material (through mT)
+target_kinematics = {"DarkBrem"}
+
+
+def g2_elastic_ratio(Z, Z_reference, t):
+    """Elastic form factor g2_elastic of atomic number Z over that of Z_reference, at momentum transfer squared t"""
+    a0, a0_reference = aa(Z, m_electron), aa(Z_reference, m_electron)
+    return (
+        Z
+        * a0**2
+        * (1 + a0_reference**2 * t)
+        / (Z_reference * a0_reference**2 * (1 + a0**2 * t))
+    ) ** 2
+
+
+class multi_target_integrand:
+    def __init__(self, diff_xsec, event_info_list, process):
+        """Integrand of a process for several target materials at once
+        Input:
+            diff_xsec: differential cross section of the process (e.g. diff_xsection_options[process])
+            event_info_list: event_info for each target material (same E_inc and mV, different Z_T, A_T and mT)
+            process: process name
+
+        Called on a batch of points x (n_points x dim), returns the integrand for each target material,
+        an array of shape (len(event_info_list), n_points). The integrand is evaluated once, for the first
+        target, and rescaled by the ratio of form factors for the others (form_factor_q_sq) or broadcast
+        if it does not depend on the target. Only the processes of target_kinematics are evaluated per target.
+        """
+        self.process = process
+        self.event_info_list = event_info_list
+        ndim = len(integration_range(event_info_list[0], process))
+        if process in target_kinematics:
+            self.integrands = [
+                diff_xsec(event_info, ndim) for event_info in event_info_list
+            ]
+        else:
+            self.integrands = [diff_xsec(event_info_list[0], ndim)]
+        self.Z_T = np.array([event_info["Z_T"] for event_info in event_info_list])
+
+    def __call__(self, x):
+        if self.process in target_kinematics:
+            return np.array([np.ravel(integrand(x)) for integrand in self.integrands])
+
+        FF = np.ravel(self.integrands[0](x))
+        if self.process in form_factor_q_sq:
+            with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+                t = form_factor_q_sq[self.process](
+                    np.transpose(x), self.event_info_list[0]
+                )
+                ratio = g2_elastic_ratio(
+                    self.Z_T[:, np.newaxis], self.Z_T[0], t[np.newaxis, :]
+                )
+            # Points outside of the allowed kinematics (FF = 0) may have an undefined q^2
+            return np.where(FF != 0.0, FF * ratio, 0.0)
+        return np.broadcast_to(FF, (len(self.event_info_list), len(FF)))
+
+
+def rescaled_adaptive_map(adaptive_map, igrange):
+    """Copy of a VEGAS adaptive map with the grid of each dimension mapped linearly onto the
+    integration range igrange, so that the map trained at one energy can seed the training at
+    a neighbouring energy (see vegas_training)
+    Returns None if a range of the map or of igrange is empty"""
+    grid = np.array(adaptive_map.grid)
+    new_grid = []
+    for dim, (lower, upper) in enumerate(igrange):
+        nodes = grid[dim, : adaptive_map.ninc[dim] + 1]
+        if nodes[-1] == nodes[0] or upper == lower:
+            return None
+        new_grid.append(lower + (nodes - nodes[0]) * (upper - lower) / (nodes[-1] - nodes[0]))
+    return vg.AdaptiveMap(new_grid)
+
+
+def map_displacement(old_map, new_map):
+    """Largest displacement of the grid nodes of new_map, measured in the y-space (the unit
+    hypercube) of old_map, i.e. as a fraction of the points of old_map"""
+    old_grid, new_grid = np.array(old_map.grid), np.array(new_map.grid)
+    displacement = 0.0
+    for dim in range(old_map.dim):
+        old_nodes = old_grid[dim, : old_map.ninc[dim] + 1]
+        new_nodes = new_grid[dim, : new_map.ninc[dim] + 1]
+        y_old = np.interp(new_nodes, old_nodes, np.linspace(0.0, 1.0, len(old_nodes)))
+        y_new = np.linspace(0.0, 1.0, len(new_nodes))
+        displacement = max(displacement, np.max(np.abs(y_old - y_new)))
+    return displacement
+
+
+def vegas_training(
+    event_info,
+    process,
+    adaptive_map=None,
+    min_nitn=None,
+    max_nitn=None,
+    map_tolerance=2e-3,
+    Q_min=0.1,
+    n_settled=3,
+    verbose=False,
+):
+    """Trains a VEGAS integrator one iteration at a time, stopping once the adaptive map and
+    the integral have settled, optionally starting from the map of a neighbouring energy.
+    The map is settled when its grid nodes move by less than map_tolerance (see map_displacement)
+    in an iteration, or when neither the displacement nor the error of the integral still
+    decrease over n_settled iterations (their noise floor in several dimensions). The integral
+    has settled when the last n_settled iterations are consistent, with a chi^2 probability
+    Q >= Q_min.
+    Args:
+        event_info, process: as for vegas_integration
+        adaptive_map: map to start from (e.g. the map trained at the previous energy), rescaled
+            to the integration range of event_info (see rescaled_adaptive_map)
+        min_nitn, max_nitn: minimum and maximum number of iterations, by default half of and twice
+            the nitn of vegas_integrator_options (vegas_integration runs 2*nitn iterations)
+    Returns:
+        the trained integrator, the average of its last n_settled iterations, and the number of
+        integrand evaluations used
+    """
+    if process in diff_xsection_options:
+        if not ("mV" in event_info.keys()):
+            event_info["mV"] = 0.0
+        if not ("Eg_min" in event_info.keys()):
+            event_info["Eg_min"] = 0.001
+        if not ("Ee_min" in event_info.keys()):
+            event_info["Ee_min"] = 0.005
+        igrange = integration_range(event_info, process)
+        diff_xsec_func = diff_xsection_options[process]
+    else:
+        raise Exception(
+            f"Could not find process {process} in available processes: {diff_xsection_options.keys()}"
+        )
+    options = vegas_integrator_options[process]
+    if min_nitn is None:
+        min_nitn = options["nitn"] // 2
+    if max_nitn is None:
+        max_nitn = 2 * options["nitn"]
+    min_nitn = max(min_nitn, n_settled + 1)
+
+    if adaptive_map is not None:
+        adaptive_map = rescaled_adaptive_map(adaptive_map, igrange)
+    integ = vg.Integrator(igrange if adaptive_map is None else adaptive_map)
+    f_integrand = diff_xsec_func(event_info=event_info, ndim=len(igrange))
+
+    iterations, displacements, relative_errors = [], [], []
+    n_evaluations = 0
+    for _ in range(max_nitn):
+        old_map = vg.AdaptiveMap(integ.map.grid)
+        result = integ(f_integrand, nitn=1, neval=options["neval"])
+        n_evaluations += result.sum_neval
+        iterations.append(result.itn_results[0])
+        # The first iteration of a cold start sets up the grid
+        displacements.append(
+            map_displacement(old_map, integ.map)
+            if len(iterations) > 1 or adaptive_map is not None
+            else 1.0
+        )
+        relative_errors.append(
+            abs(result.sdev / result.mean) if result.mean != 0 else np.inf
+        )
+        if result.mean == 0 and result.sdev == 0:
+            # Empty integration range (e.g. below threshold)
+            break
+        if len(iterations) < min_nitn:
+            continue
+        map_settled = displacements[-1] < map_tolerance or (
+            displacements[-1] > 0.9 * displacements[-1 - n_settled]
+            and min(relative_errors[-n_settled:])
+            > 0.97 * min(relative_errors[:-n_settled])
+        )
+        if map_settled:
+            settled_result = vg.RAvg()
+            for iteration in iterations[-n_settled:]:
+                settled_result.add(iteration)
+            if settled_result.Q >= Q_min:
+                break
+
+    result = vg.RAvg()
+    for iteration in iterations[-n_settled:]:
+        result.add(iteration)
+    if verbose:
+        print(
+            "Trained", process, event_info, "in", len(iterations), "iterations:", result
+        )
+    return integ, result, n_evaluations
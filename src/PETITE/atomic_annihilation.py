@@ -1,5 +1,4 @@
 import numpy as np
-from matplotlib import pyplot as plt
 
 alpha_em=1/137
 m_electron=0.511E-3
@@ -8,6 +7,8 @@ def f_ab(a,b):
     return( 1/((a-b)**2+1)**3 )
 
 def fancy_integral(a, b):
+    # Works for scalars and (broadcastable) arrays of a and b
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
     # Define terms of the expression
     A = 1 + a**2
     B = (1 + a**2)**3
@@ -51,21 +52,24 @@ def fancy_integral(a, b):
             3 * (1 + 5*a**2) * b**4 + \
             6 * a * b**5 - b**6
     
-    # Calculate the expression
-    numerator = (term1 + 
-                 term2 * np.arctan2(a, 1) + 
-                 term3 * np.arctan2(1 + a**2 - a*b, b) + 
-                 4 * b * (term4 * (np.log(1 + (a - b)**2) - 2 * np.log(b))))
-    
-    denominator = 8 * (1 + a**2)**3 * (1 + (a - b)**2)**3 * b
-    
-    result = numerator / denominator
-    
-    if b<1000:
-        return result
-    else:
-        # This was obtained using a Series expansion about b->\infty in Mathematica
-        return ((3081/280 - (3081*a**2)/40)/b**8 - (709*a)/(35*b**7) - 91/(30*b**6))
+    # Calculate the expression (inf/nan for very large b are replaced by the series below)
+    with np.errstate(over="ignore", invalid="ignore"):
+        numerator = (term1 + 
+                     term2 * np.arctan2(a, 1) + 
+                     term3 * np.arctan2(1 + a**2 - a*b, b) + 
+                     4 * b * (term4 * (np.log(1 + (a - b)**2) - 2 * np.log(b))))
+        
+        denominator = 8 * (1 + a**2)**3 * (1 + (a - b)**2)**3 * b
+        
+        result = numerator / denominator
+    
+    # This was obtained using a Series expansion about b->\infty in Mathematica
+    series = ((3081/280 - (3081*a**2)/40)/b**8 - (709*a)/(35*b**7) - 91/(30*b**6))
+
+    result = np.where(b < 1000, result, series)
+    if result.ndim == 0:
+        return float(result)
+    return result
 
 def tree_level_sigma(k,mV, Zeff):
     # Calculate components of the expression
@@ -99,7 +103,27 @@ def rad_tail_sigma(k,mV, Zeff):
 
 
 def sigma_atomic(k,mV,Zeff):
+    # k, mV and Zeff can be scalars or (broadcastable) arrays
     
     sigma_0 = tree_level_sigma(k,mV,Zeff)
     sigma_1 = rad_tail_sigma  (k,mV,Zeff)
-    return(sigma_0 + sigma_1)
\ No newline at end of file
+    return(sigma_0 + sigma_1)
+
+
+# Tables of sigma_atomic on (k, mV) grids, keyed by (Zeff, k grid, mV grid)
+_sigma_atomic_tables = {}
+
+def sigma_atomic_table(k_values, mV_values, Zeff):
+    """
+    Cached 2D table of sigma_atomic over the grids k_values x mV_values
+    Returns:
+        array of shape (len(k_values), len(mV_values)), shared between calls (must not be modified)
+    """
+    k_values = np.asarray(k_values, dtype=float)
+    mV_values = np.asarray(mV_values, dtype=float)
+    key = (float(Zeff), k_values.tobytes(), mV_values.tobytes())
+    if key not in _sigma_atomic_tables:
+        table = sigma_atomic(k_values[:, np.newaxis], mV_values[np.newaxis, :], Zeff)
+        table.flags.writeable = False
+        _sigma_atomic_tables[key] = table
+    return _sigma_atomic_tables[key]
\ No newline at end of file
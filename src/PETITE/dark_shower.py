@@ -1,10 +1,8 @@
 import numpy as np
 import vegas as vg
-import pickle
-import os
+from multiprocessing import Pool
 
-from scipy.interpolate import interp1d
-from scipy.integrate import quad
+from scipy.interpolate import interp1d, PchipInterpolator
 
 from PETITE.moliere import get_scattered_momentum_fast, get_scattered_momentum_Bethe
 from PETITE.particle import Particle, meson_twobody_branchingratios
@@ -15,6 +13,15 @@ from PETITE.kinematics import (
 )
 from PETITE.shower import Shower
 from PETITE import targets
+from PETITE.library import (
+    load_library,
+    load_binary_manifest,
+    binary_sample_dict,
+    binary_cross_section_dict,
+    write_max_F_corrections,
+    cached_dark_table,
+    load_dark_table,
+)
 import PETITE.all_processes as proc
 from copy import deepcopy
 from numpy.random import random as draw_U
@@ -74,10 +81,167 @@ diff_xsection_options = {
 }
 dimensionalities_dark = {"DarkComp": 1, "DarkBrem": 3, "DarkAnn": 1}
 
+# Nodes and weights of the Gauss-Legendre rule used for the dark weight and d-rate tables
+gauss_legendre_order = 8
+gauss_legendre_nodes, gauss_legendre_weights = np.polynomial.legendre.leggauss(
+    gauss_legendre_order
+)
+
+
+def gauss_legendre_integrals(
+    integrand, lower, upper, Ei, n_panels=16, offset=0.0, breakpoints=None
+):
+    """Integrals of integrand(E, Ei) in E from lower to upper, for arrays of limits and Ei.
+    Each interval is split into n_panels panels, geometrically spaced in E - offset (offset is
+    below all limits, e.g. the threshold of the integrand), and further split at the energies
+    in breakpoints (e.g. the nodes of interpolated tables, where the integrand has kinks).
+    Each panel is integrated with Gauss-Legendre quadrature, and integrand is called once
+    on the nodes of all intervals, with E of shape (len(Ei), number of panels,
+    gauss_legendre_order) and Ei of shape (len(Ei), 1, 1)
+    """
+    lower, upper, Ei = np.broadcast_arrays(
+        np.asarray(lower, dtype=float),
+        np.asarray(upper, dtype=float),
+        np.asarray(Ei, dtype=float),
+    )
+    edges = offset + (lower - offset)[:, None] * (
+        (upper - offset) / (lower - offset)
+    )[:, None] ** np.linspace(0.0, 1.0, n_panels + 1)
+    if breakpoints is not None:
+        # breakpoints outside of an interval are moved to its upper limit, where they
+        # give panels of zero width
+        breakpoints = np.asarray(breakpoints, dtype=float)
+        inside = (breakpoints > lower[:, None]) & (breakpoints < upper[:, None])
+        edges = np.sort(
+            np.concatenate(
+                [edges, np.where(inside, breakpoints, upper[:, None])], axis=1
+            ),
+            axis=1,
+        )
+    centers = 0.5 * (edges[:, 1:] + edges[:, :-1])
+    half_widths = 0.5 * (edges[:, 1:] - edges[:, :-1])
+    E = centers[..., None] + half_widths[..., None] * gauss_legendre_nodes
+    values = integrand(E, Ei[:, None, None])
+    return np.sum(values * gauss_legendre_weights * half_widths[..., None], axis=(1, 2))
+
+
+def dark_threshold_energy(process, mV):
+    """Incoming energy (GeV) below which a dark vector of mass mV cannot be produced in
+    process (the resonant energy for DarkAnn). Zero for DarkBrem, whose tables are
+    compared between masses at fixed E/mV"""
+    if process == "DarkAnn":
+        return (mV**2 - 2 * m_electron**2) / (2 * m_electron)
+    if process == "DarkComp":
+        return mV * (mV + 2 * m_electron) / (2 * m_electron)
+    return 0.0
+
+
+def _geometric_interpolation(lower, upper, t):
+    """Interpolates linearly in log space between arrays lower (t = 0) and upper (t = 1),
+    and linearly where they are not both positive"""
+    lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+    positive = (lower > 0.0) & (upper > 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        geometric = np.exp((1 - t) * np.log(lower) + t * np.log(upper))
+    return np.where(positive, geometric, (1 - t) * lower + t * upper)
+
+
+def _bracketing_masses(masses, mV):
+    """Closest masses below and above mV and the position of mV between them in log space"""
+    masses = np.sort(masses)
+    index = np.clip(np.searchsorted(masses, mV), 1, len(masses) - 1)
+    mV_lower, mV_upper = masses[index - 1], masses[index]
+    return mV_lower, mV_upper, np.log(mV / mV_lower) / np.log(mV_upper / mV_lower)
+
+
+def interpolate_dark_table(tables, process, mV):
+    """Interpolates tables [[E, value], ...] of a dark process (cross sections or dark weights),
+    given for several vector masses as {mass: table}, to the vector mass mV.
+    The tables of all masses have the same number of energies, from their threshold up. The
+    reduced energies y = (E - threshold)/mass of the result are interpolated in log space between
+    those of the masses bracketing mV, entry by entry. At each y, log(value) is then interpolated
+    in log(mass) with a monotonic cubic (PCHIP) through the masses whose tables cover y, or
+    between the bracketing masses where fewer are available
+    """
+    masses = np.sort(list(tables.keys()))
+    mV_lower, mV_upper, t = _bracketing_masses(masses, mV)
+    table_lower = np.asarray(tables[mV_lower], dtype=float)
+    table_upper = np.asarray(tables[mV_upper], dtype=float)
+
+    def reduced_energies(table, mass):
+        return (table[:, 0] - dark_threshold_energy(process, mass)) / mass
+
+    y = _geometric_interpolation(
+        reduced_energies(table_lower, mV_lower),
+        reduced_energies(table_upper, mV_upper),
+        t,
+    )
+    values = _geometric_interpolation(table_lower[:, 1], table_upper[:, 1], t)
+
+    # log of the values of each table at y (NaN outside of the table or where the value is zero)
+    log_values = np.full((len(masses), len(y)), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for ii, mass in enumerate(masses):
+            table = np.asarray(tables[mass], dtype=float)
+            log_values[ii] = np.interp(
+                np.log(y),
+                np.log(reduced_energies(table, mass)),
+                np.log(table[:, 1]),
+                left=np.nan,
+                right=np.nan,
+            )
+    log_masses = np.log(masses)
+    for jj in range(len(y)):
+        known = np.isfinite(log_values[:, jj])
+        if np.any(masses[known] < mV) and np.any(masses[known] > mV):
+            values[jj] = np.exp(
+                PchipInterpolator(log_masses[known], log_values[known, jj])(np.log(mV))
+            )
+    return np.transpose([dark_threshold_energy(process, mV) + mV * y, values])
+
+
+def interpolate_dark_drate(drate_lower, drate_upper, process, mV_lower, mV_upper, mV):
+    """Interpolates the d-rate tables {Ei: [[E, weight], ...]} of two vector masses bracketing mV,
+    entry by entry and in log space of the reduced energies (see interpolate_dark_table)
+    and of the weights"""
+    t = np.log(mV / mV_lower) / np.log(mV_upper / mV_lower)
+    threshold_lower, threshold_upper, threshold = [
+        dark_threshold_energy(process, mass) for mass in [mV_lower, mV_upper, mV]
+    ]
+
+    def interpolated_energies(E_lower, E_upper):
+        return threshold + mV * _geometric_interpolation(
+            (np.asarray(E_lower) - threshold_lower) / mV_lower,
+            (np.asarray(E_upper) - threshold_upper) / mV_upper,
+            t,
+        )
+
+    drate = {}
+    for (Ei_lower, rows_lower), (Ei_upper, rows_upper) in zip(
+        drate_lower.items(), drate_upper.items()
+    ):
+        Ei = float(interpolated_energies(Ei_lower, Ei_upper))
+        rows_lower, rows_upper = np.asarray(rows_lower), np.asarray(rows_upper)
+        if rows_lower.shape != rows_upper.shape or np.sum(rows_lower[:, 1]) == 0.0:
+            drate[Ei] = [[0.0, 0.0]]
+            continue
+        drate[Ei] = np.transpose(
+            [
+                interpolated_energies(rows_lower[:, 0], rows_upper[:, 0]),
+                _geometric_interpolation(rows_lower[:, 1], rows_upper[:, 1], t),
+            ]
+        )
+    return drate
+
 
 class DarkShower(Shower):
     """A class to reprocess an existing EM shower to generate dark photons"""
 
+    _library_sample_attributes = {
+        **Shower._library_sample_attributes,
+        "_loaded_dark_samples": "set_dark_samples",
+    }
+
     def __init__(
         self,
         dict_dir,
@@ -92,8 +256,21 @@ class DarkShower(Shower):
         active_processes=None,
         fast_MCS_mode=True,
         rescale_MCS=1,
+        library_format="pickle",
+        binary_library_dir=None,
+        one_dim_sampling="vegas",
+        energy_sampling="nearest",
+        dark_dict_dir=None,
     ):
-        super().__init__(dict_dir, target_material, min_energy)
+        super().__init__(
+            dict_dir,
+            target_material,
+            min_energy,
+            library_format=library_format,
+            binary_library_dir=binary_library_dir,
+            one_dim_sampling=one_dim_sampling,
+            energy_sampling=energy_sampling,
+        )
         """Initializes the dark shower object.
         Args:
             dict_dir: directory containing the pre-computed MC samples of various shower processes
@@ -104,13 +281,18 @@ class DarkShower(Shower):
             finishes its propagation through the target
             mV_in_GeV: vector mass in GeV
             mode: determines whether mV is set to MV_in_GeV or the nearest value for which integrators have been trained
+            library_format, binary_library_dir: choice of pre-computed library, see Shower
+            one_dim_sampling: sampling of the one-dimensional SM processes, see Shower
+            energy_sampling: library energies the SM processes are sampled with, see Shower
+            dark_dict_dir: directory where the dark weight and d-rate tables are read from or
+            saved to (dark_weights.pkl and dark_drate.pkl), defaults to dict_dir
         """
 
         self.active_processes = active_processes
         if self.active_processes is None:
             self.active_processes = dark_process_codes
 
-        self.set_dark_dict_dir(dict_dir)
+        self.set_dark_dict_dir(dict_dir if dark_dict_dir is None else dark_dict_dir)
         self.target = targets.Target(target_material)
         self.min_energy = min_energy
         self.kinetic_mixing = kinetic_mixing
@@ -142,19 +324,18 @@ class DarkShower(Shower):
             self._get_MCS_p = get_scattered_momentum_Bethe
 
     def set_dark_dict_dir(self, value):
-        """Set the directory containing pre-simulated MC events for processes involing target nuclei"""
+        """Set the directory containing the dark weight and d-rate tables"""
         self._dark_dict_dir = value
 
     def get_dark_dict_dir(self):
-        """Get the top level directory containing pre-computed MC pickles"""
+        """Get the directory containing the dark weight and d-rate tables"""
         return self._dark_dict_dir
 
     def set_mV_list(self, dict_dir):
-        sample_file = open(dict_dir + "dark_maps.pkl", "rb")
-        outer_dict = pickle.load(sample_file)
-        sample_file.close()
-
-        mass_list = list(outer_dict.keys())
+        if self._library_format == "binary":
+            mass_list = load_binary_manifest(self.get_binary_library_dir())["dark_masses"]
+        else:
+            mass_list = list(load_library(dict_dir + "dark_maps.pkl").keys())
 
         self._mV_list = mass_list
 
@@ -168,13 +349,27 @@ class DarkShower(Shower):
             return arr[index - 1]
 
     def set_mV(self, value, mode):
-        """Set MVStr to value and extract the corresponding numerical mass of the dark photon"""
+        """Set MVStr to value and extract the corresponding numerical mass of the dark photon.
+        In "approx" mode, the dark cross sections and tables of a mass value between those of
+        the library are interpolated from the library masses around it (up to two on each side),
+        and the VEGAS samples of the closest lesser library mass are used"""
+        self._mV_interpolation_masses = None
         if mode == "exact":
             self._mV = self.closest_lesser_value(self._mV_list, value)
             self._mV_estimator = self._mV
         elif mode == "approx":
+            if value < np.min(self._mV_list) or value > np.max(self._mV_list):
+                raise ValueError(
+                    f"mV = {value} GeV is outside of the range of library masses {self._mV_list}"
+                )
             self._mV = value
             self._mV_estimator = self.closest_lesser_value(self._mV_list, value)
+            if value not in self._mV_list:
+                masses = np.sort(self._mV_list)
+                index = np.searchsorted(masses, value)
+                self._mV_interpolation_masses = list(
+                    masses[max(index - 2, 0) : index + 2]
+                )
         else:
             raise Exception("Mode not valid. Chose exact or approx.")
 
@@ -183,17 +378,39 @@ class DarkShower(Shower):
         return self._mV
 
     def load_dark_sample(self, dict_dir, process):
-        sample_file = open(dict_dir + "dark_maps.pkl", "rb")
-        outer_dict = pickle.load(sample_file)
-        sample_file.close()
-
-        sample_dict = outer_dict[self._mV_estimator]
+        if self._library_format == "binary":
+            sample_dict = binary_sample_dict(
+                self.get_binary_library_dir(),
+                mV=self._mV_estimator,
+                target=self.target.name,
+            )
+        else:
+            sample_dict = load_library(dict_dir + "dark_maps.pkl")[self._mV_estimator]
         if process in sample_dict.keys():
             return sample_dict[process]
         else:
             print(process)
             raise Exception("Process String does not match library")
 
+    def save_max_F_corrections(self):
+        """Writes the envelopes raised at runtime back to sm_maps.pkl and dark_maps.pkl in
+        dict_dir (see Shower.save_max_F_corrections). Dark corrections are only written if
+        the dark vector mass is one of the library masses (mode="exact")
+        Returns:
+            number of energy bins updated"""
+        n_updated = super().save_max_F_corrections()
+        if self._mV != self._mV_estimator:
+            print(
+                "Warning: dark vector mass not in the library, dark max_F corrections not saved"
+            )
+            return n_updated
+        return n_updated + write_max_F_corrections(
+            self._dict_dir + "dark_maps.pkl",
+            self._max_F_corrections,
+            self.target.name,
+            mV=self._mV_estimator,
+        )
+
     def set_dark_samples(self):
         self._loaded_dark_samples = {}
         for process in diff_xsection_options.keys():
@@ -201,12 +418,19 @@ class DarkShower(Shower):
                 self._dict_dir, process
             )
 
-    def load_dark_cross_section(self, dict_dir, process, target_material):
-        dark_cross_section_file = open(dict_dir + "dark_xsec.pkl", "rb")
-        outer_dict = pickle.load(dark_cross_section_file)
-        dark_cross_section_file.close()
-
-        dark_cross_section_dict = outer_dict[self._mV_estimator]
+    def load_dark_cross_section(self, dict_dir, process, target_material, mV=None):
+        """Returns the [energy, cross-section] table of process for the library mass mV
+        (the mass of the VEGAS samples if None)"""
+        if mV is None:
+            mV = self._mV_estimator
+        if self._library_format == "binary":
+            dark_cross_section_dict = binary_cross_section_dict(
+                self.get_binary_library_dir(),
+                mV=mV,
+                target=self.target.name,
+            )
+        else:
+            dark_cross_section_dict = load_library(dict_dir + "dark_xsec.pkl")[mV]
 
         if process not in dark_cross_section_dict:
             raise Exception("Process String does not match library")
@@ -217,21 +441,39 @@ class DarkShower(Shower):
         else:
             raise Exception("Target Material is not in library")
 
+    def _dark_cross_section(self, process):
+        """Cross section table of process for the vector mass, interpolated from the library
+        masses if it is not one of them (see set_mV)"""
+        if self._mV_interpolation_masses is None:
+            return self.load_dark_cross_section(self._dict_dir, process, self.target.name)
+        return interpolate_dark_table(
+            {
+                mass: self.load_dark_cross_section(
+                    self._dict_dir, process, self.target.name, mV=mass
+                )
+                for mass in self._mV_interpolation_masses
+            },
+            process,
+            self._mV,
+        )
+
     def set_dark_cross_sections(self):
         """Loads the pre-computed cross-sections for various shower processes
         and extracts the minimum/maximum values of initial energies
         """
 
         # These contain only the cross sections for the chosen target material
-        self._dark_brem_cross_section = self.load_dark_cross_section(
-            self._dict_dir, "DarkBrem", self._target_material
-        )
-        self._dark_annihilation_cross_section = self.load_dark_cross_section(
-            self._dict_dir, "DarkAnn", self._target_material
-        )
-        self._dark_compton_cross_section = self.load_dark_cross_section(
-            self._dict_dir, "DarkComp", self._target_material
-        )
+        self._dark_brem_cross_section = self._dark_cross_section("DarkBrem")
+        self._dark_annihilation_cross_section = self._dark_cross_section("DarkAnn")
+        self._dark_compton_cross_section = self._dark_cross_section("DarkComp")
+        # Cross sections of the mass of the VEGAS samples, to normalize the integrands of
+        # the vector mass to their envelopes (see draw_dark_sample)
+        self._estimator_dark_cross_sections = {
+            process: self.load_dark_cross_section(
+                self._dict_dir, process, self.target.name
+            )
+            for process in diff_xsection_options
+        }
 
         self._resonant_annihilation_energy = (self._mV**2 - 2 * m_electron**2) / (
             2 * m_electron
@@ -324,164 +566,148 @@ class DarkShower(Shower):
             * self._positron_exponential_factor(E, Ei)
         )
 
-    def construct_brem_weight_array(self):
-        DBS = self.get_DarkBremXSec()
-        initial_energies = np.transpose(DBS)[0]
-
+    def _energy_breaks(self, PID, initial_energies, minimum_energy_0):
+        """Energies below each initial energy after losing ten mean free paths to
+        ionization, bounded from below by minimum_energy_0"""
         dEdxT_GeVperm = self.get_material_properties()[3] * (0.1)
-        mfp_electron_EI = np.array([self.get_mfp([11, Ei]) for Ei in initial_energies])
-        mfp_positron_EI = np.array([self.get_mfp([-11, Ei]) for Ei in initial_energies])
-        energy_loss_ten_mfp_electron = 10 * mfp_electron_EI * dEdxT_GeVperm
-        energy_loss_ten_mfp_positron = 10 * mfp_positron_EI * dEdxT_GeVperm
+        mfp_EI = self.get_mfps(np.full(len(initial_energies), PID), initial_energies)
+        energy_break = initial_energies - 10 * mfp_EI * dEdxT_GeVperm
+        return np.where(energy_break > minimum_energy_0, energy_break, minimum_energy_0)
+
+    def _integrand_breakpoints(self, initial_energies):
+        """Energies at which the dark weight integrands have kinks or jumps: those at which the
+        dark cross section (initial_energies) and the SM interaction integrals are tabulated"""
+        return np.unique(
+            np.concatenate(
+                [initial_energies]
+                + [
+                    getattr(self, "_interaction_integral_" + process).x
+                    for process in ["Brem", "Ann", "Moller", "Bhabha"]
+                ]
+            )
+        )
+
+    def _integrated_weights(self, integrand, PID, initial_energies, offset=0.0):
+        """Integrals of integrand(E, Ei) from the lowest initial energy up to each Ei,
+        split at the energy after ten mean free paths (see gauss_legendre_integrals for offset).
+        The initial energies are those at which the dark cross section is tabulated"""
         minimum_energy_0 = initial_energies[0]
-        energy_break_electrons = np.ones(len(initial_energies)) * minimum_energy_0
-        energy_break_positrons = np.ones(len(initial_energies)) * minimum_energy_0
-        for i in range(len(energy_break_electrons)):
-            Eb_electron = initial_energies[i] - energy_loss_ten_mfp_electron[i]
-            Eb_positron = initial_energies[i] - energy_loss_ten_mfp_positron[i]
-            if Eb_electron > minimum_energy_0:
-                energy_break_electrons[i] = Eb_electron
-            if Eb_positron > minimum_energy_0:
-                energy_break_positrons[i] = Eb_positron
-
-        brem_elec_weight_array = np.array(
-            [
-                quad(
-                    self._dark_brem_integrand_elec,
-                    minimum_energy_0,
-                    energy_break_electrons[i],
-                    args=(initial_energies[i]),
-                    full_output=1,
-                )[0]
-                + quad(
-                    self._dark_brem_integrand_elec,
-                    energy_break_electrons[i],
-                    initial_energies[i],
-                    args=(initial_energies[i]),
-                    full_output=1,
-                )[0]
-                for i in range(len(initial_energies))
-            ]
+        energy_break = self._energy_breaks(PID, initial_energies, minimum_energy_0)
+        breakpoints = self._integrand_breakpoints(initial_energies)
+        return gauss_legendre_integrals(
+            integrand,
+            np.full(len(initial_energies), minimum_energy_0),
+            energy_break,
+            initial_energies,
+            offset=offset,
+            breakpoints=breakpoints,
+        ) + gauss_legendre_integrals(
+            integrand,
+            energy_break,
+            initial_energies,
+            initial_energies,
+            offset=offset,
+            breakpoints=breakpoints,
         )
-        brem_positron_weight_array = np.array(
-            [
-                quad(
-                    self._dark_brem_integrand_positron,
-                    minimum_energy_0,
-                    energy_break_positrons[i],
-                    args=(initial_energies[i]),
-                    full_output=1,
-                )[0]
-                + quad(
-                    self._dark_brem_integrand_positron,
-                    energy_break_positrons[i],
-                    initial_energies[i],
-                    args=(initial_energies[i]),
-                    full_output=1,
-                )[0]
-                for i in range(len(initial_energies))
-            ]
+
+    def construct_brem_weight_array(self):
+        initial_energies = np.transpose(self.get_DarkBremXSec())[0]
+        brem_elec_weight_array = self._integrated_weights(
+            self._dark_brem_integrand_elec, 11, initial_energies
+        )
+        brem_positron_weight_array = self._integrated_weights(
+            self._dark_brem_integrand_positron, -11, initial_energies
         )
 
         return [initial_energies, brem_elec_weight_array, brem_positron_weight_array]
 
     def construct_annihilation_weight_array(self):
-        DAnnS = self.get_DarkAnnXSec()
-        initial_energies = np.transpose(DAnnS)[0]
+        initial_energies = np.transpose(self.get_DarkAnnXSec())[0]
+        annihilation_weight_array = self._integrated_weights(
+            self._dark_ann_integrand,
+            -11,
+            initial_energies,
+            offset=self._resonant_annihilation_energy,
+        )
 
-        dEdxT_GeVperm = self.get_material_properties()[3] * (0.1)
-        mfp_positron_EI = np.array([self.get_mfp([-11, Ei]) for Ei in initial_energies])
-        energy_loss_ten_mfp_positron = 10 * mfp_positron_EI * dEdxT_GeVperm
-        minimum_energy_0 = initial_energies[0]
-        energy_break_positrons = np.ones(len(initial_energies)) * minimum_energy_0
-        for i in range(len(energy_break_positrons)):
-            Eb_positron = initial_energies[i] - energy_loss_ten_mfp_positron[i]
-            if Eb_positron > minimum_energy_0:
-                energy_break_positrons[i] = Eb_positron
+        return [initial_energies, annihilation_weight_array]
 
-        annihilation_weight_array = np.array(
-            [
-                quad(
-                    self._dark_ann_integrand,
-                    minimum_energy_0,
-                    energy_break_positrons[i],
-                    args=(initial_energies[i]),
-                    full_output=1,
-                )[0]
-                + quad(
-                    self._dark_ann_integrand,
-                    energy_break_positrons[i],
-                    initial_energies[i],
-                    args=(initial_energies[i]),
-                    full_output=1,
-                )[0]
-                for i in range(len(initial_energies))
-            ]
+    def _compute_weight_tables(self):
+        print("Weights not previously calculated, calculating now...")
+        (
+            initial_energies_brem,
+            brem_elec_weight_array,
+            brem_positron_weight_array,
+        ) = self.construct_brem_weight_array()
+        initial_energies_annihilation, annihilation_weight_array = (
+            self.construct_annihilation_weight_array()
         )
+        return {
+            "brem_elec_weights": np.transpose(
+                [initial_energies_brem, brem_elec_weight_array]
+            ),
+            "brem_positron_weights": np.transpose(
+                [initial_energies_brem, brem_positron_weight_array]
+            ),
+            "annihilation_weights": np.transpose(
+                [initial_energies_annihilation, annihilation_weight_array]
+            ),
+        }
 
-        return [initial_energies, annihilation_weight_array]
+    def _library_mass_dark_table(self, table_name, mV):
+        """Table table_name ("dark_weights" or "dark_drate") of the library mass mV, which
+        must have been computed before (see build_dark_tables)"""
+        table = load_dark_table(self.get_dark_dict_dir(), table_name, mV, self.target.name)
+        if table is None:
+            raise FileNotFoundError(
+                f"The {table_name} table of the library mass {mV} GeV in {self.target.name}, "
+                f"needed to interpolate the tables of mV = {self._mV} GeV, is not cached in "
+                f"{self.get_dark_dict_dir()}. Compute the tables of the library masses "
+                f"{[float(mass) for mass in self._mV_interpolation_masses]} first with "
+                f"build_dark_tables({self._dict_dir!r}, {self.target.name!r}, {self.min_energy}, "
+                f"mV_list, ...), passing the same dark_dict_dir and library options"
+            )
+        return table
+
+    def _interpolated_weight_tables(self):
+        tables = {
+            mass: self._library_mass_dark_table("dark_weights", mass)
+            for mass in self._mV_interpolation_masses
+        }
+        return {
+            weights: interpolate_dark_table(
+                {mass: tables[mass][weights] for mass in tables}, process, self._mV
+            )
+            for weights, process in [
+                ("brem_elec_weights", "DarkBrem"),
+                ("brem_positron_weights", "DarkBrem"),
+                ("annihilation_weights", "DarkAnn"),
+            ]
+        }
 
     def set_weight_arrays(self):
-        dict_dir = self.get_dark_dict_dir()
-        weights_file_name = dict_dir + "dark_weights.pkl"
-        # check if file named weights_file_name exists
-        files_set = False
-        outer_dict = {}
-        if os.path.exists(weights_file_name):
-            sample_file = open(weights_file_name, "rb")
-            outer_dict = pickle.load(sample_file)
-            sample_file.close()
-            if self._mV_estimator in outer_dict.keys():
-                if self._target_material in outer_dict[self._mV_estimator].keys():
-                    initial_energies_brem_elec, brem_elec_weight_array = np.transpose(
-                        outer_dict[self._mV_estimator][self._target_material][
-                            "brem_elec_weights"
-                        ]
-                    )
-                    initial_energies_brem_positron, brem_positron_weight_array = (
-                        np.transpose(
-                            outer_dict[self._mV_estimator][self._target_material][
-                                "brem_positron_weights"
-                            ]
-                        )
-                    )
-                    initial_energies_annihilation, annihilation_weight_array = (
-                        np.transpose(
-                            outer_dict[self._mV_estimator][self._target_material][
-                                "annihilation_weights"
-                            ]
-                        )
-                    )
-                    files_set = True
-
-        if not files_set:
-            print("Weights not previously calculated, calculating now...")
-            (
-                initial_energies_brem_elec,
-                brem_elec_weight_array,
-                brem_positron_weight_array,
-            ) = self.construct_brem_weight_array()
-            initial_energies_brem_positron = initial_energies_brem_elec
-            initial_energies_annihilation, annihilation_weight_array = (
-                self.construct_annihilation_weight_array()
+        """Loads the dark weight tables of the vector mass and target from the cache in the
+        dark dict directory (see library.cached_dark_table), computing them if missing.
+        Tables of masses between the library masses are interpolated (see set_mV)"""
+        if self._mV_interpolation_masses is not None:
+            weight_tables = self._interpolated_weight_tables()
+        else:
+            weight_tables = cached_dark_table(
+                self.get_dark_dict_dir(),
+                "dark_weights",
+                self._mV_estimator,
+                self.target.name,
+                self._compute_weight_tables,
             )
-            if self._mV_estimator not in outer_dict.keys():
-                outer_dict[self._mV_estimator] = {}
-            outer_dict[self._mV_estimator][self._target_material] = {
-                "brem_elec_weights": np.transpose(
-                    [initial_energies_brem_elec, brem_elec_weight_array]
-                ),
-                "brem_positron_weights": np.transpose(
-                    [initial_energies_brem_positron, brem_positron_weight_array]
-                ),
-                "annihilation_weights": np.transpose(
-                    [initial_energies_annihilation, annihilation_weight_array]
-                ),
-            }
-
-            sample_file = open(weights_file_name, "wb")
-            pickle.dump(outer_dict, sample_file)
-            sample_file.close()
+        initial_energies_brem_elec, brem_elec_weight_array = np.transpose(
+            weight_tables["brem_elec_weights"]
+        )
+        initial_energies_brem_positron, brem_positron_weight_array = np.transpose(
+            weight_tables["brem_positron_weights"]
+        )
+        initial_energies_annihilation, annihilation_weight_array = np.transpose(
+            weight_tables["annihilation_weights"]
+        )
 
         self._brem_elec_numerical_weight = interp1d(
             initial_energies_brem_elec,
@@ -502,175 +728,135 @@ class DarkShower(Shower):
             bounds_error=False,
         )
 
-    def _d_rate_d_E_elec_brem(self, Ei):
-        dEdxT_GeVperm = self.get_material_properties()[3] * (0.1)
-        mfp_electron_EI = self.get_mfp([11, Ei])
-        energy_loss_ten_mfp = 10 * mfp_electron_EI * dEdxT_GeVperm
-        energy_array = np.linspace(
-            np.max([Ei - energy_loss_ten_mfp, self.get_DarkBremXSec()[0][0]]), Ei, 11
-        )
-        energy_center_array = np.array(
-            [
-                (energy_array[i] + energy_array[i + 1]) / 2.0
-                for i in range(len(energy_array) - 1)
-            ]
+    def _d_rate_d_E_bins(
+        self, integrand, PID, Ei_samp, minimum_saved_energy, offset=0.0
+    ):
+        """Splits the energies within ten mean free paths below each Ei in Ei_samp into 10 bins
+        and integrates integrand(E, Ei) in each of them (see gauss_legendre_integrals for offset).
+        As in _integrated_weights, Ei_samp are the energies at which the dark cross section is tabulated
+        Returns:
+            bin edges (len(Ei_samp), 11) and bin integrals (len(Ei_samp), 10)"""
+        energy_break = self._energy_breaks(PID, Ei_samp, minimum_saved_energy)
+        energy_arrays = np.linspace(energy_break, Ei_samp, 11, axis=1)
+        weights = gauss_legendre_integrals(
+            integrand,
+            energy_arrays[:, :-1].ravel(),
+            energy_arrays[:, 1:].ravel(),
+            np.repeat(Ei_samp, 10),
+            n_panels=4,
+            offset=offset,
+            breakpoints=self._integrand_breakpoints(Ei_samp),
         )
+        return energy_arrays, weights.reshape(len(Ei_samp), 10)
 
-        brem_elec_weights = np.array(
-            [
-                quad(
-                    self._dark_brem_integrand_elec,
-                    energy_array[i],
-                    energy_array[i + 1],
-                    args=(Ei),
-                    full_output=1,
-                )[0]
-                for i in range(len(energy_array) - 1)
-            ]
+    def _d_rate_d_E_brem_array(self, integrand, PID):
+        Ei_samp = np.transpose(self.get_DarkBremXSec())[0]
+        energy_arrays, weights = self._d_rate_d_E_bins(
+            integrand, PID, Ei_samp, self.get_DarkBremXSec()[0][0]
         )
-        return np.transpose([energy_center_array, brem_elec_weights])
+        energy_center_arrays = 0.5 * (energy_arrays[:, :-1] + energy_arrays[:, 1:])
+        return {
+            Ei: np.transpose([energy_center_arrays[ii], weights[ii]])
+            for ii, Ei in enumerate(Ei_samp)
+        }
 
-    def _d_rate_d_E_positron_brem(self, Ei):
-        dEdxT_GeVperm = self.get_material_properties()[3] * (0.1)
-        mfp_positron_EI = self.get_mfp([-11, Ei])
-        energy_loss_ten_mfp = 10 * mfp_positron_EI * dEdxT_GeVperm
-        energy_array = np.linspace(
-            np.max([Ei - energy_loss_ten_mfp, self.get_DarkBremXSec()[0][0]]), Ei, 11
-        )
-        energy_center_array = np.array(
-            [
-                (energy_array[i] + energy_array[i + 1]) / 2.0
-                for i in range(len(energy_array) - 1)
-            ]
-        )
+    def _d_rate_d_E_elec_brem_array(self):
+        return self._d_rate_d_E_brem_array(self._dark_brem_integrand_elec, 11)
 
-        brem_positron_weights = np.array(
-            [
-                quad(
-                    self._dark_brem_integrand_positron,
-                    energy_array[i],
-                    energy_array[i + 1],
-                    args=(Ei),
-                    full_output=1,
-                )[0]
-                for i in range(len(energy_array) - 1)
-            ]
-        )
-        return np.transpose([energy_center_array, brem_positron_weights])
+    def _d_rate_d_E_positron_brem_array(self):
+        return self._d_rate_d_E_brem_array(self._dark_brem_integrand_positron, -11)
 
-    def _d_rate_d_E_positron_ann(self, Ei):
-        if Ei < self._resonant_annihilation_energy:
-            return [[[0.0, 0.0]], [0.0, 1.0]]
+    def _d_rate_d_E_positron_ann_array(self):
+        Ei_samp = np.transpose(self.get_DarkAnnXSec())[0]
         minimum_saved_energy = self.get_DarkAnnXSec()[0][0]
-
-        dEdxT_GeVperm = self.get_material_properties()[3] * (0.1)
-        mfp_positron_EI = self.get_mfp([-11, Ei])
-        energy_loss_ten_mfp = 10 * mfp_positron_EI * dEdxT_GeVperm
-        energy_array = np.linspace(
-            np.max([Ei - energy_loss_ten_mfp, minimum_saved_energy]), Ei, 11
-        )
-        energy_center_array = np.array(
-            [
-                (energy_array[i] + energy_array[i + 1]) / 2.0
-                for i in range(len(energy_array) - 1)
-            ]
+        energy_arrays, darkann_weights = self._d_rate_d_E_bins(
+            self._dark_ann_integrand,
+            -11,
+            Ei_samp,
+            minimum_saved_energy,
+            offset=self._resonant_annihilation_energy,
         )
+        energy_center_arrays = 0.5 * (energy_arrays[:, :-1] + energy_arrays[:, 1:])
 
-        darkann_weights = np.array(
-            [
-                quad(
-                    self._dark_ann_integrand,
-                    energy_array[i],
-                    energy_array[i + 1],
-                    args=(Ei),
-                    full_output=1,
-                )[0]
-                for i in range(len(energy_array) - 1)
-            ]
-        )
-
-        resonant_bin_center = 0.5 * (
-            self._resonant_annihilation_energy + np.min([minimum_saved_energy, Ei])
-        )
-        sMAX = 2 * (m_electron * np.min([minimum_saved_energy, Ei]) + m_electron**2)
+        # Resonant bin, from the resonant energy up to the lowest saved energy
+        saved_energy = np.minimum(minimum_saved_energy, Ei_samp)
+        resonant_bin_centers = 0.5 * (self._resonant_annihilation_energy + saved_energy)
+        sMAX = 2 * (m_electron * saved_energy + m_electron**2)
         beta = (2.0 * alpha_em / np.pi) * (np.log(sMAX / m_electron**2) - 1.0)
         dEdxT_GeVpercm = (
             self.get_material_properties()[3] * (0.1) * cmtom
         )  # Converting MeV/cm to GeV/m to GeV/cm
-        weight_analytic = (
+        weights_analytic = (
             (1 / dEdxT_GeVpercm)
             * (2 * np.pi**2 * alpha_em / m_electron)
             * (self.get_n_targets()[1])
             * GeVsqcm2
             * (sMAX - self._mV**2) ** beta
-            * self._positron_exponential_factor(self._resonant_annihilation_energy, Ei)
-        )
-        darkann_weights = np.concatenate([[weight_analytic], darkann_weights])
-        energy_center_array = np.concatenate(
-            [[resonant_bin_center], energy_center_array]
-        )
-        energy_array = np.concatenate(
-            [
-                [
-                    self._resonant_annihilation_energy,
-                    np.min([minimum_saved_energy, Ei]),
-                ],
-                energy_array,
-            ]
+            * self._positron_exponential_factor(
+                self._resonant_annihilation_energy, Ei_samp
+            )
         )
 
-        return [np.transpose([energy_center_array, darkann_weights]), energy_array]
-
-    def _d_rate_d_E_elec_brem_array(self):
-        Ei_samp = np.transpose(self.get_DarkBremXSec())[0]
-        return {Ei: self._d_rate_d_E_elec_brem(Ei) for Ei in Ei_samp}
-
-    def _d_rate_d_E_positron_brem_array(self):
-        Ei_samp = np.transpose(self.get_DarkBremXSec())[0]
-        return {Ei: self._d_rate_d_E_positron_brem(Ei) for Ei in Ei_samp}
+        d_rate_dict = {}
+        for ii, Ei in enumerate(Ei_samp):
+            if Ei < self._resonant_annihilation_energy:
+                d_rate_dict[Ei] = [[0.0, 0.0]]
+                continue
+            d_rate_dict[Ei] = np.transpose(
+                [
+                    np.concatenate([[resonant_bin_centers[ii]], energy_center_arrays[ii]]),
+                    np.concatenate([[weights_analytic[ii]], darkann_weights[ii]]),
+                ]
+            )
+        return d_rate_dict
+
+    def _compute_drate_tables(self):
+        print("dRate not previously calculated, calculating now...")
+        return {
+            "brem_elec_drate": self._d_rate_d_E_elec_brem_array(),
+            "brem_positron_drate": self._d_rate_d_E_positron_brem_array(),
+            "annihilation_drate": self._d_rate_d_E_positron_ann_array(),
+        }
 
-    def _d_rate_d_E_positron_ann_array(self):
-        Ei_samp = np.transpose(self.get_DarkAnnXSec())[0]
-        return {Ei: self._d_rate_d_E_positron_ann(Ei)[0] for Ei in Ei_samp}
+    def _interpolated_drate_tables(self):
+        mV_lower, mV_upper, _ = _bracketing_masses(
+            self._mV_interpolation_masses, self._mV
+        )
+        table_lower = self._library_mass_dark_table("dark_drate", mV_lower)
+        table_upper = self._library_mass_dark_table("dark_drate", mV_upper)
+        return {
+            drate: interpolate_dark_drate(
+                table_lower[drate],
+                table_upper[drate],
+                process,
+                mV_lower,
+                mV_upper,
+                self._mV,
+            )
+            for drate, process in [
+                ("brem_elec_drate", "DarkBrem"),
+                ("brem_positron_drate", "DarkBrem"),
+                ("annihilation_drate", "DarkAnn"),
+            ]
+        }
 
     def set_drate_dE(self):
-        dict_dir = self.get_dark_dict_dir()
-        drate_file_name = dict_dir + "dark_drate.pkl"
-
-        files_set = False
-        outer_dict = {}
-        if os.path.exists(drate_file_name):
-            sample_file = open(drate_file_name, "rb")
-            outer_dict = pickle.load(sample_file)
-            sample_file.close()
-            if self._mV_estimator in outer_dict.keys():
-                if self._target_material in outer_dict[self._mV_estimator].keys():
-                    d_rate_dict_elec_brem = outer_dict[self._mV_estimator][
-                        self._target_material
-                    ]["brem_elec_drate"]
-                    d_rate_dict_positron_brem = outer_dict[self._mV_estimator][
-                        self._target_material
-                    ]["brem_positron_drate"]
-                    d_rate_dict_positron_ann = outer_dict[self._mV_estimator][
-                        self._target_material
-                    ]["annihilation_drate"]
-                    files_set = True
-
-        if not files_set:
-            print("dRate not previously calculated, calculating now...")
-            d_rate_dict_elec_brem = self._d_rate_d_E_elec_brem_array()
-            d_rate_dict_positron_brem = self._d_rate_d_E_positron_brem_array()
-            d_rate_dict_positron_ann = self._d_rate_d_E_positron_ann_array()
-            if self._mV_estimator not in outer_dict.keys():
-                outer_dict[self._mV_estimator] = {}
-            outer_dict[self._mV_estimator][self._target_material] = {
-                "brem_elec_drate": d_rate_dict_elec_brem,
-                "brem_positron_drate": d_rate_dict_positron_brem,
-                "annihilation_drate": d_rate_dict_positron_ann,
-            }
-            sample_file = open(drate_file_name, "wb")
-            pickle.dump(outer_dict, sample_file)
-            sample_file.close()
+        """Loads the d-rate tables of the vector mass and target from the cache in the
+        dark dict directory (see library.cached_dark_table), computing them if missing.
+        Tables of masses between the library masses are interpolated (see set_mV)"""
+        if self._mV_interpolation_masses is not None:
+            drate_tables = self._interpolated_drate_tables()
+        else:
+            drate_tables = cached_dark_table(
+                self.get_dark_dict_dir(),
+                "dark_drate",
+                self._mV_estimator,
+                self.target.name,
+                self._compute_drate_tables,
+            )
+        d_rate_dict_elec_brem = drate_tables["brem_elec_drate"]
+        d_rate_dict_positron_brem = drate_tables["brem_positron_drate"]
+        d_rate_dict_positron_ann = drate_tables["annihilation_drate"]
 
         self._d_rate_dict_elec_brem = d_rate_dict_elec_brem
         self._d_rate_dict_positron_brem = d_rate_dict_positron_brem
@@ -749,11 +935,20 @@ class DarkShower(Shower):
 
     def draw_dark_sample(self, Einc, LU_Key=-1, process="DarkBrem", VB=False):
         dark_sample_list = self._loaded_dark_samples
+        # Energy at which the VEGAS samples are looked up: for a vector mass that is not in
+        # the library, the energy with the same (E - threshold)/mV for the library mass
+        E_estimator = Einc
+        if self._mV != self._mV_estimator:
+            E_estimator = dark_threshold_energy(
+                process, self._mV_estimator
+            ) + self._mV_estimator / self._mV * (
+                Einc - dark_threshold_energy(process, self._mV)
+            )
         if LU_Key < 0 or LU_Key > len(dark_sample_list[process]):
             energies = dark_sample_list[process][0:]
             energies = np.array([x[0] for x in energies])
 
-            LU_Key = np.argmin(np.abs(energies - Einc)) + 1
+            LU_Key = np.argmin(np.abs(energies - E_estimator)) + 1
             if LU_Key < 0:
                 LU_Key = 0
                 print(
@@ -774,24 +969,12 @@ class DarkShower(Shower):
         # this grabs the dictionary part rather than the energy.
         dark_sample_dict = dark_sample_list[process][LU_Key][1]
 
-        integrand = dark_sample_dict["adaptive_map"]
-        max_F = (
-            dark_sample_dict["max_F"][self._target_material] * self._maxF_fudge_global
-        )
-        neval_vegas = dark_sample_dict["neval"]
-        integrand = vg.Integrator(
-            map=integrand,
-            max_nhcube=1,
-            nstrat=np.ones(dimensionalities_dark[process]),
-            neval=neval_vegas,
-        )
-
         event_info = {
             "E_inc": Einc,
             "m_e": m_electron,
-            "Z_T": self._ZTarget,
-            "A_T": self._ATarget,
-            "mT": self._ATarget,
+            "Z_T": self.target.Z,
+            "A_T": self.target.A,
+            "mT": self.target.A,
             "alpha_FS": alpha_em,
             "mV": self._mV,
             "Eg_min": self._Egamma_min,
@@ -801,6 +984,44 @@ class DarkShower(Shower):
             diff_xsec_func = diff_xsection_options[process]
         else:
             raise Exception("Your process is not in the list")
+        batch_f = diff_xsec_func(event_info, dimensionalities_dark[process])
+        rescale = None
+        if self._mV != self._mV_estimator:
+            # The integrand is normalized to that of the library mass at E_estimator, which
+            # the envelopes max_F were found for. A constant factor does not change the
+            # distribution of the accepted points
+            normalization = self._estimator_normalization(process, Einc, E_estimator)
+            if process == "DarkBrem":
+                rescale, jacobian = self._dark_brem_rescaling(Einc, E_estimator)
+                normalization *= jacobian
+            vector_batch_f = batch_f
+
+            def batch_f(x):
+                if rescale is not None:
+                    x = rescale(x)
+                return normalization * np.ravel(vector_batch_f(x))
+
+        if "max_F_strata" in dark_sample_dict:
+            [x], [sampcount] = self._draw_from_strata(
+                process, LU_Key, dark_sample_dict, [batch_f]
+            )
+            if x is None:
+                raise Exception("No Sample Found", process, Einc, LU_Key)
+            if rescale is not None:
+                x = rescale(x)
+            if VB:
+                return np.concatenate([list(x), [sampcount]])
+            return x
+
+        max_F = (
+            self.get_max_F(process, LU_Key, dark_sample_dict) * self._maxF_fudge_global
+        )
+        integrand = vg.Integrator(
+            map=dark_sample_dict["adaptive_map"],
+            max_nhcube=1,
+            nstrat=np.ones(dimensionalities_dark[process]),
+            neval=dark_sample_dict["neval"],
+        )
 
         if VB:
             sampcount = 0
@@ -811,16 +1032,68 @@ class DarkShower(Shower):
             for x, wgt in integrand.random():
                 if VB:
                     sampcount += 1
-                if max_F * draw_U() < wgt * diff_xsec_func(event_info, x):
+                wgt_f = wgt * np.ravel(batch_f(np.array([x])))[0]
+                if wgt_f > max_F:
+                    self._check_max_F(process, LU_Key, dark_sample_dict, wgt_f, max_F)
+                    max_F = (
+                        self.get_max_F(process, LU_Key, dark_sample_dict)
+                        * self._maxF_fudge_global
+                    )
+                if max_F * draw_U() < wgt_f:
                     sample_found = True
                     break
         if sample_found is False:
             raise Exception("No Sample Found", process, Einc, LU_Key)
+        if rescale is not None:
+            x = rescale(x)
         if VB:
             return np.concatenate([list(x), [sampcount]])
         else:
             return x
 
+    def _estimator_normalization(self, process, Einc, E_estimator):
+        """Ratio of the cross section of process for the mass of the VEGAS samples at
+        E_estimator to that for the vector mass at Einc (see draw_dark_sample)"""
+        cross_sections = []
+        for table, energy in [
+            (self._estimator_dark_cross_sections[process], E_estimator),
+            (self._dark_cross_section_table(process), Einc),
+        ]:
+            energies, values = np.transpose(table)
+            cross_sections.append(
+                np.interp(energy, energies, values, left=values[0], right=values[-1])
+            )
+        if cross_sections[0] <= 0.0 or cross_sections[1] <= 0.0:
+            return 1.0
+        return cross_sections[0] / cross_sections[1]
+
+    def _dark_cross_section_table(self, process):
+        return {
+            "DarkBrem": self._dark_brem_cross_section,
+            "DarkAnn": self._dark_annihilation_cross_section,
+            "DarkComp": self._dark_compton_cross_section,
+        }[process]
+
+    def _dark_brem_rescaling(self, Einc, E_estimator):
+        """Linear map of the energy fraction x of DarkBrem from its range for the mass of the
+        VEGAS samples at E_estimator, [mV_estimator/E_estimator, 1 - m_e/E_estimator], to its
+        range for the vector mass at Einc, [mV/Einc, 1 - m_e/Einc], so that the samples of a
+        library mass can be reused for another mass (see set_mV)
+        Returns:
+            the map, acting on (arrays of) sampled points, and its Jacobian
+        """
+        x_min, x_max = self._mV / Einc, 1.0 - m_electron / Einc
+        x_min_estimator = self._mV_estimator / E_estimator
+        x_max_estimator = 1.0 - m_electron / E_estimator
+        jacobian = (x_max - x_min) / (x_max_estimator - x_min_estimator)
+
+        def rescale(x):
+            x = np.array(x, dtype=float)
+            x[..., 0] = x_min + (x[..., 0] - x_min_estimator) * jacobian
+            return x
+
+        return rescale, jacobian
+
     def produce_bsm_particle(self, p_original, process, weight=None, VB=False):
         p0 = deepcopy(p_original)
         if weight is None:
@@ -859,9 +1132,9 @@ class DarkShower(Shower):
             dist = (p0.get_p0()[0] - E_interact) / dEdxT
             p_scat = self._get_MCS_p(
                 p0.get_p0(),
-                self._rhoTarget * (dist / cmtom),
-                self._ATarget,
-                self._ZTarget,
+                self.target.rho * (dist / cmtom),
+                self.target.A,
+                self.target.Z,
                 self._MCS_rescale_factor,
             )
             p0.set_pf(p_scat)
@@ -950,3 +1223,171 @@ class DarkShower(Shower):
                         if npart is not None:
                             NewShower.append(npart)
         return ShowerToSamp, NewShower
+
+    def coupling_scan(self, dark_particles, couplings, **kwargs):
+        """Rescales dark particles generated by this DarkShower to an array of couplings,
+        see coupling_scan() below for the available keyword arguments.
+        The reference coupling is the kinetic mixing equivalent to the electron coupling g_e
+        the production weights were computed with.
+        """
+        return coupling_scan(
+            dark_particles,
+            couplings,
+            reference_coupling=self.g_e / np.sqrt(4 * np.pi * alpha_em),
+            **kwargs,
+        )
+
+
+def dark_particle_arrays(dark_particles):
+    """Collects four-momenta, production points, masses and weights of a list of
+    (dark) Particle objects into arrays of shape (N,4), (N,3), (N,) and (N,)"""
+    p4 = np.array([p0.get_p0() for p0 in dark_particles], dtype=float).reshape(-1, 4)
+    r0 = np.array([p0.get_rf() for p0 in dark_particles], dtype=float).reshape(-1, 3)
+    masses = np.array([p0.get_ids()["mass"] for p0 in dark_particles], dtype=float)
+    weights = np.array([p0.get_ids()["weight"] for p0 in dark_particles], dtype=float)
+    return p4, r0, masses, weights
+
+
+def decay_in_volume_probability(p4, r0, masses, ctau, z_min, z_max):
+    """Probability for each particle to decay between the planes z = z_min and z = z_max
+    Input:
+        -- p4: (N,4) array of lab-frame four-momenta in GeV
+        -- r0: (N,3) array of production points in m
+        -- masses: (N,) array of particle masses in GeV
+        -- ctau: proper decay length(s) in m, scalar or array of shape (M,)
+        -- z_min, z_max: longitudinal boundaries of the decay volume in m
+    Returns:
+        (M,N) array of decay probabilities ((N,) if ctau is a scalar)
+    """
+    p_abs = np.linalg.norm(p4[:, 1:], axis=1)
+    cos_theta_z = np.divide(p4[:, 3], p_abs, out=np.zeros_like(p_abs), where=p_abs > 0)
+    forward = cos_theta_z > 0.0
+    safe_cos = np.where(forward, cos_theta_z, 1.0)
+
+    # distance travelled along the momentum direction before entering/exiting the volume
+    distance_in = np.clip((z_min - r0[:, 2]) / safe_cos, 0.0, None)
+    distance_out = np.clip((z_max - r0[:, 2]) / safe_cos, 0.0, None)
+
+    # lab-frame decay length, gamma*beta*c*tau = |p|/m * c*tau
+    decay_length = np.multiply.outer(np.asarray(ctau, dtype=float), p_abs / masses)
+    probability = np.exp(-distance_in / decay_length) - np.exp(
+        -distance_out / decay_length
+    )
+    return np.where(forward, probability, 0.0)
+
+
+def coupling_scan(
+    dark_particles,
+    couplings,
+    reference_coupling=1.0,
+    ctau_reference=None,
+    decay_volume=None,
+    detector_position=None,
+    detector_radius=np.inf,
+    detector_inner_radius=0.0,
+    energy_cut=None,
+):
+    """Rescales the yield of dark particles generated at a reference coupling to an array of couplings.
+    All production weights of GetBSMWeights scale as coupling**2 and the kinematics of the dark particle
+    do not depend on the coupling, so a single dark shower per mass can be reused for any coupling.
+    Input:
+        -- dark_particles: list of dark Particle objects (e.g. the output of generate_dark_shower)
+        -- couplings: array of couplings at which the yield is computed
+        -- reference_coupling: coupling at which dark_particles were generated
+        -- ctau_reference: proper decay length (in m) at reference_coupling. If None, the dark
+            particles are treated as stable and no decay-in-volume probability is applied.
+            Otherwise the decay length is rescaled as ctau_reference * (reference_coupling/coupling)**2
+        -- decay_volume: (z_min, z_max) in m of the region in which the particle has to decay,
+            needed if ctau_reference is given
+        -- detector_position: (x,y,z) in m of the detector center. If given, particles are required to
+            cross the plane z = detector_position[2] within the annulus [detector_inner_radius, detector_radius]
+        -- energy_cut: tuple of minimum and maximum energies of particles to consider
+    Returns:
+        [yields, acceptances]: arrays with the shape of couplings. yields is the sum of the rescaled weights
+        of particles passing the requirements, acceptances is the fraction of the rescaled weight passing them
+    """
+    couplings = np.asarray(couplings, dtype=float)
+    coupling_shape = couplings.shape
+    couplings = couplings.ravel()
+
+    if len(dark_particles) == 0:
+        return [np.zeros(coupling_shape), np.zeros(coupling_shape)]
+
+    p4, r0, masses, weights = dark_particle_arrays(dark_particles)
+    coupling_factor = (couplings / reference_coupling) ** 2
+
+    selection = np.ones(len(weights), dtype=bool)
+    if energy_cut is not None:
+        selection &= (p4[:, 0] > energy_cut[0]) & (p4[:, 0] < energy_cut[1])
+    if detector_position is not None:
+        x_det, y_det, z_det = detector_position
+        safe_pz = np.where(p4[:, 3] > 0.0, p4[:, 3], 1.0)
+        time_proxy = (z_det - r0[:, 2]) / safe_pz
+        rT = np.hypot(
+            r0[:, 0] + time_proxy * p4[:, 1] - x_det,
+            r0[:, 1] + time_proxy * p4[:, 2] - y_det,
+        )
+        selection &= (
+            (p4[:, 3] > 0.0) & (rT > detector_inner_radius) & (rT < detector_radius)
+        )
+
+    accepted_weights = np.where(selection, weights, 0.0)
+    if ctau_reference is None:
+        passing = np.sum(accepted_weights) * np.ones(len(couplings))
+    else:
+        if decay_volume is None:
+            raise ValueError("decay_volume must be provided together with ctau_reference")
+        ctau = ctau_reference * (reference_coupling / couplings) ** 2
+        decay_probability = decay_in_volume_probability(
+            p4, r0, masses, ctau, decay_volume[0], decay_volume[1]
+        )
+        passing = decay_probability @ accepted_weights
+
+    acceptances = passing / np.sum(weights)
+    yields = coupling_factor * passing
+    return [yields.reshape(coupling_shape), acceptances.reshape(coupling_shape)]
+
+
+def _build_dark_tables_for_mass(args):
+    """Builds a DarkShower for one vector mass, which computes and caches its tables"""
+    dict_dir, target_material, min_energy, mV, shower_kwargs = args
+    DarkShower(dict_dir, target_material, min_energy, mV, **shower_kwargs)
+    return mV
+
+
+def build_dark_tables(
+    dict_dir, target_material, min_energy, mV_list=None, n_processes=1, **shower_kwargs
+):
+    """Computes the dark weight and d-rate tables (see DarkShower.set_weight_arrays and
+    DarkShower.set_drate_dE) of target_material for the vector masses in mV_list that are
+    not cached yet (see library.cached_dark_table).
+    Input:
+        -- mV_list: vector masses in GeV, among the masses of dark_maps.pkl. Defaults to all of them
+        -- n_processes: number of worker processes across which the masses are spread
+        -- shower_kwargs: further keyword arguments of DarkShower (e.g. dark_dict_dir)
+    Returns:
+        list of the vector masses for which tables were computed
+    """
+    if mV_list is None:
+        mV_list = list(load_library(dict_dir + "dark_maps.pkl").keys())
+    table_dir = shower_kwargs.get("dark_dict_dir") or dict_dir
+
+    missing_masses = [
+        mV
+        for mV in mV_list
+        if any(
+            load_dark_table(table_dir, table_name, mV, target_material) is None
+            for table_name in ["dark_weights", "dark_drate"]
+        )
+    ]
+    jobs = [
+        (dict_dir, target_material, min_energy, mV, shower_kwargs)
+        for mV in missing_masses
+    ]
+    if n_processes > 1 and len(jobs) > 1:
+        with Pool(min(n_processes, len(jobs))) as pool:
+            pool.map(_build_dark_tables_for_mass, jobs)
+    else:
+        for job in jobs:
+            _build_dark_tables_for_mass(job)
+    return missing_masses
@@ -224,3 +224,201 @@ def annihilation_fourvecs(p0, sampled_event, mV=0.0):
 
     return [pg4v, pV4v]
 
+
+
+# ------------------------------------------------------------------------------
+# Batch versions of the kinematics functions above. They take an array of N
+# incoming energies and an (N, d) array of sampled events and return an (N, 2, 4)
+# array of four-vectors in the frame where the incoming particle moves along z
+# (same ordering and conventions as the single-event functions). Use
+# rotate_to_lab_frame to bring them to the lab frame in bulk.
+# ------------------------------------------------------------------------------
+def _stack_fourvecs(*fourvecs):
+    """Stacks pairs of four-vectors, each given as a list of four (N,) arrays, into an (N, 2, 4) array"""
+    return np.stack([np.stack(np.broadcast_arrays(*fv), axis=-1) for fv in fourvecs], axis=1)
+
+def rotation_matrices(p3):
+    """Rotation matrices between the z-axis and each three-momentum in p3 (N, 3),
+    same as Particle.rotation_matrix. Returns an (N, 3, 3) array"""
+    p3 = np.atleast_2d(p3)
+    ThZ = np.arccos(p3[:, 2]/np.linalg.norm(p3, axis=1))
+    PhiZ = np.arctan2(p3[:, 1], p3[:, 0])
+    cT, sT, cP, sP = np.cos(ThZ), np.sin(ThZ), np.cos(PhiZ), np.sin(PhiZ)
+    RM = np.zeros((len(p3), 3, 3))
+    RM[:, 0] = np.stack([cT*cP, -sP, sT*cP], axis=-1)
+    RM[:, 1] = np.stack([cT*sP, cP, sT*sP], axis=-1)
+    RM[:, 2, 0], RM[:, 2, 2] = -sT, cT
+    return RM
+
+def rotate_to_lab_frame(p_inc, fourvecs):
+    """Rotates four-vectors from the frame where the incoming particle moves along z to the lab frame
+    Args:
+        p_inc: (N, 4) lab-frame four-momenta of the incoming particles
+        fourvecs: (N, M, 4) four-vectors (e.g. the output of the batch kinematics functions)
+    Returns:
+        (N, M, 4) lab-frame four-vectors
+    """
+    fourvecs = np.asarray(fourvecs, dtype=float)
+    RM = rotation_matrices(np.asarray(p_inc, dtype=float)[:, 1:])
+    lab_fourvecs = np.empty_like(fourvecs)
+    lab_fourvecs[..., 0] = fourvecs[..., 0]
+    lab_fourvecs[..., 1:] = np.einsum("nij,nmj->nmi", RM, fourvecs[..., 1:])
+    return lab_fourvecs
+
+def boost_batch(p, v):
+    """Boost each v (N, 4) into the restframe of the corresponding p (N, 4), see radiative_return.boost"""
+    def lor_prod(a, b):
+        return a[:, 0]*b[:, 0] - np.sum(a[:, 1:]*b[:, 1:], axis=1)
+    rsq = np.sqrt(lor_prod(p, p))
+    v0 = lor_prod(p, v)/rsq
+    c1 = (v[:, 0] + v0)/(rsq + p[:, 0])
+    return np.concatenate([v0[:, np.newaxis], v[:, 1:] - c1[:, np.newaxis]*p[:, 1:]], axis=1)
+
+def e_to_egamma_fourvecs_batch(ep, sampled_events):
+    """Batch version of e_to_egamma_fourvecs, returns (N, 2, 4) [electron, photon] four-vectors"""
+    ep = np.asarray(ep, dtype=float)
+    x1, x2, x3, x4 = np.asarray(sampled_events, dtype=float)[:, :4].T
+    w = Egamma_min + x1*(ep - m_electron - Egamma_min)
+    ct = np.cos((x2+x3)/2)
+    ctp = np.cos((x2-x3)*ep/(2*(ep-w)))
+    ph = (x4-1/2)*2.0*np.pi
+
+    epp = ep - w
+    pp = np.sqrt(epp**2 - m_electron**2)
+
+    al = np.random.uniform(0, 2.0*np.pi, size=len(x1))
+    cal, sal = np.cos(al), np.sin(al)
+    st, stp = np.sqrt(1.0 - ct**2), np.sqrt(1.0 - ctp**2)
+    sp, cp = np.sin(ph), np.cos(ph)
+    g4v = [w, w*cal*st, w*sal*st, w*ct]
+    Ep4v = [epp, pp*(sal*sp*stp + cal*(ctp*st - cp*ct*stp)), pp*(ctp*sal*st - (cp*ct*sal + cal*sp)*stp), pp*(ct*ctp + cp*st*stp)]
+
+    return _stack_fourvecs(Ep4v, g4v)
+
+def e_to_eV_fourvecs_batch(ep, sampled_events, mV=0.0):
+    """Batch version of e_to_eV_fourvecs, returns (N, 2, 4) [electron, dark vector] four-vectors"""
+    ep = np.asarray(ep, dtype=float)
+    sampled_events = np.asarray(sampled_events, dtype=float)
+    w = sampled_events[:, 0]*ep
+    ct = (1 - 10**sampled_events[:, 1])
+    p, k = np.sqrt(ep**2 - m_electron**2), np.sqrt(w**2 - mV**2)
+
+    Em4v = [ep, 0, 0, p]
+    al = np.random.uniform(0, 2.0*np.pi, size=len(w))
+    cal, sal = np.cos(al), np.sin(al)
+    st = np.sqrt(1.0 - ct**2)
+    V4v = [w, k*cal*st, k*sal*st, k*ct]
+
+    return _stack_fourvecs(Em4v, V4v)
+
+def gamma_to_epem_fourvecs_batch(w, sampled_events):
+    """Batch version of gamma_to_epem_fourvecs, returns (N, 2, 4) [positron, electron] four-vectors"""
+    w = np.asarray(w, dtype=float)
+    x1, x2, x3, x4 = np.asarray(sampled_events, dtype=float)[:, :4].T
+    epp = m_electron + x1*(w-2*m_electron)
+    ctp = np.cos(w*(x2+x3)/(2*epp))
+    ctm = np.cos(w*(x2-x3)/(2*(w-epp)))
+    ph = x4*2*np.pi
+
+    epm = w - epp
+    pm, pp = np.sqrt(epm**2 - m_electron**2), np.sqrt(epp**2 - m_electron**2)
+
+    al = np.random.uniform(0, 2.0*np.pi, size=len(x1))
+    cal, sal = np.cos(al), np.sin(al)
+    stp, stm = np.sqrt(1.0 - ctp**2), np.sqrt(1.0 - ctm**2)
+    spal, cpal = np.sin(ph+al), np.cos(ph+al)
+
+    pp4v = [epp, pp*stp*cal, pp*stp*sal, pp*ctp]
+    pm4v = [epm, pm*stm*cpal, pm*stm*spal, pm*ctm]
+
+    return _stack_fourvecs(pp4v, pm4v)
+
+def compton_fourvecs_batch(Eg, sampled_events, mV=0.0):
+    """Batch version of compton_fourvecs, returns (N, 2, 4) [electron, vector] four-vectors"""
+    Eg = np.asarray(Eg, dtype=float)
+    ct = np.asarray(sampled_events, dtype=float)[:, 0]
+
+    s = m_electron**2 + 2*Eg*m_electron
+    Ee0 = (s + m_electron**2)/(2.0*np.sqrt(s))
+    Ee = (s - mV**2 + m_electron**2)/(2*np.sqrt(s))
+    EV = (s + mV**2 - m_electron**2)/(2*np.sqrt(s))
+    pF = np.sqrt(Ee**2 - m_electron**2)
+
+    g0 = Ee0/m_electron
+    b0 = 1.0/g0*np.sqrt(g0**2 - 1.0)
+
+    ph = np.random.uniform(0, 2.0*np.pi, size=len(ct))
+    st = np.sqrt(1-ct**2)
+    pe4v = [g0*Ee + b0*g0*pF*ct, -pF*st*np.sin(ph), -pF*st*np.cos(ph), b0*g0*Ee+g0*pF*ct]
+    pV4v = [g0*EV - b0*g0*pF*ct, pF*st*np.sin(ph), pF*st*np.cos(ph), b0*g0*EV - g0*pF*ct]
+
+    return _stack_fourvecs(pe4v, pV4v)
+
+def ee_to_ee_fourvecs_batch(Einc, sampled_events):
+    """Batch version of ee_to_ee_fourvecs, returns (N, 2, 4) [outgoing particle, new electron] four-vectors"""
+    Einc = np.asarray(Einc, dtype=float)
+    ct = np.asarray(sampled_events, dtype=float)[:, 0]
+
+    s = 2*m_electron**2 + 2*Einc*m_electron
+    Ee0 = np.sqrt(s)/2.0
+    pF = np.sqrt(Ee0**2 - m_electron**2)
+
+    g0 = Ee0/m_electron
+    b0 = 1.0/g0*np.sqrt(g0**2 - 1.0)
+
+    ph = np.random.uniform(0, 2.0*np.pi, size=len(ct))
+    st = np.sqrt(1-ct**2)
+    outgoing_particle_fourvector = [g0*Ee0 + b0*g0*pF*ct, -pF*st*np.sin(ph), -pF*st*np.cos(ph), b0*g0*Ee0+g0*pF*ct]
+    new_electron_fourvector = [g0*Ee0 - b0*g0*pF*ct, pF*st*np.sin(ph), pF*st*np.cos(ph), b0*g0*Ee0 - g0*pF*ct]
+
+    return _stack_fourvecs(outgoing_particle_fourvector, new_electron_fourvector)
+
+def radiative_return_fourvecs_batch(Ee, sampled_events, mV=0.0):
+    """Batch version of radiative_return_fourvecs, returns (N, 2, 4) with the dark vector four-vector twice"""
+    Ee = np.asarray(Ee, dtype=float)
+    s = 2.*m_electron*(m_electron + Ee)
+
+    beta = (2.*alpha_em/np.pi) * (np.log(s/m_electron**2) - 1.)
+    umax = np.power(1.-mV**2/s, beta/2.)
+
+    x1 = 1. - np.power(np.asarray(sampled_events, dtype=float)[:, 0]*umax, 2./beta)
+    x2 = mV**2/(x1*s)
+
+    if np.any(x2 >= 1.):
+        print("wrong kinematics...")
+        print("x1, x2 = ", x1[x2 >= 1.], "\t", x2[x2 >= 1.])
+
+    E1 = x1*np.sqrt(s)/2.
+    E2 = x2*np.sqrt(s)/2.
+
+    zeros = np.zeros_like(E1)
+    pV = np.stack([E1 + E2, zeros, zeros, E1 - E2], axis=-1)
+    p_rest = np.stack(np.broadcast_arrays(np.sqrt(s)/2., zeros, zeros, -np.sqrt(s/4. - m_electron**2)), axis=-1)
+    pV_lab = boost_batch(p_rest, pV)
+    return np.stack([pV_lab, pV_lab], axis=1)
+
+def annihilation_fourvecs_batch(Ee, sampled_events, mV=0.0):
+    """Batch version of annihilation_fourvecs, returns (N, 2, 4) [photon, vector] four-vectors"""
+    Ee = np.asarray(Ee, dtype=float)
+    ct = np.asarray(sampled_events, dtype=float)[:, 0]
+
+    s = 2*m_electron*(Ee+m_electron)
+    EeCM = np.sqrt(s)/2.0
+    Eg = (s - mV**2)/(2*np.sqrt(s))
+    EV = (s + mV**2)/(2*np.sqrt(s))
+    pF = Eg
+
+    g0 = EeCM/m_electron
+    b0 = 1.0/g0*np.sqrt(g0**2-1.0)
+
+    ph = np.random.uniform(0.0, 2.0*np.pi, size=len(ct))
+
+    if np.any((ct < -1.0) | (ct > 1.0)):
+        print("Error in Annihiliation Calculation")
+        print(ct[(ct < -1.0) | (ct > 1.0)])
+
+    st = np.sqrt(1-ct**2)
+    pg4v = [g0*Eg - b0*g0*pF*ct, -pF*st*np.sin(ph), -pF*st*np.cos(ph), b0*g0*Eg - g0*pF*ct]
+    pV4v = [g0*EV + b0*g0*pF*ct, pF*st*np.sin(ph), pF*st*np.cos(ph), b0*g0*EV + g0*pF*ct]
+
+    return _stack_fourvecs(pg4v, pV4v)
@@ -0,0 +1,591 @@
+"""Process-wide registry of the pre-computed libraries (sm_maps.pkl, dark_maps.pkl, etc.).
+Each library file is unpickled once per process and the same (read-only) object is handed
+to every Shower/DarkShower that asks for it. Entries are keyed by absolute file path and
+are reloaded if the modification time of the file changes.
+
+The same information can also be stored in a versioned, array-only binary library: one
+directory of .npy files (opened with mmap_mode='r') plus a manifest.json. It does not
+depend on the scipy/vegas versions used to produce the pickles and loads much faster.
+Use convert_library() (or utilities/convert_library.py) to produce it from the
+existing pickles, and Shower(..., library_format="binary") to start from it.
+Binary libraries are loaded lazily: only the requested target is read, and the adaptive
+map of an energy bin is rebuilt the first time a sample is drawn from that bin.
+"""
+
+import os
+import json
+import pickle
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, shards are then written without locks
+    fcntl = None
+
+import numpy as np
+import vegas as vg
+from scipy.interpolate import interp1d
+
+LIBRARY_FORMAT_VERSION = 1
+BINARY_LIBRARY_DIR = "binary_library/"
+LIBRARY_PICKLES = [
+    "sm_maps.pkl",
+    "sm_xsec.pkl",
+    "sm_xsec_interp.pkl",
+    "sm_invmfp_interp.pkl",
+    "dark_maps.pkl",
+    "dark_xsec.pkl",
+]
+
+_library_registry = {}
+
+
+def _make_read_only(obj):
+    """Recursively flags numpy arrays inside obj as non-writeable so that
+    shared library entries cannot be modified in place by one of their users"""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            for item in obj.flat:
+                _make_read_only(item)
+        obj.flags.writeable = False
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _make_read_only(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _make_read_only(value)
+    return obj
+
+
+def _registry_lookup(file_name, loader, tag=None):
+    """Returns loader(path) for the absolute path of file_name, calling loader only if
+    the (path, tag) entry is missing or the file has been modified since it was loaded"""
+    path = os.path.abspath(file_name)
+    mtime = os.path.getmtime(path)
+    key = (path, tag)
+
+    entry = _library_registry.get(key)
+    if entry is None or entry[0] != mtime:
+        _library_registry[key] = (mtime, loader(path))
+    return _library_registry[key][1]
+
+
+def _unpickle(path):
+    with open(path, "rb") as library_file:
+        return _make_read_only(pickle.load(library_file))
+
+
+def load_library(file_name):
+    """Returns the contents of the pickled library file_name, unpickling it only
+    the first time it is requested in this process (or if the file has changed since)
+    Input:
+        file_name: path to the pickled library
+    Returns:
+        the unpickled object, shared between all callers (must not be modified)
+    """
+    return _registry_lookup(file_name, _unpickle)
+
+
+def clear_library_registry():
+    """Drops all cached libraries, e.g. to release memory"""
+    _library_registry.clear()
+
+
+def write_max_F_corrections(file_name, corrections, target, mV=None):
+    """Raises max_F (and max_F_strata) in the pickled library file_name to the values in
+    corrections, e.g. the envelopes raised at runtime by Shower.draw_sample. The file is
+    replaced atomically under a file lock, so that showers loading it concurrently see either
+    the old or the new library and concurrent writers do not drop each other's corrections.
+    A binary library converted from it has to be re-converted (see publish_library).
+    Input:
+        file_name: path to sm_maps.pkl or dark_maps.pkl
+        corrections: {(process, LU_Key): {"max_F": value, "max_F_strata": array}}
+        target: name of the target material the corrections were obtained for
+        mV: dark vector mass (key of dark_maps.pkl), None for sm_maps.pkl
+    Returns:
+        number of energy bins whose max_F or max_F_strata were raised
+    """
+    # the library is re-read once the lock is held, so that corrections saved by other
+    # processes in the meantime are not lost
+    with _file_lock(file_name):
+        with open(file_name, "rb") as library_file:
+            library = pickle.load(library_file)
+        maps_dict = library if mV is None else library[mV]
+
+        n_updated = 0
+        for (process, LU_Key), corrected in corrections.items():
+            if process not in maps_dict:
+                continue
+            sample_dict = maps_dict[process][LU_Key][1]
+            updated = False
+            if "max_F" in corrected and corrected["max_F"] > sample_dict["max_F"][target]:
+                sample_dict["max_F"][target] = corrected["max_F"]
+                updated = True
+            if "max_F_strata" in corrected and "max_F_strata" in sample_dict:
+                max_F_strata = np.asarray(sample_dict["max_F_strata"][target])
+                if np.any(corrected["max_F_strata"] > max_F_strata):
+                    sample_dict["max_F_strata"][target] = np.maximum(
+                        max_F_strata, corrected["max_F_strata"]
+                    )
+                    updated = True
+            n_updated += updated
+
+        if n_updated > 0:
+            temporary_name = f"{file_name}.{os.getpid()}.tmp"
+            with open(temporary_name, "wb") as library_file:
+                pickle.dump(library, library_file)
+            os.replace(temporary_name, file_name)
+    return n_updated
+
+
+# --------------------------------------------------------------------------
+# Sharded cache of the dark weight and d-rate tables
+# --------------------------------------------------------------------------
+DARK_TABLE_DIR = "dark_tables/"
+
+
+def dark_table_path(table_dir, table_name, mV, target):
+    """Path of the shard holding the table table_name ("dark_weights" or "dark_drate")
+    of the dark vector mass mV and target material in table_dir"""
+    return (
+        table_dir + DARK_TABLE_DIR + f"{table_name}_mV_{float(mV)!r}_{target}.pkl"
+    )
+
+
+def load_dark_table(table_dir, table_name, mV, target):
+    """Returns the table table_name of (mV, target) from its shard in table_dir or, if
+    there is none, from the single table_name.pkl file used by earlier versions
+    Returns:
+        the table, or None if it has not been computed yet
+    """
+    path = dark_table_path(table_dir, table_name, mV, target)
+    if os.path.exists(path):
+        with open(path, "rb") as table_file:
+            return pickle.load(table_file)
+    if os.path.exists(table_dir + table_name + ".pkl"):
+        return load_library(table_dir + table_name + ".pkl").get(mV, {}).get(target)
+    return None
+
+
+@contextmanager
+def _file_lock(path):
+    """Holds an exclusive lock on path + ".lock" while the context is active"""
+    with open(path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cached_dark_table(table_dir, table_name, mV, target, compute):
+    """Returns the table table_name of (mV, target) (see load_dark_table), calling compute()
+    and saving its result to a new shard if it has not been computed yet. Processes that
+    need the same missing shard wait on a file lock for the first one to compute it, and
+    shards are replaced atomically, so that each table is computed once and readers never
+    see partially written files
+    """
+    table = load_dark_table(table_dir, table_name, mV, target)
+    if table is not None:
+        return table
+
+    path = dark_table_path(table_dir, table_name, mV, target)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _file_lock(path):
+        table = load_dark_table(table_dir, table_name, mV, target)
+        if table is None:
+            table = compute()
+            temporary_name = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_name, "wb") as table_file:
+                pickle.dump(table, table_file)
+            os.replace(temporary_name, path)
+    return table
+
+
+# --------------------------------------------------------------------------
+# Binary (array-only) library format
+# --------------------------------------------------------------------------
+def _array_name(*labels):
+    return "_".join(str(label) for label in labels) + ".npy"
+
+
+def _save_array(library_dir, name, array):
+    np.save(os.path.join(library_dir, name), np.ascontiguousarray(array))
+
+
+def _write_maps(library_dir, prefix, maps_dict):
+    """Writes the {process: [[E, sample_dict], ...]} structure of sm_maps.pkl (or of one
+    mass of dark_maps.pkl) as arrays. Returns the manifest entry {process: targets}"""
+    targets = {}
+    for process, sample_list in maps_dict.items():
+        process_targets = list(sample_list[0][1]["max_F"].keys())
+        maps = [entry[1]["adaptive_map"] for entry in sample_list]
+        ninc = np.array([np.asarray(am.ninc) for am in maps], dtype=np.int64)
+        grids = np.zeros((len(maps), ninc.shape[1], np.max(ninc) + 1))
+        for ii, am in enumerate(maps):
+            grid = np.asarray(am.grid)
+            grids[ii, :, : grid.shape[1]] = grid
+
+        _save_array(
+            library_dir,
+            _array_name(prefix, process, "energies"),
+            [entry[0] for entry in sample_list],
+        )
+        _save_array(library_dir, _array_name(prefix, process, "grids"), grids)
+        _save_array(library_dir, _array_name(prefix, process, "ninc"), ninc)
+        _save_array(
+            library_dir,
+            _array_name(prefix, process, "max_F"),
+            [[entry[1]["max_F"][tm] for tm in process_targets] for entry in sample_list],
+        )
+        if "max_F_strata" in sample_list[0][1]:
+            _save_array(
+                library_dir,
+                _array_name(prefix, process, "max_F_strata"),
+                [
+                    [entry[1]["max_F_strata"][tm] for tm in process_targets]
+                    for entry in sample_list
+                ],
+            )
+        for key in ["neval", "Eg_min", "Ee_min"]:
+            _save_array(
+                library_dir,
+                _array_name(prefix, process, key),
+                [entry[1].get(key, np.nan) for entry in sample_list],
+            )
+        targets[process] = process_targets
+    return targets
+
+
+def _write_cross_sections(library_dir, prefix, cross_section_dict):
+    """Writes the {process: {target: [[E, xsec], ...]}} structure of sm_xsec.pkl (or of one
+    mass of dark_xsec.pkl) as arrays. Returns the manifest entry {process: targets}"""
+    targets = {}
+    for process, target_dict in cross_section_dict.items():
+        process_targets = list(target_dict.keys())
+        tables = [np.asarray(target_dict[tm], dtype=float) for tm in process_targets]
+        for table in tables[1:]:
+            if not np.array_equal(table[:, 0], tables[0][:, 0]):
+                raise ValueError(
+                    f"Cross sections for {process} are not tabulated on a common energy grid"
+                )
+        _save_array(
+            library_dir, _array_name(prefix, process, "xsec_energies"), tables[0][:, 0]
+        )
+        _save_array(
+            library_dir,
+            _array_name(prefix, process, "xsec"),
+            [table[:, 1] for table in tables],
+        )
+        targets[process] = process_targets
+    return targets
+
+
+def _write_interpolators(library_dir, xsec_interp_dict, invmfp_interp_dict):
+    """Writes the tabulated data behind the interp1d objects of sm_xsec_interp.pkl
+    and sm_invmfp_interp.pkl. Returns the manifest entry"""
+    manifest = {}
+    for process, target_dict in xsec_interp_dict.items():
+        process_targets = [tm for tm in target_dict if tm not in ["Emin", "Emax"]]
+        energies = target_dict[process_targets[0]].x
+        for tm in process_targets:
+            for interpolator in [target_dict[tm], invmfp_interp_dict[process][tm]]:
+                if not np.array_equal(interpolator.x, energies):
+                    raise ValueError(
+                        f"Interpolators for {process} do not share a common energy grid"
+                    )
+        _save_array(library_dir, _array_name("sm", process, "interp_energies"), energies)
+        _save_array(
+            library_dir,
+            _array_name("sm", process, "nsigma"),
+            [target_dict[tm].y for tm in process_targets],
+        )
+        _save_array(
+            library_dir,
+            _array_name("sm", process, "invmfp"),
+            [invmfp_interp_dict[process][tm].y for tm in process_targets],
+        )
+        manifest[process] = {
+            "targets": process_targets,
+            "Emin": float(target_dict["Emin"]),
+            "Emax": float(target_dict["Emax"]),
+        }
+    return manifest
+
+
+def convert_library(dict_dir, library_dir=None):
+    """Converts the pickled libraries in dict_dir (sm_maps.pkl, sm_xsec.pkl and, if present,
+    sm_xsec_interp.pkl/sm_invmfp_interp.pkl, dark_maps.pkl and dark_xsec.pkl) into
+    the binary library format
+    Input:
+        dict_dir: directory containing the pickled libraries
+        library_dir: output directory, defaults to dict_dir + BINARY_LIBRARY_DIR
+    Returns:
+        library_dir
+    """
+    if library_dir is None:
+        library_dir = os.path.join(dict_dir, BINARY_LIBRARY_DIR)
+    os.makedirs(library_dir, exist_ok=True)
+
+    manifest = {"format_version": LIBRARY_FORMAT_VERSION}
+    manifest["sm_maps"] = _write_maps(
+        library_dir, "sm", load_library(os.path.join(dict_dir, "sm_maps.pkl"))
+    )
+    manifest["sm_xsec"] = _write_cross_sections(
+        library_dir, "sm", load_library(os.path.join(dict_dir, "sm_xsec.pkl"))
+    )
+    if os.path.exists(os.path.join(dict_dir, "sm_xsec_interp.pkl")):
+        manifest["sm_interpolators"] = _write_interpolators(
+            library_dir,
+            load_library(os.path.join(dict_dir, "sm_xsec_interp.pkl")),
+            load_library(os.path.join(dict_dir, "sm_invmfp_interp.pkl")),
+        )
+    if os.path.exists(os.path.join(dict_dir, "dark_maps.pkl")):
+        dark_maps = load_library(os.path.join(dict_dir, "dark_maps.pkl"))
+        dark_xsec = load_library(os.path.join(dict_dir, "dark_xsec.pkl"))
+        manifest["dark_masses"] = [float(mV) for mV in dark_maps.keys()]
+        manifest["dark_maps"] = {}
+        manifest["dark_xsec"] = {}
+        for mass_index, mV in enumerate(dark_maps.keys()):
+            prefix = "dark" + str(mass_index)
+            manifest["dark_maps"][mass_index] = _write_maps(
+                library_dir, prefix, dark_maps[mV]
+            )
+            manifest["dark_xsec"][mass_index] = _write_cross_sections(
+                library_dir, prefix, dark_xsec[mV]
+            )
+
+    # The manifest is written last so that an interrupted conversion is not picked up
+    with open(os.path.join(library_dir, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    return library_dir
+
+
+def publish_library(dict_dir, library_dir=None):
+    """Makes the pickled libraries in dict_dir available to worker processes as a binary library.
+    The library is (re)converted only if it is missing, has an outdated format or is older
+    than the pickles. Call it once in the parent process before starting the workers;
+    the workers then build Shower/DarkShower(..., library_format="binary", binary_library_dir=library_dir)
+    and attach to the same memory-mapped arrays, which the OS keeps in memory only once
+    Input:
+        dict_dir: directory containing the pickled libraries
+        library_dir: directory of the binary library, defaults to dict_dir + BINARY_LIBRARY_DIR
+    Returns:
+        library_dir
+    """
+    if library_dir is None:
+        library_dir = os.path.join(dict_dir, BINARY_LIBRARY_DIR)
+    manifest_path = os.path.join(library_dir, "manifest.json")
+
+    up_to_date = os.path.exists(manifest_path)
+    if up_to_date:
+        try:
+            _read_manifest(manifest_path)
+        except ValueError:
+            up_to_date = False
+    if up_to_date:
+        manifest_mtime = os.path.getmtime(manifest_path)
+        for file_name in LIBRARY_PICKLES:
+            path = os.path.join(dict_dir, file_name)
+            if os.path.exists(path) and os.path.getmtime(path) > manifest_mtime:
+                up_to_date = False
+
+    if not up_to_date:
+        convert_library(dict_dir, library_dir)
+    return library_dir
+
+
+def _read_manifest(path):
+    with open(path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("format_version") != LIBRARY_FORMAT_VERSION:
+        raise ValueError(
+            f"Binary library {path} has format version {manifest.get('format_version')}, "
+            f"expected {LIBRARY_FORMAT_VERSION}. Re-run convert_library()."
+        )
+    return manifest
+
+
+def load_binary_manifest(library_dir):
+    """Returns the (validated) manifest of the binary library in library_dir"""
+    return _registry_lookup(os.path.join(library_dir, "manifest.json"), _read_manifest)
+
+
+def load_binary_array(library_dir, name):
+    """Returns the array name of the binary library in library_dir, memory-mapped read-only"""
+    return _registry_lookup(
+        os.path.join(library_dir, name),
+        # plain ndarray view of the memmap, indexing np.memmap objects is slow
+        lambda path: np.asarray(np.load(path, mmap_mode="r")),
+    )
+
+
+def adaptive_map_from_grid(grid, ninc):
+    """Rebuilds a vegas AdaptiveMap from its (zero-padded) grid and number of increments per dimension"""
+    return vg.AdaptiveMap([grid[ii, : ninc[ii] + 1] for ii in range(len(ninc))])
+
+
+def _section(manifest, name, mV):
+    """Returns the array-name prefix and the {process: targets} manifest entry of the
+    SM library (mV=None) or of the dark library for vector mass mV"""
+    if mV is None:
+        return "sm", manifest["sm_" + name]
+    masses = manifest.get("dark_masses", [])
+    if mV not in masses:
+        raise KeyError(f"Dark vector mass {mV} not in binary library (has {masses})")
+    mass_index = str(masses.index(mV))
+    return "dark" + mass_index, manifest["dark_" + name][mass_index]
+
+
+def _select_targets(process_targets, target):
+    """Returns [(index, target)] for all targets (target=None) or only for target"""
+    if target is None:
+        return list(enumerate(process_targets))
+    if target not in process_targets:
+        raise Exception("Target Material is not in library")
+    return [(process_targets.index(target), target)]
+
+
+class LazySampleInfo(Mapping):
+    """Sample information ({neval, max_F, max_F_strata, adaptive_map, ...}) of one energy bin of a
+    binary library. Behaves like the corresponding dict of sm_maps.pkl, but the
+    adaptive map is only rebuilt from the memory-mapped grid when it is first requested"""
+
+    def __init__(self, arrays, index, targets):
+        self._arrays = arrays
+        self._index = index
+        self._values = {
+            "neval": int(arrays["neval"][index]),
+            "max_F": {tm: float(arrays["max_F"][index, jj]) for jj, tm in targets},
+        }
+        if "max_F_strata" in arrays:
+            self._values["max_F_strata"] = {
+                tm: arrays["max_F_strata"][index, jj] for jj, tm in targets
+            }
+        for key in ["Eg_min", "Ee_min"]:
+            if not np.isnan(arrays[key][index]):
+                self._values[key] = float(arrays[key][index])
+
+    def __getitem__(self, key):
+        if key == "adaptive_map" and key not in self._values:
+            self._values[key] = adaptive_map_from_grid(
+                self._arrays["grids"][self._index], self._arrays["ninc"][self._index]
+            )
+        return self._values[key]
+
+    def __iter__(self):
+        keys = list(self._values)
+        if "adaptive_map" not in keys:
+            keys.append("adaptive_map")
+        return iter(keys)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+def _build_sample_dict(library_dir, mV, target):
+    manifest = load_binary_manifest(library_dir)
+    prefix, targets = _section(manifest, "maps", mV)
+
+    sample_dict = {}
+    for process, process_targets in targets.items():
+        arrays = {
+            key: load_binary_array(library_dir, _array_name(prefix, process, key))
+            for key in ["energies", "grids", "ninc", "max_F", "neval", "Eg_min", "Ee_min"]
+        }
+        # stratified envelopes are only present for libraries produced with them
+        strata_name = _array_name(prefix, process, "max_F_strata")
+        if os.path.exists(os.path.join(library_dir, strata_name)):
+            arrays["max_F_strata"] = load_binary_array(library_dir, strata_name)
+        selected_targets = _select_targets(process_targets, target)
+        sample_dict[process] = [
+            [energy, LazySampleInfo(arrays, ii, selected_targets)]
+            for ii, energy in enumerate(arrays["energies"].tolist())
+        ]
+    return sample_dict
+
+
+def _build_cross_section_dict(library_dir, mV, target):
+    manifest = load_binary_manifest(library_dir)
+    prefix, targets = _section(manifest, "xsec", mV)
+
+    cross_section_dict = {}
+    for process, process_targets in targets.items():
+        energies = load_binary_array(
+            library_dir, _array_name(prefix, process, "xsec_energies")
+        )
+        xsec = load_binary_array(library_dir, _array_name(prefix, process, "xsec"))
+        cross_section_dict[process] = {
+            tm: np.transpose([energies, xsec[ii]])
+            for ii, tm in _select_targets(process_targets, target)
+        }
+    return cross_section_dict
+
+
+def _build_xsec_interpolators(library_dir, target):
+    manifest = load_binary_manifest(library_dir)
+    if "sm_interpolators" not in manifest:
+        raise FileNotFoundError(
+            f"Binary library {library_dir} does not contain xsec interpolators"
+        )
+
+    xsec_dict, invmfp_dict = {}, {}
+    for process, info in manifest["sm_interpolators"].items():
+        energies = load_binary_array(
+            library_dir, _array_name("sm", process, "interp_energies")
+        )
+        nsigma = load_binary_array(library_dir, _array_name("sm", process, "nsigma"))
+        invmfp = load_binary_array(library_dir, _array_name("sm", process, "invmfp"))
+        xsec_dict[process] = {"Emin": info["Emin"], "Emax": info["Emax"]}
+        invmfp_dict[process] = {"Emin": info["Emin"], "Emax": info["Emax"]}
+        for ii, tm in _select_targets(info["targets"], target):
+            xsec_dict[process][tm] = interp1d(
+                energies,
+                nsigma[ii],
+                fill_value=0.0,
+                bounds_error=False,
+                copy=False,
+                assume_sorted=True,
+            )
+            invmfp_dict[process][tm] = interp1d(
+                energies,
+                invmfp[ii],
+                fill_value=0.0,
+                bounds_error=False,
+                copy=False,
+                assume_sorted=True,
+            )
+    return xsec_dict, invmfp_dict
+
+
+def _cached_build(library_dir, builder, *args):
+    """Builds (once per process) a structure from the arrays of the binary library in library_dir"""
+    return _registry_lookup(
+        os.path.join(library_dir, "manifest.json"),
+        lambda path: builder(library_dir, *args),
+        tag=(builder.__name__,) + args,
+    )
+
+
+def binary_sample_dict(library_dir, mV=None, target=None):
+    """Returns the {process: [[E, sample_dict], ...]} structure of sm_maps.pkl (mV=None)
+    or of dark_maps.pkl[mV] built from the binary library in library_dir. The sample_dicts
+    are LazySampleInfo objects, restricted to max_F of target if it is given"""
+    return _cached_build(library_dir, _build_sample_dict, mV, target)
+
+
+def binary_cross_section_dict(library_dir, mV=None, target=None):
+    """Returns the {process: {target: [[E, xsec], ...]}} structure of sm_xsec.pkl (mV=None)
+    or of dark_xsec.pkl[mV] built from the binary library in library_dir,
+    restricted to target if it is given"""
+    return _cached_build(library_dir, _build_cross_section_dict, mV, target)
+
+
+def binary_xsec_interpolators(library_dir, target=None):
+    """Returns the contents of sm_xsec_interp.pkl and sm_invmfp_interp.pkl rebuilt
+    from the binary library in library_dir, restricted to target if it is given"""
+    return _cached_build(library_dir, _build_xsec_interpolators, target)
+
@@ -5,8 +5,10 @@ import math
 
 try:
     from .physical_constants import *
+    from .kinematics import rotation_matrices
 except:
     from physical_constants import *
+    from kinematics import rotation_matrices
 
 
 """
@@ -335,6 +337,22 @@ def generate_moliere_angle_simplified_alt(t, beta, A, Z, z):
     )
 
 
+def generate_moliere_angles_simplified_alt(t, beta, A, Z, z):
+    """
+    Array version of generate_moliere_angle_simplified_alt, one angle per entry of t and beta
+    """
+    F = 0.98
+    chic2 = get_chic_squared_alt(t, beta, A, Z, z)
+    chia2 = get_chia_squared_alt(beta, A, Z, z)
+    omega = chic2 / chia2
+    v = 0.5 * omega / (1.0 - F)
+    theta0 = np.sqrt(chic2 * ((1.0 + v) * np.log(1.0 + v) / v - 1) / (1.0 + F**2))
+    sign = np.random.choice([-1, 1], size=np.shape(theta0))
+    return sign * np.sqrt(
+        np.random.normal(0.0, theta0) ** 2 + np.random.normal(0.0, theta0) ** 2
+    )
+
+
 def get_rotation_matrix(v):
     """
     Find a rotation matrix s.t. R v = |v|(0,0,1)
@@ -505,3 +523,41 @@ def get_scattered_momentum_Bethe(p4, t, A, Z, rescale_MCS=1):
     p4_new[1:] = p3_new
 
     return p4_new
+
+
+def get_scattered_momenta_fast(p4s, t, A, Z, rescale_MCS=1):
+    """
+    Array version of get_scattered_momentum_fast
+    p4s - (N, 4) four-vectors
+    t - (N,) path lengths in g/cm^2
+    Returns the (N, 4) multiple-scattered four-vectors
+    """
+    p4s = np.array(p4s, dtype=float)
+    p3_norm = np.linalg.norm(p4s[:, 1:], axis=1)
+    # particles at rest are left untouched
+    moving = p3_norm > 0
+    if not np.any(moving):
+        return p4s
+    p3_norm = p3_norm[moving]
+    beta = p3_norm / p4s[moving, 0]
+
+    Z_part = 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theta = (
+            generate_moliere_angles_simplified_alt(
+                np.asarray(t, dtype=float)[moving], beta, A, Z, Z_part
+            )
+            * rescale_MCS
+        )
+    phi = np.random.uniform(0.0, 2.0 * np.pi, size=len(theta))
+
+    # direction in the frame where the particle moves along z
+    p3_new = p3_norm[:, np.newaxis] * np.stack(
+        [np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)],
+        axis=-1,
+    )
+    # Transform back to the lab frame
+    p4s[moving, 1:] = np.einsum(
+        "nij,nj->ni", rotation_matrices(p4s[moving, 1:]), p3_new
+    )
+    return p4s
@@ -3,7 +3,6 @@ try:
 except ImportError:
     from importlib_resources import files
 import numpy as np
-from scipy import interpolate
 
 """For internal consistency, all physical units and constants are defined here.
 """
@@ -36,14 +35,28 @@ m_eta_prime, Gamma_eta_prime = 957.78 * MeV, 0.188 * MeV
 
 m_omega = 782.65 * MeV
 
-# Running alphaQED
-_Q, _inv_alpha_em = np.genfromtxt(
-    files("PETITE.include").joinpath("alpha_QED_running_posQ2.dat").open(),
-    unpack=True,
-)
-running_alpha_em = interpolate.interp1d(
-    _Q,
-    1.0 / _inv_alpha_em,
-    bounds_error=False,
-    fill_value=(1.0 / _inv_alpha_em[0], 1.0 / _inv_alpha_em[-1]),
-)
+# Running alphaQED, read from include/ the first time running_alpha_em is accessed
+_running_alpha_em = {}
+
+
+def _load_running_alpha_em():
+    from scipy import interpolate
+
+    _Q, _inv_alpha_em = np.genfromtxt(
+        files("PETITE.include").joinpath("alpha_QED_running_posQ2.dat").open(),
+        unpack=True,
+    )
+    return interpolate.interp1d(
+        _Q,
+        1.0 / _inv_alpha_em,
+        bounds_error=False,
+        fill_value=(1.0 / _inv_alpha_em[0], 1.0 / _inv_alpha_em[-1]),
+    )
+
+
+def __getattr__(name):
+    if name == "running_alpha_em":
+        if name not in _running_alpha_em:
+            _running_alpha_em[name] = _load_running_alpha_em()
+        return _running_alpha_em[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
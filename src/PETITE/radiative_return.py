@@ -1,8 +1,8 @@
 import numpy as np
-from scipy.interpolate import LinearNDInterpolator
+from scipy.interpolate import RegularGridInterpolator
 
 from PETITE.physical_constants import alpha_em, m_electron
-from PETITE.lumi_integral_data import lumi_integral_list
+from PETITE import lumi_integral_data
 
 
 def lor_prod(p, v):
@@ -91,23 +91,52 @@ def transformed_lepton_luminosity_integrand(s, y, u):
 
 
 _lumi_int_fill_val = np.nan
-log_lumi_integral_list = np.log10(lumi_integral_list + 1e-99)
-log_lumi_integral_interp = LinearNDInterpolator(
-    list(zip(log_lumi_integral_list[:, 0], log_lumi_integral_list[:, 1])),
-    log_lumi_integral_list[:, 2],
-    fill_value=_lumi_int_fill_val,
-)
+# The interpolator is built on first use
+_lumi_interpolators = {}
+
+
+def get_log_lumi_integral_interp():
+    """Returns the interpolator of log10(lumi integral) in (log10(s), log10(x)).
+    The lumi table lies on a regular (s, x) grid, so it is interpolated bilinearly on that grid"""
+    if "log_lumi_integral_interp" not in _lumi_interpolators:
+        log_lumi_integral_list = lumi_integral_data.log_lumi_integral_list
+        log_s = np.unique(log_lumi_integral_list[:, 0])
+        log_x = np.unique(log_lumi_integral_list[:, 1])
+        _lumi_interpolators["log_lumi_integral_interp"] = RegularGridInterpolator(
+            (log_s, log_x),
+            log_lumi_integral_list[:, 2].reshape(len(log_s), len(log_x)),
+            method="linear",
+            bounds_error=False,
+            fill_value=_lumi_int_fill_val,
+        )
+    return _lumi_interpolators["log_lumi_integral_interp"]
+
+
+def __getattr__(name):
+    if name == "log_lumi_integral_interp":
+        return get_log_lumi_integral_interp()
+    if name == "log_lumi_integral_list":
+        return lumi_integral_data.log_lumi_integral_list
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def lumi_integral_interp(s, x):
-    ll = log_lumi_integral_interp(np.log10(s), np.log10(x))
-    if ll == _lumi_int_fill_val:
-        return 0.0
-    else:
-        return np.power(10, log_lumi_integral_interp(np.log10(s), np.log10(x)))
+    """Lepton luminosity integral at Mandelstam s and x = mV^2/s, zero outside the tabulated range.
+    s and x can be scalars or arrays (broadcast against each other)"""
+    log_s, log_x = np.broadcast_arrays(np.log10(s), np.log10(x))
+    ll = get_log_lumi_integral_interp()(np.stack([log_s, log_x], axis=-1)).reshape(
+        log_s.shape
+    )
+    lumi = np.where(np.isnan(ll), 0.0, np.power(10, ll))
+    if lumi.ndim == 0:
+        return float(lumi)
+    return lumi
 
 
 def radiative_return_cross_section(s, mA):
+    """Radiative return cross section (pb) for e+e- -> A' at Mandelstam s, for unit coupling.
+    s and mA can be scalars or arrays (broadcast against each other)"""
+    s, mA = np.asarray(s, dtype=float), np.asarray(mA, dtype=float)
     eps = 1.0
     betaf = np.sqrt(1.0 - 4.0 * (m_electron**2) / (mA**2))
 
@@ -123,4 +152,7 @@ def radiative_return_cross_section(s, mA):
 
     lumi_factor = lumi_integral_interp(s, mA**2 / s)
 
-    return prefac * lumi_factor * 3.89379e08  # 1/GeV^2 -> pb
+    cross_section = prefac * lumi_factor * 3.89379e08  # 1/GeV^2 -> pb
+    if np.ndim(cross_section) == 0:
+        return float(cross_section)
+    return cross_section
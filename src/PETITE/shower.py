@@ -1,11 +1,16 @@
+import pickle
+
 import numpy as np
 import vegas as vg
-import pickle
 
 from scipy.interpolate import interp1d
-from scipy.integrate import quad
+from scipy.integrate import cumulative_trapezoid
 
-from PETITE.moliere import get_scattered_momentum_fast, get_scattered_momentum_Bethe
+from PETITE.moliere import (
+    get_scattered_momentum_fast,
+    get_scattered_momentum_Bethe,
+    get_scattered_momenta_fast,
+)
 from PETITE.particle import Particle, mass_dict
 from PETITE.kinematics import (
     e_to_egamma_fourvecs,
@@ -13,6 +18,12 @@ from PETITE.kinematics import (
     compton_fourvecs,
     annihilation_fourvecs,
     ee_to_ee_fourvecs,
+    e_to_egamma_fourvecs_batch,
+    gamma_to_epem_fourvecs_batch,
+    compton_fourvecs_batch,
+    annihilation_fourvecs_batch,
+    ee_to_ee_fourvecs_batch,
+    rotate_to_lab_frame,
 )
 import PETITE.all_processes as proc
 from PETITE.physical_constants import (
@@ -23,16 +34,29 @@ from PETITE.physical_constants import (
     alpha_em,
 )
 from PETITE import targets
+from PETITE.library import (
+    load_library,
+    write_max_F_corrections,
+    binary_sample_dict,
+    binary_cross_section_dict,
+    binary_xsec_interpolators,
+    adaptive_map_from_grid,
+    BINARY_LIBRARY_DIR,
+)
 
 # from datetime import datetime
 # np.random.seed(int(datetime.now().timestamp()))
 
 from numpy.random import random as draw_U
 import copy
+import importlib
 
 # Maximum energy allowed for Bhabha and Moller scattering
 _Ee_MAX = 100 * GeV
 
+# Version of the Shower.snapshot file layout
+SNAPSHOT_VERSION = 4
+
 
 process_code = {"Brem": 0, "Ann": 1, "PairProd": 2, "Comp": 3, "Moller": 4, "Bhabha": 5}
 diff_xsection_options = {
@@ -79,6 +103,15 @@ kinematic_function = {
     "Bhabha": ee_to_ee_fourvecs,
 }
 
+kinematic_function_batch = {
+    "PairProd": gamma_to_epem_fourvecs_batch,
+    "Brem": e_to_egamma_fourvecs_batch,
+    "Comp": compton_fourvecs_batch,
+    "Ann": annihilation_fourvecs_batch,
+    "Moller": ee_to_ee_fourvecs_batch,
+    "Bhabha": ee_to_ee_fourvecs_batch,
+}
+
 process_PIDS = {
     "PairProd": [-11, 11],
     "Brem": [0, 22],
@@ -88,6 +121,105 @@ process_PIDS = {
     "Bhabha": [0, 11],
 }
 
+# Hard processes available to each particle, and the attribute holding their n sigma
+interaction_processes = {
+    11: ["Brem", "Moller"],
+    -11: ["Brem", "Ann", "Bhabha"],
+    22: ["PairProd", "Comp"],
+}
+NSigma_attributes = {
+    "Brem": "_NSigmaBrem",
+    "PairProd": "_NSigmaPP",
+    "Ann": "_NSigmaAnn",
+    "Comp": "_NSigmaComp",
+    "Moller": "_NSigmaMoller",
+    "Bhabha": "_NSigmaBhabha",
+}
+
+# One-dimensional processes that can be sampled from inverse-CDF tables (see Shower._draw_from_tables),
+# with the number of quantiles stored per energy, of points used to compute them and of energies
+# per decade at which they are stored
+table_sampling_processes = ["Comp", "Ann", "Moller", "Bhabha"]
+n_table_quantiles = 1025
+n_table_cdf_points = 8192
+n_table_energies_per_decade = 16
+
+
+def _to_snapshot_arrays(value):
+    """Replaces the interpolators and adaptive maps in value (through nested dictionaries, lists
+    and tuples) by the arrays they are built from, so that snapshots do not depend on the
+    internals of scipy and vegas objects (see _from_snapshot_arrays)"""
+    if isinstance(value, dict):
+        return {key: _to_snapshot_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_snapshot_arrays(item) for item in value)
+    if isinstance(value, interp1d):
+        return {
+            "snapshot_type": "interp1d",
+            # subclasses such as dark_shower.interpolate1d
+            "class": None
+            if type(value) is interp1d
+            else (type(value).__module__, type(value).__qualname__),
+            "x": np.asarray(value.x),
+            "y": np.asarray(value.y),
+            "kind": value._kind,
+            "axis": value.axis,
+            "bounds_error": value.bounds_error,
+            "fill_value": value.fill_value,
+            # plain settings of subclasses (xspace/yspace of interpolate1d)
+            "attributes": {
+                name: attribute
+                for name, attribute in vars(value).items()
+                if isinstance(attribute, str) and not name.startswith("_")
+            },
+        }
+    if isinstance(value, vg.AdaptiveMap):
+        return {
+            "snapshot_type": "adaptive_map",
+            "grid": np.array(value.grid),
+            "ninc": np.array(value.ninc),
+        }
+    return value
+
+
+def _from_snapshot_arrays(value):
+    """Rebuilds the interpolators and adaptive maps stored by _to_snapshot_arrays"""
+    if isinstance(value, dict):
+        if value.get("snapshot_type") == "interp1d":
+            interpolator_class = interp1d
+            if value["class"] is not None:
+                module_name, class_name = value["class"]
+                interpolator_class = getattr(importlib.import_module(module_name), class_name)
+            interpolator = interpolator_class.__new__(interpolator_class)
+            interp1d.__init__(
+                interpolator,
+                value["x"],
+                value["y"],
+                kind=value["kind"],
+                axis=value["axis"],
+                bounds_error=value["bounds_error"],
+                fill_value=value["fill_value"],
+                assume_sorted=True,
+            )
+            interpolator.__dict__.update(value["attributes"])
+            return interpolator
+        if value.get("snapshot_type") == "adaptive_map":
+            return adaptive_map_from_grid(value["grid"], value["ninc"])
+        return {key: _from_snapshot_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_from_snapshot_arrays(item) for item in value)
+    return value
+
+
+def _select_state(state, selection):
+    """Subset of the particles in a generate_showers_batched state dictionary"""
+    return {key: value[selection] for key, value in state.items()}
+
+
+def _concatenate_states(state1, state2):
+    """Joins two generate_showers_batched state dictionaries"""
+    return {key: np.concatenate([state1[key], state2[key]]) for key in state1}
+
 
 class Shower:
     """Representation of a shower"""
@@ -103,6 +235,10 @@ class Shower:
         seed=None,
         rescale_MCS=1,
         load_xsec_interp=True,
+        library_format="pickle",
+        binary_library_dir=None,
+        one_dim_sampling="vegas",
+        energy_sampling="nearest",
     ):
         """
         Initializes the shower object.
@@ -120,11 +256,33 @@ class Shower:
             load_xsec_interp: whether to load pre-computed cross-sections interpolators.
                 If False, create interpolators from the pre-computed cross-section data in dict_dir.
                 Default is True.
+
+            library_format: "pickle" to read the pickled libraries in dict_dir, or "binary" to
+                read the array-only library in dict_dir + BINARY_LIBRARY_DIR (see PETITE.library.convert_library).
+                Default is "pickle".
+
+            binary_library_dir: directory of the binary library if it is not dict_dir + BINARY_LIBRARY_DIR,
+                e.g. the one returned by PETITE.library.publish_library for a pool of worker processes.
+
+            one_dim_sampling: how Comp, Ann, Moller and Bhabha are sampled: "table" (inverse-CDF
+                tables, interpolated in energy between the library energies), "nearest_table"
+                (table of the closest library energy) or "vegas" (accept-reject on the VEGAS map,
+                like the other processes). Default is "vegas", the tables are opt-in.
+
+            energy_sampling: which library energies the VEGAS samples are drawn with: "nearest" (the
+                integrator next to the closest library energy, with its max_F) or "interpolate" (the
+                integrator of the library energy at or above the incoming energy, with max_F interpolated
+                in energy between the library energies bracketing it, see get_envelope_scales).
+                Default is "nearest".
         """
         if seed is not None:
             np.random.seed(seed)
 
         self.set_dict_dir(dict_dir)
+        self.set_one_dim_sampling(one_dim_sampling)
+        self.set_energy_sampling(energy_sampling)
+        self.set_library_format(library_format)
+        self.set_binary_library_dir(binary_library_dir)
         self.min_energy = min_energy
 
         # Nuclear target
@@ -145,6 +303,81 @@ class Shower:
         self._maxF_fudge_global = maxF_fudge_global
         self._max_n_integrators = max_n_integrators
 
+        # Points where wgt*f exceeded max_F, and the envelopes raised accordingly (see _check_max_F)
+        self._max_F_violations = {}
+        self._max_F_corrections = {}
+
+    # Attributes holding (shared) library samples and the methods that re-attach them
+    _library_sample_attributes = {"_loaded_samples": "set_samples"}
+
+    def snapshot(self, path, include_samples=False):
+        """Saves the fully initialized shower (cross section interpolators, NSigmas, dark
+        weight and rate tables, ...) to path so that it can be restored with from_snapshot
+        without recomputing any of them. Interpolators and adaptive maps are stored as the
+        arrays they are built from, together with the inverse-CDF tables and the look up keys
+        of the VEGAS integrators built so far.
+        Args:
+            path: file name of the snapshot
+            include_samples: whether to also store the VEGAS samples. By default they are
+                re-attached from dict_dir when the snapshot is loaded, which is fast and keeps
+                the snapshot small, but requires dict_dir to be available.
+        """
+        state = self.__dict__.copy()
+        # The integrators are rebuilt from the samples, the inverse-CDF tables are kept
+        state["_sample_integrators"] = list(self._sample_integrators)
+        for attribute in self._library_sample_attributes:
+            if include_samples:
+                state[attribute] = {
+                    process: [[energy, dict(sample_info)] for energy, sample_info in sample_list]
+                    for process, sample_list in state[attribute].items()
+                }
+            else:
+                del state[attribute]
+
+        with open(path, "wb") as snapshot_file:
+            pickle.dump(
+                {
+                    "snapshot_version": SNAPSHOT_VERSION,
+                    "class": type(self).__name__,
+                    "state": _to_snapshot_arrays(state),
+                },
+                snapshot_file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """Restores a shower saved with snapshot
+        Args:
+            path: file name of the snapshot
+        Returns:
+            the restored Shower (or DarkShower) object
+        """
+        with open(path, "rb") as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+
+        if snapshot.get("snapshot_version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Snapshot {path} has version {snapshot.get('snapshot_version')}, expected {SNAPSHOT_VERSION}"
+            )
+        if snapshot["class"] != cls.__name__:
+            raise ValueError(
+                f"Snapshot {path} holds a {snapshot['class']}, not a {cls.__name__}"
+            )
+
+        state = _from_snapshot_arrays(snapshot["state"])
+        shower = cls.__new__(cls)
+        shower.__dict__.update(state)
+        for attribute, setter in cls._library_sample_attributes.items():
+            if attribute not in shower.__dict__:
+                getattr(shower, setter)()
+        # set_samples starts with empty integrators and tables
+        shower._sample_tables = state["_sample_tables"]
+        shower._sample_integrators = {}
+        for process, LU_Key in state["_sample_integrators"]:
+            shower._get_sample_integrator(process, LU_Key)
+        return shower
+
     def set_MCS_rescale_factor(self, rescale_MCS):
         self._MCS_rescale_factor = rescale_MCS
 
@@ -157,26 +390,37 @@ class Shower:
     def load_xsec_interpolators(self):
 
         xsec_path = "sm_xsec_interp.pkl"
+        if self._library_format == "binary":
+            try:
+                self.xsec_dict, self.invmfp_dict = binary_xsec_interpolators(
+                    self.get_binary_library_dir(), target=self.target.name
+                )
+            except FileNotFoundError:
+                raise Exception(
+                    f"Xsec interpolators not found in binary library: {self.get_binary_library_dir()}"
+                )
+        else:
+            self._load_pickled_xsec_interpolators(xsec_path)
+        self._assign_xsec_interpolators()
+
+    def _load_pickled_xsec_interpolators(self, xsec_path):
         try:
-            xsec_interp_file = open(self._dict_dir + xsec_path, "rb")
+            self.xsec_dict = load_library(self._dict_dir + xsec_path)
         except FileNotFoundError:
             raise Exception(
                 f"Xsec interpolators file not found: {self._dict_dir + xsec_path}"
             )
-        self.xsec_dict = pickle.load(xsec_interp_file)
-        xsec_interp_file.close()
 
         try:
-            invmfp_interp_file = open(
-                self._dict_dir + xsec_path.replace("xsec", "invmfp"), "rb"
+            self.invmfp_dict = load_library(
+                self._dict_dir + xsec_path.replace("xsec", "invmfp")
             )
         except FileNotFoundError:
             raise Exception(
                 f"Inv mfp interpolators file not found: {self._dict_dir + xsec_path.replace('xsec','invmfp')}"
             )
 
-        self.invmfp_dict = pickle.load(invmfp_interp_file)
-        invmfp_interp_file.close()
+    def _assign_xsec_interpolators(self):
 
         # Now do a case by case assingment of the interpolators
         # NOTE: This is a littel ugly -- maybe call interpolator dicts directly?
@@ -236,9 +480,12 @@ class Shower:
         }
 
     def load_sample(self, dict_dir, process):
-        sample_file = open(dict_dir + "sm_maps.pkl", "rb")
-        sample_dict = pickle.load(sample_file)
-        sample_file.close()
+        if self._library_format == "binary":
+            sample_dict = binary_sample_dict(
+                self.get_binary_library_dir(), target=self.target.name
+            )
+        else:
+            sample_dict = load_library(dict_dir + "sm_maps.pkl")
 
         if process in sample_dict.keys():
             return sample_dict[process]
@@ -247,9 +494,12 @@ class Shower:
             raise Exception("Process String does not match library")
 
     def load_cross_section(self, dict_dir, process, target_material):
-        cross_section_file = open(dict_dir + "sm_xsec.pkl", "rb")
-        cross_section_dict = pickle.load(cross_section_file)
-        cross_section_file.close()
+        if self._library_format == "binary":
+            cross_section_dict = binary_cross_section_dict(
+                self.get_binary_library_dir(), target=self.target.name
+            )
+        else:
+            cross_section_dict = load_library(dict_dir + "sm_xsec.pkl")
 
         # NOTE: I couldnt tell why another target_material argument is passed here, but kept it nonetheless
         if target_material != self.target.name:
@@ -265,6 +515,14 @@ class Shower:
         else:
             raise Exception("Target Material is not in library")
 
+    def get_material_properties(self):
+        """Returns target material properties: Z, A, rho, dE/dx"""
+        return self.target.get_material_properties()
+
+    def get_n_targets(self):
+        """Returns nuclear and electron target densities in 1/cm^3"""
+        return self.target.get_n_targets()
+
     def set_dict_dir(self, value):
         """Set the top level directory containing pre-computed MC pickles to value"""
         self._dict_dir = value
@@ -273,12 +531,56 @@ class Shower:
         """Get the top level directory containing pre-computed MC pickles"""
         return self._dict_dir
 
+    def set_library_format(self, value):
+        """Set the format of the pre-computed libraries, "pickle" or "binary" """
+        if value not in ["pickle", "binary"]:
+            raise ValueError(f"Unknown library format {value}, use 'pickle' or 'binary'")
+        self._library_format = value
+
+    def set_binary_library_dir(self, value):
+        """Set the directory containing the binary version of the pre-computed libraries,
+        None for the default dict_dir + BINARY_LIBRARY_DIR"""
+        if value is None:
+            value = self._dict_dir + BINARY_LIBRARY_DIR
+        self._binary_library_dir = value
+
+    def get_binary_library_dir(self):
+        """Get the directory containing the binary version of the pre-computed libraries"""
+        return self._binary_library_dir
+
+    def set_one_dim_sampling(self, value):
+        """Set how one-dimensional processes are sampled ("table", "nearest_table" or "vegas")"""
+        if value not in ["table", "nearest_table", "vegas"]:
+            raise ValueError(
+                f"one_dim_sampling must be 'table', 'nearest_table' or 'vegas', not {value}"
+            )
+        self._one_dim_sampling = value
+
+    def get_one_dim_sampling(self):
+        """Get how one-dimensional processes are sampled"""
+        return self._one_dim_sampling
+
+    def set_energy_sampling(self, value):
+        """Set which library energies the VEGAS samples are drawn with ("nearest" or "interpolate")"""
+        if value not in ["nearest", "interpolate"]:
+            raise ValueError(
+                f"energy_sampling must be 'nearest' or 'interpolate', not {value}"
+            )
+        self._energy_sampling = value
+
+    def get_energy_sampling(self):
+        """Get which library energies the VEGAS samples are drawn with"""
+        return self._energy_sampling
+
     def set_samples(self):
         self._loaded_samples = {}
         for Process in process_code.keys():
             self._loaded_samples[Process] = self.load_sample(self._dict_dir, Process)
         self._Egamma_min = self._loaded_samples["Brem"][0][1]["Eg_min"]
         self._Ee_min = self._loaded_samples["Brem"][0][1]["Ee_min"]
+        # VEGAS integrators of generate_shower_batched and inverse-CDF tables, built on first use
+        self._sample_integrators = {}
+        self._sample_tables = {}
 
     def set_cross_sections(self):
         """Loads the pre-computed cross-sections for various shower processes
@@ -452,71 +754,49 @@ class Shower:
         )
         """
 
-        II_y_Brem = np.array(
-            [
-                quad(self._NSigmaBrem, BS[0][0], BS[i][0], full_output=1)[0]
-                for i in range(len(BS))
-            ]
+        # Integrals of (n_T * sigma) from the lowest tabulated energy. The interpolations
+        # are linear between tabulated energies, so the trapezoid rule is exact there
+        II_y_Brem = cumulative_trapezoid(
+            self._NSigmaBrem(BS[:, 0]), BS[:, 0], initial=0.0
         )
         self._interaction_integral_Brem = interp1d(
             BS[:, 0], II_y_Brem, fill_value=0.0, bounds_error=False
         )
 
-        II_y_PP = np.array(
-            [
-                quad(self._NSigmaPP, PPS[0][0], PPS[i][0], full_output=1)[0]
-                for i in range(len(PPS))
-            ]
+        II_y_PP = cumulative_trapezoid(
+            self._NSigmaPP(PPS[:, 0]), PPS[:, 0], initial=0.0
         )
         self._interaction_integral_PP = interp1d(
             PPS[:, 0], II_y_PP, fill_value=0.0, bounds_error=False
         )
 
-        II_y_Ann = np.array(
-            [
-                quad(self._NSigmaAnn, AnnS[0][0], AnnS[i][0], full_output=1)[0]
-                for i in range(len(AnnS))
-            ]
+        II_y_Ann = cumulative_trapezoid(
+            self._NSigmaAnn(AnnS[:, 0]), AnnS[:, 0], initial=0.0
         )
         self._interaction_integral_Ann = interp1d(
             AnnS[:, 0], II_y_Ann, fill_value=0.0, bounds_error=False
         )
 
-        II_y_Comp = np.array(
-            [
-                quad(self._NSigmaComp, CS[0][0], CS[i][0], full_output=1)[0]
-                for i in range(len(CS))
-            ]
+        II_y_Comp = cumulative_trapezoid(
+            self._NSigmaComp(CS[:, 0]), CS[:, 0], initial=0.0
         )
         self._interaction_integral_Comp = interp1d(
             CS[:, 0], II_y_Comp, fill_value=0.0, bounds_error=False
         )
 
-        II_y_Moller = np.array(
-            [
-                quad(
-                    self._NSigmaMoller,
-                    bhabha_moller_energies[0],
-                    bhabha_moller_energies[i],
-                    full_output=1,
-                )[0]
-                for i in range(len(bhabha_moller_energies))
-            ]
+        II_y_Moller = cumulative_trapezoid(
+            self._NSigmaMoller(bhabha_moller_energies),
+            bhabha_moller_energies,
+            initial=0.0,
         )
         self._interaction_integral_Moller = interp1d(
             bhabha_moller_energies, II_y_Moller, fill_value=0.0, bounds_error=False
         )
 
-        II_y_Bhabha = np.array(
-            [
-                quad(
-                    self._NSigmaBhabha,
-                    bhabha_moller_energies[0],
-                    bhabha_moller_energies[i],
-                    full_output=1,
-                )[0]
-                for i in range(len(bhabha_moller_energies))
-            ]
+        II_y_Bhabha = cumulative_trapezoid(
+            self._NSigmaBhabha(bhabha_moller_energies),
+            bhabha_moller_energies,
+            initial=0.0,
         )
         self._interaction_integral_Bhabha = interp1d(
             bhabha_moller_energies, II_y_Bhabha, fill_value=0.0, bounds_error=False
@@ -555,7 +835,7 @@ class Shower:
 
     def _positron_exponential_factor(self, E, Ei):
         """Returns the exponential factor for positron non-interaction probability
-        over an energy interval [E, Ei]"""
+        over an energy interval [E, Ei]. E and Ei can be (broadcastable) arrays"""
 
         # this quantity has units of GeV/cm (assuming E, Ei given in GeV)
         n_sigma_diff = (
@@ -566,25 +846,34 @@ class Shower:
                 - self._interaction_integral_Bhabha(E)
             )
         )
-        if n_sigma_diff < 0.0 or E > Ei:
-            return 0.0
         # dEdxT has units of GeV/m
         dEdxT = self.get_material_properties()[3] * (0.1)  # Converting MeV/cm to GeV/m
         # the ratio n_sigma_diff/dEdxT has units of (GeV/cm)/(GeV/m) = m/cm = 100
-        return np.exp(-n_sigma_diff / dEdxT / cmtom)
+        return self._exponential_factor(n_sigma_diff, dEdxT, E, Ei)
 
     def _electron_exponential_factor(self, E, Ei):
         """Returns the exponential factor for electron non-interaction probability
-        over an energy interval [E, Ei]"""
+        over an energy interval [E, Ei]. E and Ei can be (broadcastable) arrays"""
         n_sigma_diff = (
             self._interaction_integral_Brem(Ei) - self._interaction_integral_Brem(E)
         ) + (
             self._interaction_integral_Moller(Ei) - self._interaction_integral_Moller(E)
         )
-        if n_sigma_diff < 0.0 or E > Ei:
-            return 0.0
         dEdxT = self.get_material_properties()[3] * (0.1)  # Converting MeV/cm to GeV/m
-        return np.exp(-n_sigma_diff / dEdxT / cmtom)
+        return self._exponential_factor(n_sigma_diff, dEdxT, E, Ei)
+
+    @staticmethod
+    def _exponential_factor(n_sigma_diff, dEdxT, E, Ei):
+        """exp(-n_sigma_diff/dEdxT), set to zero where n_sigma_diff < 0 or E > Ei
+        (outside of the tabulated energies). Returns a float for scalar inputs"""
+        if np.ndim(n_sigma_diff) == 0 and np.ndim(E) == 0 and np.ndim(Ei) == 0:
+            if n_sigma_diff < 0.0 or E > Ei:
+                return 0.0
+            return np.exp(-n_sigma_diff / dEdxT / cmtom)
+        outside = (n_sigma_diff < 0.0) | (np.asarray(E) > np.asarray(Ei))
+        return np.where(
+            outside, 0.0, np.exp(-np.maximum(n_sigma_diff, 0.0) / dEdxT / cmtom)
+        )
 
     def _NSigmaElectron(self, E):
         """Returns n sigma for electrons as a function of energy in GeV"""
@@ -647,7 +936,11 @@ class Shower:
 
         sample_list = self._loaded_samples
 
-        if LU_Key < 0 or LU_Key > len(sample_list[process]):
+        if self._energy_sampling == "interpolate" and (
+            LU_Key < 0 or LU_Key > len(sample_list[process])
+        ):
+            LU_Key = self.get_LU_keys([Einc], process)[0]
+        elif LU_Key < 0 or LU_Key > len(sample_list[process]):
             energies = sample_list[process][0:]
             energies = np.array([x[0] for x in energies])
 
@@ -663,17 +956,14 @@ class Shower:
                     "Warning: sampling above maximum energy for process" + str(process)
                 )
 
-        sample_dict = sample_list[process][LU_Key][1]
+        if process in table_sampling_processes and self._one_dim_sampling != "vegas":
+            x = self._draw_from_tables(process, [Einc], [LU_Key])[0]
+            if not np.isnan(x[0]):
+                if VB:
+                    return np.concatenate([x, [1]])
+                return x
 
-        adaptive_map = sample_dict["adaptive_map"]
-        max_F = sample_dict["max_F"][self.target.name] * self._maxF_fudge_global
-        neval_vegas = sample_dict["neval"]
-        integrand = vg.Integrator(
-            map=adaptive_map,
-            max_nhcube=1,
-            nstrat=np.ones(dimensionalities[process]),
-            neval=neval_vegas,
-        )
+        sample_dict = sample_list[process][LU_Key][1]
 
         event_info = {
             "E_inc": Einc,
@@ -695,6 +985,26 @@ class Shower:
         batch_f = diff_xsec_func(
             event_info, len(proc.integration_range(event_info, event_info["process"]))
         )
+        scale = self.get_envelope_scales(process, [Einc], LU_Key)[0]
+        if "max_F_strata" in sample_dict:
+            [x], [sampcount] = self._draw_from_strata(
+                process, LU_Key, sample_dict, [batch_f], scales=[scale]
+            )
+            if x is None:
+                raise Exception("No Sample Found", process, Einc, LU_Key)
+            if VB:
+                return np.concatenate([list(x), [sampcount]])
+            return x
+
+        max_F = (
+            self.get_max_F(process, LU_Key, sample_dict) * self._maxF_fudge_global * scale
+        )
+        integrand = vg.Integrator(
+            map=sample_dict["adaptive_map"],
+            max_nhcube=1,
+            nstrat=np.ones(dimensionalities[process]),
+            neval=sample_dict["neval"],
+        )
         if VB:
             sampcount = 0
         n_integrators_used = 0
@@ -705,7 +1015,17 @@ class Shower:
                 for x, wgt in zip(x_batch, wgt_batch):
                     if VB:
                         sampcount += 1
-                    if max_F * draw_U() < wgt * batch_f(np.array([x])):
+                    wgt_f = wgt * np.ravel(batch_f(np.array([x])))[0]
+                    if wgt_f > max_F:
+                        self._check_max_F(
+                            process, LU_Key, sample_dict, wgt_f / scale, max_F / scale
+                        )
+                        max_F = (
+                            self.get_max_F(process, LU_Key, sample_dict)
+                            * self._maxF_fudge_global
+                            * scale
+                        )
+                    if max_F * draw_U() < wgt_f:
                         sample_found = True
                         break
         if sample_found is False:
@@ -715,6 +1035,297 @@ class Shower:
         else:
             return x
 
+    def get_max_F(self, process, LU_Key, sample_dict):
+        """Maximum of wgt*f used to sample a given process and look up key: the max_F of
+        sample_dict, unless it was exceeded at runtime (see _check_max_F)"""
+        corrected = self._max_F_corrections.get((process, LU_Key), {})
+        if "max_F" in corrected:
+            return corrected["max_F"]
+        return sample_dict["max_F"][self.target.name]
+
+    def get_max_F_strata(self, process, LU_Key, sample_dict):
+        """Same as get_max_F for the stratified envelope max_F_strata"""
+        corrected = self._max_F_corrections.get((process, LU_Key), {})
+        if "max_F_strata" in corrected:
+            return corrected["max_F_strata"]
+        return np.asarray(sample_dict["max_F_strata"][self.target.name])
+
+    def _check_max_F(self, process, LU_Key, sample_dict, wgt_fs, envelopes, strata=None):
+        """Counts the points where wgt*f exceeds the envelope it was sampled with, and raises
+        the envelope (max_F, or max_F_strata of the strata of the points) to the values found.
+        Exceeding the envelope biases the sampled distribution, so the counts are a measure of
+        how reliable the samples of each (process, look up key) are (see get_max_F_violations).
+        Args:
+            wgt_fs: values of wgt*f (jac*f for stratified envelopes)
+            envelopes: envelopes the points were sampled with, i.e. max_F or max_F_strata times maxF_fudge_global
+            strata: (flat) indices of the strata the points were drawn from, for stratified envelopes
+        """
+        violations = np.atleast_1d(wgt_fs > envelopes)
+        if not np.any(violations):
+            return
+        wgt_fs = np.broadcast_to(wgt_fs, violations.shape)
+        key = (str(process), int(LU_Key))
+        corrected = self._max_F_corrections.setdefault(key, {})
+        if key not in self._max_F_violations:
+            self._max_F_violations[key] = 0
+            print(
+                "Warning: wgt*f exceeds max_F for process "
+                + str(process)
+                + " in energy bin "
+                + str(LU_Key)
+                + ", raising max_F"
+            )
+        self._max_F_violations[key] += int(np.count_nonzero(violations))
+
+        if strata is None:
+            corrected["max_F"] = max(
+                self.get_max_F(process, LU_Key, sample_dict), np.max(wgt_fs[violations])
+            )
+        else:
+            max_F_strata = np.array(
+                self.get_max_F_strata(process, LU_Key, sample_dict), dtype=float
+            )
+            np.maximum.at(
+                max_F_strata.reshape(-1),
+                np.atleast_1d(strata)[violations],
+                wgt_fs[violations],
+            )
+            corrected["max_F_strata"] = max_F_strata
+
+    def get_max_F_violations(self):
+        """Number of points at which wgt*f exceeded the sampling envelope
+        Returns:
+            dictionary {(process, LU_Key): number of points}
+        """
+        return dict(self._max_F_violations)
+
+    def save_max_F_corrections(self):
+        """Writes the envelopes raised at runtime (see _check_max_F) back to sm_maps.pkl in
+        dict_dir, so that later showers start from them
+        Returns:
+            number of energy bins updated"""
+        return write_max_F_corrections(
+            self._dict_dir + "sm_maps.pkl", self._max_F_corrections, self.target.name
+        )
+
+    def _one_dim_range(self, process, energies):
+        """Range of cos(theta) with a non-zero cross section for the processes in table_sampling_processes
+        (see all_processes.integration_range and the kinematic cuts of the differential cross sections)
+        Returns:
+            arrays with the lower and upper limits for each energy"""
+        energies = np.asarray(energies, dtype=float)
+        ct_min, ct_max = -np.ones_like(energies), np.ones_like(energies)
+        if process == "Moller" or process == "Bhabha":
+            delta_ct_limit = 2.0 * self._Ee_min / (energies - m_electron)
+            ct_min, ct_max = ct_min + delta_ct_limit, ct_max - delta_ct_limit
+        elif process == "Ann":
+            # Both photons above Eg_min
+            ct_max = np.minimum(
+                ct_max,
+                np.sqrt((energies + m_electron) / (energies - m_electron))
+                * (energies - 2 * self._Egamma_min + m_electron)
+                / (energies + m_electron),
+            )
+        return ct_min, ct_max
+
+    def _get_sample_table(self, process, rows):
+        """Inverse-CDF tables of a one-dimensional process, computing the rows that have not
+        been used before. The rows are at the library energies and at
+        n_table_energies_per_decade energies per decade between them, so that interpolating
+        between neighbouring rows is accurate. Row k holds n_table_quantiles equally spaced
+        quantiles of cos(theta) at its energy, rescaled to [0, 1] over _one_dim_range (NaN if
+        the cross section vanishes). The quantiles are computed with the VEGAS map of the
+        closest library energy, stretched from its range onto the range at the row energy, which
+        concentrates the n_table_cdf_points where the cross section is peaked.
+        Returns:
+            energies of the rows, table, and the row of each library energy bin
+        """
+        sample_list = self._loaded_samples[process]
+        if process not in self._sample_tables:
+            library_energies = np.array([entry[0] for entry in sample_list])
+            energies, library_rows = [library_energies[:1]], [0]
+            for E_lo, E_up in zip(library_energies[:-1], library_energies[1:]):
+                n_steps = max(
+                    int(np.ceil(n_table_energies_per_decade * np.log10(E_up / E_lo))), 1
+                )
+                energies.append(np.geomspace(E_lo, E_up, n_steps + 1)[1:])
+                library_rows.append(library_rows[-1] + n_steps)
+            energies = np.concatenate(energies)
+            self._sample_tables[process] = (
+                energies,
+                np.zeros((len(energies), n_table_quantiles)),
+                np.zeros(len(energies), dtype=bool),
+                np.array(library_rows),
+            )
+        energies, table, table_built, library_rows = self._sample_tables[process]
+
+        for row in set(rows[~table_built[rows]].tolist()):
+            table_built[row] = True
+            table[row] = np.nan
+            closest_bin = np.argmin(np.abs(np.log(energies[library_rows] / energies[row])))
+            adaptive_map = sample_list[closest_bin][1]["adaptive_map"]
+            event_info = {
+                "E_inc": energies[row],
+                "m_e": m_electron,
+                "Z_T": self.target.Z,
+                "A_T": self.target.A,
+                "mT": self.target.A,
+                "alpha_FS": alpha_em,
+                "mV": 0,
+                "Eg_min": self._Egamma_min,
+                "Ee_min": self._Ee_min,
+                "process": process,
+            }
+            ct_min, ct_max = self._one_dim_range(process, energies[row])
+            if not ct_min < ct_max:
+                continue
+            # Stretch the map from the range of its library energy onto that of the row energy
+            map_min, map_max = self._one_dim_range(process, energies[library_rows[closest_bin]])
+            if not map_min < map_max:
+                map_min, map_max = adaptive_map.grid[0][0], adaptive_map.grid[0][-1]
+            stretch = (ct_max - ct_min) / (map_max - map_min)
+
+            y = (np.arange(n_table_cdf_points) + 0.5)[:, np.newaxis] / n_table_cdf_points
+            x = np.empty_like(y)
+            jac = np.empty(n_table_cdf_points)
+            adaptive_map.map(y, x, jac)
+            x = ct_min + (x - map_min) * stretch
+            dsigma = jac * np.ravel(diff_xsection_options[process](event_info, 1)(x))
+            dsigma = np.maximum(np.nan_to_num(dsigma), 0.0)
+            if np.sum(dsigma) <= 0.0:
+                continue
+            cdf = np.concatenate([[0.0], np.cumsum(dsigma)]) / np.sum(dsigma)
+
+            y_quantiles = np.interp(
+                np.linspace(0.0, 1.0, n_table_quantiles),
+                cdf,
+                np.linspace(0.0, 1.0, n_table_cdf_points + 1),
+            )[:, np.newaxis]
+            x_quantiles = np.empty_like(y_quantiles)
+            adaptive_map.map(y_quantiles, x_quantiles, np.empty(n_table_quantiles))
+            x_quantiles = ct_min + (x_quantiles - map_min) * stretch
+            table[row] = np.clip((x_quantiles[:, 0] - ct_min) / (ct_max - ct_min), 0.0, 1.0)
+        return energies, table, library_rows
+
+    def _draw_from_tables(self, process, energies, LU_Keys):
+        """Draws cos(theta) for one-dimensional processes from their inverse-CDF tables (see _get_sample_table)
+        with a single uniform number per sample. With one_dim_sampling = "table", the quantiles are
+        interpolated (in log energy) between the table rows bracketing each energy, otherwise
+        the row of the library bin LU_Keys is used.
+        Returns:
+            (N, 1) array of MC-sampled variables (NaN where no table is available)"""
+        energies = np.asarray(energies, dtype=float)
+        LU_Keys = np.asarray(LU_Keys)
+        no_rows = np.zeros(0, dtype=int)
+        if self._one_dim_sampling == "table":
+            table_energies, _, _ = self._get_sample_table(process, no_rows)
+            # np.minimum/np.maximum rather than np.clip, which is slow for short arrays
+            lower = np.maximum(
+                np.minimum(
+                    np.searchsorted(table_energies, energies) - 1,
+                    len(table_energies) - 2,
+                ),
+                0,
+            )
+            upper = lower + 1
+            weight = np.maximum(
+                np.minimum(
+                    np.log(energies / table_energies[lower])
+                    / np.log(table_energies[upper] / table_energies[lower]),
+                    1.0,
+                ),
+                0.0,
+            )
+        else:
+            _, _, library_rows = self._get_sample_table(process, no_rows)
+            lower = upper = library_rows[LU_Keys]
+            weight = np.zeros(len(energies))
+        _, table, _ = self._get_sample_table(process, np.concatenate([lower, upper]))
+
+        u = draw_U(len(energies)) * (n_table_quantiles - 1)
+        jj = np.minimum(u.astype(int), n_table_quantiles - 2)
+        u = u - jj
+        quantiles_lower = table[lower, jj] * (1 - u) + table[lower, jj + 1] * u
+        quantiles_upper = table[upper, jj] * (1 - u) + table[upper, jj + 1] * u
+        # Use a single row if the cross section vanishes at the other one
+        weight = np.where(np.isnan(quantiles_lower), 1.0, weight)
+        weight = np.where(np.isnan(quantiles_upper), 0.0, weight)
+        quantiles = np.where(weight > 0.0, quantiles_upper * weight, 0.0) + np.where(
+            weight < 1.0, quantiles_lower * (1 - weight), 0.0
+        )
+
+        ct_min, ct_max = self._one_dim_range(process, energies)
+        return (ct_min + quantiles * (ct_max - ct_min))[:, np.newaxis]
+
+    def _draw_from_strata(self, process, LU_Key, sample_dict, batch_fs, scales=None):
+        """Draws samples by accept-reject against the stratified envelope max_F_strata of
+        sample_dict (see utilities/find_maxes.py): a stratum of the unit hypercube is chosen
+        in proportion to its maximum, and a point drawn uniformly in it (in the y-space of the
+        adaptive map) is accepted with probability jac*f/(maximum of the stratum).
+        Each batch of points is split between the integrands still waiting for a sample.
+        Args:
+            process, LU_Key: process and look up key of sample_dict
+            sample_dict: sample information of one energy bin
+            batch_fs: list of integrands (one per incoming particle)
+            scales: factors of the envelope for each integrand (see get_envelope_scales), ones if None
+        Returns:
+            samples: list with the MC-sampled variables for each integrand (None if no sample was found)
+            sampcounts: list with the number of points tried for each integrand
+        """
+        adaptive_map = sample_dict["adaptive_map"]
+        n_points = sample_dict["neval"]
+
+        if scales is None:
+            scales = np.ones(len(batch_fs))
+        samples = [None] * len(batch_fs)
+        sampcounts = [0] * len(batch_fs)
+        waiting = list(range(len(batch_fs)))
+        n_integrators_used = 0
+        while len(waiting) > 0 and n_integrators_used < self._max_n_integrators:
+            n_integrators_used += 1
+            # Re-read every round, since the envelope may have been raised by _check_max_F
+            max_F_strata = (
+                self.get_max_F_strata(process, LU_Key, sample_dict)
+                * self._maxF_fudge_global
+            )
+            n_strata = max_F_strata.shape
+            max_F_strata = max_F_strata.ravel()
+            strata_cdf = np.cumsum(max_F_strata)
+            if strata_cdf[-1] <= 0.0:
+                break
+            strata = np.searchsorted(
+                strata_cdf, draw_U(n_points) * strata_cdf[-1], side="right"
+            )
+            y = (
+                np.transpose(np.unravel_index(strata, n_strata))
+                + draw_U((n_points, len(n_strata)))
+            ) / n_strata
+            x = np.empty_like(y)
+            jac = np.empty(n_points)
+            adaptive_map.map(y, x, jac)
+            envelopes = max_F_strata[strata]
+            accept = envelopes * draw_U(n_points)
+
+            slices = np.array_split(np.arange(n_points), min(len(waiting), n_points))
+            for ii, points in zip(list(waiting), slices):
+                jac_fs = jac[points] * np.ravel(batch_fs[ii](x[points]))
+                self._check_max_F(
+                    process,
+                    LU_Key,
+                    sample_dict,
+                    jac_fs / scales[ii],
+                    envelopes[points],
+                    strata=strata[points],
+                )
+                accepted = np.flatnonzero(accept[points] * scales[ii] < jac_fs)
+                if len(accepted) > 0:
+                    samples[ii] = x[points[accepted[0]]]
+                    sampcounts[ii] += accepted[0] + 1
+                    waiting.remove(ii)
+                else:
+                    sampcounts[ii] += len(points)
+        return samples, sampcounts
+
     def sample_scattering(self, p0, process, VB=False):
         E0 = p0.get_pf()[0]
         if E0 <= np.max(
@@ -1020,6 +1631,457 @@ class Shower:
 
         return all_particles
 
+    def get_mfps(self, PIDs, energies):
+        """Array version of get_mfp: mean free paths in meters for particles with
+        PIDs (22, 11 or -11) and energies in GeV"""
+        PIDs = np.asarray(PIDs)
+        energies = np.asarray(energies, dtype=float)
+        n_sigma = np.zeros(len(energies))
+        for PID, processes in interaction_processes.items():
+            selection = PIDs == PID
+            if np.any(selection):
+                n_sigma[selection] = np.sum(
+                    [
+                        getattr(self, NSigma_attributes[process])(energies[selection])
+                        for process in processes
+                    ],
+                    axis=0,
+                )
+        with np.errstate(divide="ignore"):
+            return cmtom * n_sigma**-1
+
+    def choose_processes(self, PIDs, energies):
+        """Draws the hard process undergone by each particle, with probabilities given by the
+        n sigma of the processes available to it (see interaction_processes)
+        Returns:
+            array with the process label of each particle, or None if no process is possible
+        """
+        PIDs = np.asarray(PIDs)
+        energies = np.asarray(energies, dtype=float)
+        choices = np.full(len(energies), None, dtype=object)
+        for PID, processes in interaction_processes.items():
+            selection = np.flatnonzero(PIDs == PID)
+            if len(selection) == 0:
+                continue
+            n_sigmas = np.array(
+                [
+                    getattr(self, NSigma_attributes[process])(energies[selection])
+                    for process in processes
+                ]
+            )
+            SC = np.sum(n_sigmas, axis=0)
+            possible = (SC != 0.0) & ~np.isnan(SC)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cumulative = np.cumsum(n_sigmas, axis=0) / SC
+            draw = np.sum(draw_U(len(selection)) > cumulative[:-1], axis=0)
+            choices[selection[possible]] = np.array(processes, dtype=object)[
+                draw[possible]
+            ]
+        return choices
+
+    def get_LU_keys(self, energies, process):
+        """Look up keys (see draw_sample) of the VEGAS integrators closest to each energy, or with
+        energy_sampling = "interpolate", of the library energy at or above each energy"""
+        energies = np.asarray(energies, dtype=float)
+        sample_list = self._loaded_samples[process]
+        sample_energies = np.array([x[0] for x in sample_list])
+        if self._energy_sampling == "interpolate":
+            LU_Keys = np.maximum(np.searchsorted(sample_energies, energies), 1)
+        else:
+            LU_Keys = (
+                np.argmin(np.abs(sample_energies - energies[:, np.newaxis]), axis=1) + 1
+            )
+        return np.minimum(LU_Keys, len(sample_list) - 1)
+
+    def get_envelope_scales(self, process, energies, LU_Key):
+        """Factors by which the envelope (max_F or max_F_strata) of the look up key LU_Key is
+        rescaled to sample each energy. With energy_sampling = "interpolate", the envelope is
+        interpolated (as a power law) between the library energy below each energy and that of LU_Key,
+        using max_F, or the mean of max_F_strata when available, as measure of the envelope
+        (both including the corrections made at runtime). The factors are at least one: the
+        envelope is raised where it grows toward lower energies, but never lowered below that of
+        LU_Key, whose VEGAS map the samples are drawn with.
+        Since the samples are drawn with the integrand at the exact energy (see draw_samples), this
+        only adjusts the bound of the accept-reject to the exact energy.
+        Returns:
+            array of factors, one per energy (ones with energy_sampling = "nearest")"""
+        energies = np.asarray(energies, dtype=float)
+        scales = np.ones(len(energies))
+        if self._energy_sampling != "interpolate" or LU_Key < 1:
+            return scales
+        sample_list = self._loaded_samples[process]
+        (energy_lower, sample_lower), (energy_upper, sample_upper) = sample_list[
+            LU_Key - 1 : LU_Key + 1
+        ]
+        if "max_F_strata" in sample_upper and "max_F_strata" in sample_lower:
+            envelope_lower = np.mean(
+                self.get_max_F_strata(process, LU_Key - 1, sample_lower)
+            )
+            envelope_upper = np.mean(self.get_max_F_strata(process, LU_Key, sample_upper))
+        else:
+            envelope_lower = self.get_max_F(process, LU_Key - 1, sample_lower)
+            envelope_upper = self.get_max_F(process, LU_Key, sample_upper)
+        if not (envelope_lower > 0.0 and envelope_upper > 0.0):
+            return scales
+        # Fraction of the way from the energy of LU_Key to the one below it
+        weight = np.log(energy_upper / energies) / np.log(energy_upper / energy_lower)
+        return np.maximum(
+            (envelope_lower / envelope_upper) ** np.clip(weight, 0.0, 1.0), 1.0
+        )
+
+    def _get_sample_integrator(self, process, LU_Key):
+        """VEGAS integrator for a given process and look up key, cached in self._sample_integrators"""
+        key = (process, LU_Key)
+        if key not in self._sample_integrators:
+            sample_dict = self._loaded_samples[process][LU_Key][1]
+            self._sample_integrators[key] = vg.Integrator(
+                map=sample_dict["adaptive_map"],
+                max_nhcube=1,
+                nstrat=np.ones(dimensionalities[process]),
+                neval=sample_dict["neval"],
+            )
+        return self._sample_integrators[key]
+
+    def draw_samples(self, energies, process):
+        """Array version of draw_sample: draws one sample of MC variables for each incoming
+        energy. Particles are grouped by look up key, and each VEGAS batch is split between
+        the particles of a group that are still waiting for a sample (see also _draw_from_strata
+        for samples with stratified envelopes, and _draw_from_tables for one-dimensional processes).
+        Returns:
+            (N, dimensionality) array of MC-sampled variables"""
+        energies = np.asarray(energies, dtype=float)
+        if process not in diff_xsection_options:
+            raise Exception("Your process is not in the list")
+        LU_Keys = self.get_LU_keys(energies, process)
+        samples = np.zeros((len(energies), dimensionalities[process]))
+        to_sample = np.ones(len(energies), dtype=bool)
+        if process in table_sampling_processes and self._one_dim_sampling != "vegas":
+            samples = self._draw_from_tables(process, energies, LU_Keys)
+            to_sample = np.isnan(samples[:, 0])
+
+        for LU_Key in np.unique(LU_Keys[to_sample]):
+            sample_dict = self._loaded_samples[process][LU_Key][1]
+            batch_fs = {}
+            for ii in np.flatnonzero((LU_Keys == LU_Key) & to_sample):
+                event_info = {
+                    "E_inc": energies[ii],
+                    "m_e": m_electron,
+                    "Z_T": self.target.Z,
+                    "A_T": self.target.A,
+                    "mT": self.target.A,
+                    "alpha_FS": alpha_em,
+                    "mV": 0,
+                    "Eg_min": self._Egamma_min,
+                    "Ee_min": self._Ee_min,
+                    "process": process,
+                }
+                batch_fs[ii] = diff_xsection_options[process](
+                    event_info, dimensionalities[process]
+                )
+            scales = dict(
+                zip(
+                    batch_fs,
+                    self.get_envelope_scales(process, energies[list(batch_fs)], LU_Key),
+                )
+            )
+
+            if "max_F_strata" in sample_dict:
+                xs, _ = self._draw_from_strata(
+                    process,
+                    LU_Key,
+                    sample_dict,
+                    list(batch_fs.values()),
+                    scales=list(scales.values()),
+                )
+                for ii, x in zip(batch_fs, xs):
+                    if x is None:
+                        raise Exception(
+                            "No Sample Found", process, energies[ii], LU_Key
+                        )
+                    samples[ii] = x
+                continue
+
+            integrand = self._get_sample_integrator(process, LU_Key)
+            n_integrators_used = 0
+            while len(batch_fs) > 0 and n_integrators_used < self._max_n_integrators:
+                n_integrators_used += 1
+                for x_batch, wgt_batch in integrand.random_batch():
+                    max_F = (
+                        self.get_max_F(process, LU_Key, sample_dict)
+                        * self._maxF_fudge_global
+                    )
+                    accept = max_F * draw_U(len(wgt_batch))
+                    # Each waiting particle gets its own (independent) slice of the batch
+                    slices = np.array_split(
+                        np.arange(len(wgt_batch)), min(len(batch_fs), len(wgt_batch))
+                    )
+                    for ii, points in zip(list(batch_fs), slices):
+                        wgt_fs = wgt_batch[points] * np.ravel(
+                            batch_fs[ii](x_batch[points])
+                        )
+                        self._check_max_F(
+                            process, LU_Key, sample_dict, wgt_fs / scales[ii], max_F
+                        )
+                        accepted = np.flatnonzero(accept[points] * scales[ii] < wgt_fs)
+                        if len(accepted) > 0:
+                            samples[ii] = x_batch[points[accepted[0]]]
+                            del batch_fs[ii]
+                    if len(batch_fs) == 0:
+                        break
+            if len(batch_fs) > 0:
+                ii = next(iter(batch_fs))
+                raise Exception("No Sample Found", process, energies[ii], LU_Key)
+        return samples
+
+    def _get_MCS_momenta(self, p4s, delta_z):
+        """Multiple-scattered four-momenta after travelling delta_z (meters) each"""
+        t = self.target.rho * (np.asarray(delta_z) / cmtom)
+        if self._get_MCS_p is get_scattered_momentum_fast:
+            return get_scattered_momenta_fast(
+                p4s, t, self.target.A, self.target.Z, self._MCS_rescale_factor
+            )
+        return np.array(
+            [
+                self._get_MCS_p(
+                    p4, ti, self.target.A, self.target.Z, self._MCS_rescale_factor
+                )
+                for p4, ti in zip(p4s, t)
+            ]
+        ).reshape(-1, 4)
+
+    def sample_scatterings(self, p4s, process):
+        """Array version of sample_scattering: draws the two outgoing lab-frame four-momenta
+        for each incoming four-momentum in p4s (N, 4). Returns an (N, 2, 4) array"""
+        samples = self.draw_samples(p4s[:, 0], process)
+        return rotate_to_lab_frame(
+            p4s, kinematic_function_batch[process](p4s[:, 0], samples)
+        )
+
+    def _start_particles(self, new_particles):
+        """Collects newly created (shower index, Particle) pairs into the arrays used by
+        generate_showers_batched. Short-lived particles are decayed and particles below
+        threshold end immediately.
+        Returns:
+            the state dictionary of the particles to propagate, and the list of decay products
+        """
+        decay_products = []
+        stable_particles = []
+        for shower_index, ap in new_particles:
+            if ap.get_ids()["stability"] == "short-lived":
+                decay_products.extend(
+                    (shower_index, dp)
+                    for dp in ap.decay_particle()
+                    if dp.get_p0()[0] > self.min_energy
+                )
+                continue
+            if ap.get_ids()["stability"] == "stable":
+                PID, mass = ap.get_ids()["PID"], ap.get_ids()["mass"]
+                min_energy = max(
+                    self._minimum_calculable_energy[PID], self.min_energy, mass
+                )
+                if ap.get_p0()[0] >= min_energy:
+                    stable_particles.append((shower_index, ap, PID, mass, min_energy))
+                    continue
+            ap.set_ended(True)
+
+        particles = np.empty(len(stable_particles), dtype=object)
+        particles[:] = [x[1] for x in stable_particles]
+        state = {
+            "shower_index": np.array([x[0] for x in stable_particles], dtype=int),
+            "particle": particles,
+            "PID": np.array([x[2] for x in stable_particles], dtype=int),
+            "mass": np.array([x[3] for x in stable_particles], dtype=float),
+            "min_energy": np.array([x[4] for x in stable_particles], dtype=float),
+            "p4": np.array(
+                [x[1].get_p0() for x in stable_particles], dtype=float
+            ).reshape(-1, 4),
+            "r3": np.array(
+                [x[1].get_r0() for x in stable_particles], dtype=float
+            ).reshape(-1, 3),
+            "delta_z": np.zeros(len(stable_particles)),
+        }
+        return state, decay_products
+
+    def _propagate_photons(self, state):
+        """Moves photons in state to their next hard interaction"""
+        mfp = self.get_mfps(state["PID"], state["p4"][:, 0])
+        dist = mfp * np.log(1.0 / (1.0 - draw_U(len(mfp))))
+        p3 = state["p4"][:, 1:]
+        state["r3"] += (
+            p3 / np.linalg.norm(p3, axis=1, keepdims=True) * dist[:, np.newaxis]
+        )
+
+    def _step_particles(self, p4s, r3s, masses, steps, Losses=False, MS=False):
+        """Array version of one propagation step in propagate_particle: dE/dx losses,
+        then a straight step along the momentum, then multiple scattering"""
+        if Losses:
+            # see Particle.lose_energy
+            p3_norm = np.linalg.norm(p4s[:, 1:], axis=1)
+            E_updated = np.maximum(p4s[:, 0] - Losses * steps, masses)
+            p3f = np.sqrt(E_updated**2 - masses**2)
+            update = p3f > 0.0
+            p4s[update, 0] = E_updated[update]
+            p4s[update, 1:] *= (p3f[update] / p3_norm[update])[:, np.newaxis]
+
+        p3_norm = np.linalg.norm(p4s[:, 1:], axis=1)
+        moving = p3_norm > 0.0
+        r3s[moving] += (
+            p4s[moving, 1:] / p3_norm[moving, np.newaxis] * steps[moving, np.newaxis]
+        )
+        if MS:
+            p4s[:] = self._get_MCS_momenta(p4s, steps)
+
+    def _step_charged_particles(self, state, Losses=False, MS=False):
+        """Array version of one iteration of the electron/positron loop in propagate_particle.
+        Particles that scatter or fall below threshold take their last increment.
+        Returns:
+            the states of the particles still propagating and of those that stopped
+        """
+        mfp = self.get_mfps(state["PID"], state["p4"][:, 0])
+        random_number = draw_U(len(mfp))
+        state["delta_z"] = mfp / np.random.uniform(low=6, high=20, size=len(mfp))
+        hard_scatter = random_number > np.exp(-state["delta_z"] / mfp)
+
+        stepping = ~hard_scatter
+        p4, r3 = state["p4"][stepping], state["r3"][stepping]
+        self._step_particles(
+            p4, r3, state["mass"][stepping], state["delta_z"][stepping], Losses, MS
+        )
+        state["p4"][stepping], state["r3"][stepping] = p4, r3
+        stepping[stepping] = p4[:, 0] >= state["min_energy"][stepping]
+
+        stopped = _select_state(state, ~stepping)
+        delta_z, p4 = stopped["delta_z"], stopped["p4"]
+        distC = draw_U(len(delta_z))
+        last_increment = distC * delta_z
+        above = p4[:, 0] >= stopped["min_energy"]
+        mfp = self.get_mfps(stopped["PID"][above], p4[above, 0])
+        last_increment[above] = mfp * np.log(
+            1.0 / (1.0 + (np.exp(-delta_z[above] / mfp) - 1) * distC[above])
+        )
+        self._step_particles(
+            p4, stopped["r3"], stopped["mass"], last_increment, Losses, MS
+        )
+        return _select_state(state, stepping), stopped
+
+    def _interact_particles(self, state):
+        """Ends the propagation of the particles in state and draws the secondaries of their
+        hard interactions, grouped by process.
+        Returns:
+            list of (shower index, Particle) for the new particles
+        """
+        p4s, r3s, PIDs = state["p4"], state["r3"], state["PID"]
+        for ap, pf, rf in zip(state["particle"], p4s, r3s):
+            ap.set_pf(pf)
+            ap.set_rf(rf)
+            ap.set_ended(True)
+
+        draws = self.choose_processes(PIDs, p4s[:, 0])
+        scattering = np.array([draw is not None for draw in draws], dtype=bool)
+        scattering &= p4s[:, 0] > state["min_energy"]
+        for PID in np.unique(PIDs[scattering]):
+            E_max = self._maximum_calculable_energy[PID]
+            if np.any(p4s[scattering & (PIDs == PID), 0] > E_max):
+                raise ValueError(
+                    f"Sampling above maximum energy for particle {PID}. Maximum calculable energy is {E_max} GeV."
+                )
+
+        new_particles = []
+        for process in set(draws[scattering]):
+            selection = np.flatnonzero(scattering & (draws == process))
+            new_p4s = self.sample_scatterings(p4s[selection], process)
+            for ii, p_labframes in zip(selection, new_p4s):
+                init_IDs = state["particle"][ii].get_ids()
+                for k, p_labframe in enumerate(p_labframes):
+                    if p_labframe[0] <= self.min_energy:
+                        continue
+                    PID = process_PIDS[process][k]
+                    if PID == 0:
+                        PID = init_IDs["PID"]
+                    new_dict = {
+                        "PID": PID,
+                        "parent_PID": init_IDs["PID"],
+                        "ID": 2 * (init_IDs["ID"]) + k,
+                        "parent_ID": init_IDs["ID"],
+                        "generation_number": init_IDs["generation_number"] + 1,
+                        "generation_process": process,
+                        "weight": init_IDs["weight"],
+                        "mass": mass_dict[PID],
+                    }
+                    new_particles.append(
+                        (
+                            state["shower_index"][ii],
+                            Particle(p_labframe, r3s[ii], new_dict),
+                        )
+                    )
+        return new_particles
+
+    def generate_showers_batched(self, p0s, VB=False, GlobalMS=True):
+        """
+        Generates the particle showers of several initial particles together. All live
+        particles, whatever their shower and generation, are advanced at once with
+        array operations. Statistically equivalent to calling generate_shower for each
+        initial particle, and much faster when many particles are alive at the same time.
+        Args:
+            p0s: list of initial Particles
+            VB: bool to turn on/off verbose output
+            GlobalMS: bool, multiple scattering flag. Set to false to disable multiple scattering of electrons and positrons
+
+        Returns:
+            list with, for each initial particle, the list of all particles generated in its shower
+        """
+        showers = []
+        new_particles = []
+        for shower_index, p0 in enumerate(p0s):
+            p0.set_ended(False)
+            p0copy = copy.deepcopy(p0)
+            showers.append([p0copy])
+            if p0.get_p0()[0] < self.min_energy:
+                p0.set_ended(True)
+            else:
+                new_particles.append((shower_index, p0copy))
+
+        dEdxT = self.target.dEdx * (0.1)  # Converting MeV/cm to GeV/m
+        charged = _select_state(self._start_particles([])[0], [])
+        n_iterations = 0
+        while len(new_particles) > 0 or len(charged["PID"]) > 0:
+            n_iterations += 1
+            started, decay_products = self._start_particles(new_particles)
+
+            # Photons travel straight to their next hard interaction
+            photons = started["PID"] == 22
+            interacting = _select_state(started, photons)
+            self._propagate_photons(interacting)
+
+            # Electrons and positrons take one step
+            charged = _concatenate_states(charged, _select_state(started, ~photons))
+            charged, stopped = self._step_charged_particles(
+                charged, Losses=dEdxT, MS=GlobalMS
+            )
+            interacting = _concatenate_states(interacting, stopped)
+
+            new_particles = decay_products + self._interact_particles(interacting)
+            for shower_index, ap in new_particles:
+                showers[shower_index].append(ap)
+            if VB:
+                print(
+                    f"Iteration {n_iterations}: {len(charged['PID'])} e+/e- propagating, {len(new_particles)} new particles"
+                )
+
+        return showers
+
+    def generate_shower_batched(self, p0, VB=False, GlobalMS=True):
+        """
+        Generates particle shower from an initial particle with the batched engine of
+        generate_showers_batched, see generate_shower for the arguments and output
+        """
+        if VB:
+            print("Starting shower, initial particle with ID Info")
+            print(p0.get_ids())
+            print("Initial four-momenta:")
+            print(p0.get_p0())
+        return self.generate_showers_batched([p0], VB=VB, GlobalMS=GlobalMS)[0]
+
 
 def event_display(all_particles):
     """Draws event display for a list of particles"""
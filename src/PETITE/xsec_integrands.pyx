@@ -1,7 +1,9 @@
 import numpy as np
+cimport cython
+from cython.parallel cimport prange
 
 # use exp from C
-from libc.math cimport exp, cos, sin, sqrt, log, pi
+from libc.math cimport exp, cos, sin, sqrt, log, pi, pow, fabs
 
 cdef double m_electron = 0.5109989461e-3  # GeV
 cdef double alpha_em = 1.0 / 137.035999139  # fine structure constant
@@ -147,3 +149,346 @@ def g2_elastic_c(int Z, double t):
     """Elastic form factor"""
     cdef double a0 = aa_c(Z)
     return Z**2 * a0**4 * t**2 / (1 + a0**2 * t) ** 2
+
+
+# ----------------------------------------------------------------------------
+# Kernels of the one-dimensional SM processes and of the dark processes.
+# They replace the NumPy code of the classes in all_processes.py, so they use
+# the values of physical_constants.py. The loops release the GIL, and run in
+# parallel when the extension is compiled with OpenMP.
+# ----------------------------------------------------------------------------
+cdef double m_electron_pdg = 510.998950e-6  # GeV
+cdef double alpha_em_pdg = 1.0 / 137.035999
+cdef double m_proton_pdg = 938.272088e-3  # GeV
+cdef double mu_p = 2.79
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def c_dsigma_compton_dCT(double[:, ::1] x, double Eg, double mV):
+    """Compton Scattering of a Photon off an at-rest Electron, producing either a photon or a Dark Vector
+    gamma (Eg) + e- (me) -> e- + gamma/V
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Eg (incident photon energy)
+        mV (Dark Vector Mass -- can be set to zero for SM Case)
+    """
+    cdef Py_ssize_t i, n = x.shape[0]
+    cdef double[::1] ans = np.zeros(n)
+    # Powers of the masses are computed once (x**2 compiles to x*x, higher powers to pow)
+    cdef double me2 = m_electron_pdg**2
+    cdef double me4 = me2**2
+    cdef double mV2 = mV**2
+    cdef double s = me2 + 2 * Eg * m_electron_pdg
+    cdef double sqrt_lambda, jacobian, PF, ct, t, T1, T2, T3
+
+    if not s > (m_electron_pdg + mV) ** 2:
+        return np.asarray(ans)
+
+    sqrt_lambda = sqrt(me4 + (mV2 - s) ** 2 - 2 * me2 * (mV2 + s))
+    jacobian = (s - me2) / (2 * s) * sqrt_lambda
+    PF = 2.0 * pi * alpha_em_pdg**2 / (s - me2) ** 2
+
+    for i in prange(n, nogil=True):
+        ct = x[i, 0]
+        t = -0.5 * (me4 + s * (-mV2 + s + ct * sqrt_lambda) - me2 * (mV2 + 2 * s + ct * sqrt_lambda)) / s
+        if mV == 0.0:
+            T1 = (6.0 * me2 * s + 3.0 * me4 - s**2) / ((me2 - s) * (-me2 + s + t))
+            T2 = 4 * me4 / (s + t - me2) ** 2
+            T3 = (t * (s - me2) + (s + me2) ** 2) / (s - me2) ** 2
+        else:
+            T1 = (
+                2.0 * me2 * (mV2 - 3 * s) - 3 * me4 - 2 * mV2 * s + 2 * mV2**2 + s**2
+            ) / ((me2 - s) * (me2 + mV2 - s - t))
+            T2 = (2 * me2 * (2 * me2 + mV2)) / (me2 + mV2 - s - t) ** 2
+            T3 = ((me2 + s) * (me2 + mV2 + s) + t * (s - me2)) / (me2 - s) ** 2
+        ans[i] = PF * jacobian * (T1 + T2 + T3)
+
+    return np.asarray(ans)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def c_dsigma_annihilation_dCT(double[:, ::1] x, double Ee, double mV, double EgMin):
+    """Annihilation of a Positron and Electron into a Photon and a (Dark) Photon
+    e+ (Ee) + e- (me) -> gamma + gamma/V
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Ee (incident positron energy)
+        mV (Dark Vector Mass -- can be set to zero for SM Case)
+        EgMin (minimum lab-frame energy of the outgoing photons)
+    """
+    cdef Py_ssize_t i, n = x.shape[0]
+    cdef double[::1] ans = np.zeros(n)
+    cdef double me = m_electron_pdg
+    cdef double s = 2.0 * me * (Ee + me)
+    cdef double ctMax, b, ct
+
+    if s < mV**2:
+        return np.asarray(ans)
+
+    ctMax = sqrt((Ee + me) / (Ee - me)) * (2 * me * (Ee - 2 * EgMin + me) - mV**2) / (2 * me * (Ee + me) - mV**2)
+    b = sqrt(1.0 - 4.0 * me**2 / s)
+
+    for i in prange(n, nogil=True):
+        ct = x[i, 0]
+        if not ct > ctMax:
+            ans[i] = (
+                4.0
+                * pi
+                * alpha_em_pdg**2
+                / (s * (1 - b**2 * ct**2))
+                * ((s - mV**2) / (2 * s) * (1 + ct**2) + 2.0 * mV**2 / (s - mV**2))
+            )
+
+    return np.asarray(ans)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def c_dsigma_moller_dCT(double[:, ::1] x, double Ee, double DE):
+    """Moller Scattering of an Electron off an at-rest Electron
+    e- (Ee) + e- (me) -> e- + e-
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Ee (incident electron energy)
+        DE (minimum energy of the outgoing electrons)
+    """
+    cdef Py_ssize_t i, n = x.shape[0]
+    cdef double[::1] ans = np.zeros(n)
+    cdef double me2 = m_electron_pdg**2
+    cdef double delta_ct_limit = 2.0 * DE / (Ee - m_electron_pdg)
+    cdef double s = me2 + 2 * Ee * m_electron_pdg
+    cdef double PF = 16 * pi**2 * alpha_em_pdg**2 / (8 * pi * s * (s - 4 * me2) ** 2)
+    cdef double ct, ct2
+
+    for i in prange(n, nogil=True):
+        ct = x[i, 0]
+        ct2 = ct**2
+        if (ct > -1 + delta_ct_limit) and (ct < 1.0 - delta_ct_limit):
+            ans[i] = (
+                PF
+                * (s**2 * (3 + ct2) ** 2 - 8 * me2 * s * (7 + ct2**2) + 16 * me2**2 * (6 - 3 * ct2 + ct2**2))
+                / ((1 - ct) ** 2 * (1 + ct) ** 2)
+            )
+
+    return np.asarray(ans)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def c_dsigma_bhabha_dCT(double[:, ::1] x, double Ee, double DE):
+    """Bhabha Scattering of a Positron off an at-rest Electron
+    e+ (Ee) + e- (me) -> e+ + e-
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Ee (incident positron energy)
+        DE (minimum energy of the outgoing electrons)
+    """
+    cdef Py_ssize_t i, n = x.shape[0]
+    cdef double[::1] ans = np.zeros(n)
+    cdef double me2 = m_electron_pdg**2
+    cdef double delta_ct_limit = 2.0 * DE / (Ee - m_electron_pdg)
+    cdef double s = me2 + 2 * Ee * m_electron_pdg
+    # me^2 s, me^4 s^2, me^6 s^3, me^8 s^4 in units of s^4, and the prefactor
+    cdef double r = me2 / s
+    cdef double r2 = r**2
+    cdef double PF = alpha_em_pdg**2 * pi * s / (2 * (-4 * me2 + s) ** 2)
+    cdef double ct
+
+    for i in prange(n, nogil=True):
+        ct = x[i, 0]
+        if (ct > -1 + delta_ct_limit) and (ct < 1.0 - delta_ct_limit):
+            ans[i] = (
+                PF
+                * (
+                    256 * (-1 + ct) ** 2 * ct**2 * r2**2
+                    - 128 * (-1 + ct) * (1 + ct * (1 + ct) * (-3 + 2 * ct)) * r2 * r
+                    + 16 * (7 + ct * (2 + ct * (-5 + 6 * (-1 + ct) * ct))) * r2
+                    - 8 * (7 + ct * (-3 + ct * (3 + ct * (-1 + 2 * ct)))) * r
+                    + (3 + ct**2) ** 2
+                )
+                / (-1 + ct) ** 2
+            )
+
+    return np.asarray(ans)
+
+
+cdef inline double fl_kf_c(double x, double beta) noexcept nogil:
+    """Kuraev-Fadin lepton structure function (see radiative_return.fl_kf)"""
+    return (beta / 16.0) * ((8.0 + 3.0 * beta) * pow(1.0 - x, beta / 2.0 - 1.0) - 4.0 * (1.0 + x))
+
+
+cdef inline double fl_kf_scaled_c(double x, double beta) noexcept nogil:
+    """Kuraev-Fadin lepton structure function times (1-x)^(1-beta/2) (see radiative_return.fl_kf_scaled)"""
+    return (beta / 16.0) * ((8.0 + 3.0 * beta) - 4.0 * (1.0 + x) * pow(1.0 - x, 1.0 - beta / 2.0))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def c_dsigma_radiative_return_du(double[:, ::1] x, double Ee, double mV):
+    """Radiative return cross-section e^+ e^- > V differential with respect to u = (1-x)^(beta/2)/umax,
+    where x is the fraction of initial CM momentum carried by one of beam particles
+
+    Input parameters needed:
+        Ee (incident positron energy)
+        mV (Dark Vector Mass)
+    """
+    cdef Py_ssize_t i, n = x.shape[0]
+    cdef double[::1] ans = np.zeros(n)
+    cdef double me = m_electron_pdg
+    cdef double s = 2.0 * me * (Ee + me)
+    cdef double y = mV**2 / s
+    cdef double beta, umax, betaf, prefac, u0, x1, x2
+
+    if s < mV**2:
+        return np.asarray(ans)
+
+    beta = (2.0 * alpha_em_pdg / pi) * (log(s / me**2) - 1.0)
+    umax = pow(1.0 - y, beta / 2.0)
+    betaf = sqrt(1.0 - 4.0 * (me**2) / (mV**2))
+    prefac = (4.0 * pi**2) * alpha_em_pdg * betaf * (3.0 / 2.0 - betaf**2 / 2.0) / s * umax
+
+    for i in prange(n, nogil=True):
+        u0 = x[i, 0]
+        x1 = 1.0 - pow(u0 * umax, 2.0 / beta)
+        x2 = y / x1
+        if (x2 < 1.0) and (x1 > 0.0) and (u0 < 1.0):
+            # transformed_lepton_luminosity_integrand(s, y, u0 * umax)
+            ans[i] = 2.0 * prefac * fl_kf_c(y / x1, beta) * fl_kf_scaled_c(x1, beta) * (1.0 / x1) * (2.0 / beta)
+
+    return np.asarray(ans)
+
+
+cdef inline double Gelastic_inelastic_over_tsquared_c(
+    double t, double Z, double c1, double c2, double ap2
+) noexcept nogil:
+    """Form factor squared of dark bremsstrahlung rescaled by 1/t^2 (see all_processes.Gelastic_inelastic_over_tsquared),
+    with c1 = (111 Z^(-1/3)/me)^2, c2 = 0.164 GeV^2 A^(-2/3) and ap2 = (773 Z^(-2/3)/me)^2"""
+    cdef double Gel = (1.0 / (1.0 + c1 * t)) ** 2 / (1 + t / c2) ** 2
+    cdef double Ginel = (
+        Z
+        / (c1**2 * Z**2)
+        * (ap2 / (1.0 + ap2 * t)) ** 2
+        * ((1.0 + (mu_p**2 - 1.0) * t / (4.0 * m_proton_pdg**2)) / ((1.0 + t / 0.71) ** 2) ** 2)
+    )
+    return Z**2 * c1**2 * (Gel + Ginel)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def c_dsig_dx_dcostheta_dark_brem_exact_tree_level(
+    double[:, ::1] x_list, double Ebeam, double mV, double MTarget, double Z, double A, bint log_method
+):
+    """Exact Tree-Level Dark Photon Bremsstrahlung
+    e (ep) + Z -> e (epp) + V (w) + Z
+    result it dsigma/dx/dcostheta where x=E_darkphoton/E_beam and theta is angle between beam and dark photon
+
+    Input parameters needed:
+        Ebeam (incident electron energy)
+        mV (mass of dark photon)
+        MTarget (Target mass)
+        Z, A (Target charge and atomic mass number)
+        log_method (whether the kinematic parameters are x, log10(1-costheta), log10(ttilde),
+            as for event_info['Method'] = 'Log', or x, costheta, ttilde)
+    """
+    cdef Py_ssize_t i, n = x_list.shape[0]
+    cdef double[::1] ans = np.zeros(n)
+    cdef double me = m_electron_pdg
+    cdef double p = sqrt(Ebeam**2 - me**2)
+    cdef double mVsq2mesq = mV**2 + 2 * me**2
+    cdef double tconv = (
+        2 * MTarget * (MTarget + Ebeam) * sqrt(Ebeam**2 + me**2) / (MTarget * (MTarget + 2 * Ebeam) + me**2)
+    ) ** 2
+    cdef double c1 = (111 * pow(Z, -1.0 / 3.0) / me) ** 2
+    cdef double c2 = 0.164 * pow(A, -2.0 / 3.0)
+    cdef double ap2 = (773.0 * pow(Z, -2.0 / 3.0) / me) ** 2
+    cdef double alpha_em_cubed = alpha_em_pdg**2 * alpha_em_pdg
+    cdef double x, costheta, ttilde, one_minus_costheta, Jacobian, k, V, utilde, discr
+    cdef double EX, Qplus, Qminus, tplus, tminus, t, q0, q, costhetaq
+    cdef double Am2, A1, Am1, A0, Y, W, phi_integral
+
+    for i in prange(n, nogil=True):
+        x = x_list[i, 0]
+        if log_method:
+            one_minus_costheta = pow(10.0, x_list[i, 1])
+            costheta = 1.0 - one_minus_costheta
+            ttilde = pow(10.0, x_list[i, 2])
+            Jacobian = one_minus_costheta * ttilde * log(10.0) ** 2
+        else:
+            costheta = x_list[i, 1]
+            ttilde = x_list[i, 2]
+            Jacobian = 1.0
+
+        if not x * Ebeam >= mV:
+            continue
+        k = sqrt((x * Ebeam) ** 2 - mV**2)
+        V = sqrt(p**2 + k**2 - 2 * p * k * costheta)
+        utilde = -2 * (x * Ebeam**2 - k * p * costheta) + mV**2
+        # Recoil energy available to the target
+        EX = (1 - x) * Ebeam + MTarget
+        discr = utilde**2 + 4 * MTarget * utilde * EX + 4 * MTarget**2 * V**2
+        if not discr >= 0:
+            continue
+
+        Qplus = fabs((V * (utilde + 2 * MTarget * EX) + EX * sqrt(discr)) / (2 * EX**2 - 2 * V**2))
+        Qminus = fabs((V * (utilde + 2 * MTarget * EX) - EX * sqrt(discr)) / (2 * EX**2 - 2 * V**2))
+        tplus = 2 * MTarget * (sqrt(MTarget**2 + Qplus**2) - MTarget)
+        tminus = 2 * MTarget * (sqrt(MTarget**2 + Qminus**2) - MTarget)
+
+        t = ttilde * tconv
+        if not ((tplus > tminus) and (t > tminus) and (t < tplus)):
+            continue
+
+        q0 = -t / (2 * MTarget)
+        q = sqrt(t**2 / (4 * MTarget**2) + t)
+        costhetaq = -(V**2 + q**2 + me**2 - (Ebeam + q0 - x * Ebeam) ** 2) / (2 * V * q)
+        if not fabs(costhetaq) <= 1.0:
+            continue
+
+        Y = -t + 2 * q0 * Ebeam - 2 * q * p * (p - k * costheta) * costhetaq / V
+        W = Y**2 - 4 * q**2 * p**2 * k**2 * (1 - costheta**2) * (1 - costhetaq**2) / V**2
+        if not W > 0:
+            continue
+
+        Am2 = -8 * MTarget * (4 * Ebeam**2 * MTarget - t * (2 * Ebeam + MTarget)) * mVsq2mesq
+        A1 = 8 * MTarget**2 / utilde
+        Am1 = (8 / utilde) * (
+            MTarget**2
+            * (
+                2 * t * utilde
+                + utilde**2
+                + 4 * Ebeam**2 * (2 * (x - 1) * mVsq2mesq - t * ((x - 2) * x + 2))
+                + 2 * t * (-(mV**2) + 2 * me**2 + t)
+            )
+            - 2 * Ebeam * MTarget * t * ((1 - x) * utilde + (x - 2) * (mVsq2mesq + t))
+            + t**2 * (utilde - mV**2)
+        )
+        A0 = (8 / utilde**2) * (
+            MTarget**2 * (2 * t * utilde + (t - 4 * Ebeam**2 * (x - 1) ** 2) * mVsq2mesq)
+            + 2 * Ebeam * MTarget * t * (utilde - (x - 1) * mVsq2mesq)
+        )
+        phi_integral = (A0 + Y * A1 + Am1 / sqrt(W) + Y * Am2 / (W * sqrt(W))) / (8 * MTarget**2)
+
+        ans[i] = (
+            Gelastic_inelastic_over_tsquared_c(t, Z, c1, c2, ap2)
+            * alpha_em_cubed
+            * k
+            * Ebeam
+            * phi_integral
+            / (p * sqrt(k**2 + p**2 - 2 * p * k * costheta))
+            * tconv
+            * Jacobian
+        )
+
+    return np.asarray(ans)
@@ -0,0 +1,466 @@
+"""Vectorized NumPy versions of the compiled integrands in xsec_integrands.pyx.
+Used automatically by all_processes when the compiled extension is not available
+(e.g. PETITE was installed without Cython). Same signatures and results, only slower.
+"""
+
+import numpy as np
+
+# Same values as in xsec_integrands.pyx
+m_electron = 0.5109989461e-3  # GeV
+alpha_em = 1.0 / 137.035999139  # fine structure constant
+
+
+def c_dsigma_brem_dimensionless(x, ep, Egamma_min, Z):
+    """Standard Model Bremsstrahlung in the Small-Angle Approximation
+    e (ep) + Z -> e (epp) + gamma (w) + Z
+    Outgoing kinematics given by w, d (delta), dp (delta'), and ph (phi)
+
+    Input parameters needed:
+        ep (incident electron energy)
+        Z (Target Atomic Number)
+    """
+    x = np.asarray(x, dtype=float)
+    ans = np.zeros(x.shape[0])
+
+    w = Egamma_min + x[:, 0] * (ep - m_electron - Egamma_min)
+    d = ep / (2 * m_electron) * (x[:, 1] + x[:, 2])
+    dp = ep / (2 * m_electron) * (x[:, 1] - x[:, 2])
+    ph = (x[:, 3] - 0.5) * 2 * np.pi
+
+    epp = ep - w
+
+    allowed_kinematics = (
+        (Egamma_min < w)
+        & (w < ep - m_electron)
+        & (m_electron < epp)
+        & (epp < ep)
+        & (d > 0.0)
+        & (dp > 0.0)
+    )
+    w, d, dp, ph, epp = (
+        w[allowed_kinematics],
+        d[allowed_kinematics],
+        dp[allowed_kinematics],
+        ph[allowed_kinematics],
+        epp[allowed_kinematics],
+    )
+
+    qsq = m_electron**2 * (
+        (d**2 + dp**2 - 2 * d * dp * np.cos(ph))
+        + m_electron**2 * ((1 + d**2) / (2 * ep) - (1 + dp**2) / (2 * epp)) ** 2
+    )
+    PF = (
+        8.0
+        / np.pi
+        * alpha_em
+        * (alpha_em / m_electron) ** 2
+        * (epp * m_electron**4)
+        / (w * ep * qsq**2)
+        * d
+        * dp
+    )
+    jacobian_factor = np.pi * ep**2 * (ep - m_electron - Egamma_min) / m_electron**2
+    FF = g2_elastic_c(Z, qsq)
+    T1 = d**2 / (1 + d**2) ** 2
+    T2 = dp**2 / (1 + dp**2) ** 2
+    T3 = w**2 / (2 * ep * epp) * (d**2 + dp**2) / ((1 + d**2) * (1 + dp**2))
+    T4 = -(epp / ep + ep / epp) * (d * dp * np.cos(ph)) / ((1 + d**2) * (1 + dp**2))
+
+    ans[allowed_kinematics] = PF * (T1 + T2 + T3 + T4) * jacobian_factor * FF
+    return ans
+
+
+def c_dsigma_pairprod_dimensionless(x, w, Z):
+    """Standard Model Pair Production in the Small-Angle Approximation
+    gamma (w) + Z -> e+ (epp) + e- (epm) + Z
+    Outgoing kinematics given by epp, dp (delta+), dm (delta-), and ph (phi)
+
+    Input parameters needed:
+        w (incident photon energy)
+        Z (Target Atomic Number)
+    """
+    x = np.asarray(x, dtype=float)
+    ans = np.zeros(x.shape[0])
+
+    epp = m_electron + x[:, 0] * (w - 2 * m_electron)
+    dp = w / (2 * m_electron) * (x[:, 1] + x[:, 2])
+    dm = w / (2 * m_electron) * (x[:, 1] - x[:, 2])
+    ph = x[:, 3] * 2 * np.pi
+
+    # Positron energy
+    epm = w - epp
+
+    allowed_kinematics = (
+        (m_electron < epm)
+        & (m_electron < epp)
+        & (epm < w)
+        & (epp < w)
+        & (dm > 0.0)
+        & (dp > 0.0)
+    )
+    epp, epm, dp, dm, ph = (
+        epp[allowed_kinematics],
+        epm[allowed_kinematics],
+        dp[allowed_kinematics],
+        dm[allowed_kinematics],
+        ph[allowed_kinematics],
+    )
+
+    qsq_over_m_electron_sq = (dp**2 + dm**2 + 2.0 * dp * dm * np.cos(ph)) + m_electron**2 * (
+        (1.0 + dp**2) / (2.0 * epp) + (1.0 + dm**2) / (2.0 * epm)
+    ) ** 2
+
+    PF = (
+        8.0
+        / np.pi
+        * alpha_em
+        * (alpha_em / m_electron) ** 2
+        * epp
+        * epm
+        / (w**3 * qsq_over_m_electron_sq**2)
+        * dp
+        * dm
+    )
+
+    jacobian_factor = np.pi * w**2 * (w - 2 * m_electron) / m_electron**2
+    FF = g2_elastic_c(Z, m_electron**2 * qsq_over_m_electron_sq)
+
+    T1 = -1.0 * dp**2 / (1.0 + dp**2) ** 2
+    T2 = -1.0 * dm**2 / (1.0 + dm**2) ** 2
+    T3 = w**2 / (2.0 * epp * epm) * (dp**2 + dm**2) / ((1.0 + dp**2) * (1.0 + dm**2))
+    T4 = (epp / epm + epm / epp) * (dp * dm * np.cos(ph)) / ((1.0 + dp**2) * (1.0 + dm**2))
+
+    ans[allowed_kinematics] = PF * (T1 + T2 + T3 + T4) * jacobian_factor * FF
+    return ans
+
+
+def aa_c(Z):
+    """Support function for atomic form factors"""
+    return 184.15 * (2.718) ** -0.5 * Z ** (-1.0 / 3.0) / m_electron
+
+
+def g2_elastic_c(Z, t):
+    """Elastic form factor"""
+    a0 = aa_c(Z)
+    return Z**2 * a0**4 * t**2 / (1 + a0**2 * t) ** 2
+
+
+# Kernels of the one-dimensional SM processes and of the dark processes,
+# same values as in physical_constants.py (see xsec_integrands.pyx)
+m_electron_pdg = 510.998950e-6  # GeV
+alpha_em_pdg = 1.0 / 137.035999
+m_proton_pdg = 938.272088e-3  # GeV
+mu_p = 2.79
+
+
+def c_dsigma_compton_dCT(x, Eg, mV):
+    """Compton Scattering of a Photon off an at-rest Electron, producing either a photon or a Dark Vector
+    gamma (Eg) + e- (me) -> e- + gamma/V
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Eg (incident photon energy)
+        mV (Dark Vector Mass -- can be set to zero for SM Case)
+    """
+    me = m_electron_pdg
+    ct = np.asarray(x, dtype=float)[:, 0]
+    s = me**2 + 2 * Eg * me
+    if not s > (me + mV) ** 2:
+        return np.zeros(len(ct))
+
+    sqrt_lambda = np.sqrt(me**4 + (mV**2 - s) ** 2 - 2 * me**2 * (mV**2 + s))
+    jacobian = (s - me**2) / (2 * s) * sqrt_lambda
+    PF = 2.0 * np.pi * alpha_em_pdg**2 / (s - me**2) ** 2
+
+    t = (
+        -0.5
+        * (
+            me**4
+            + s * (-(mV**2) + s + ct * sqrt_lambda)
+            - me**2 * (mV**2 + 2 * s + ct * sqrt_lambda)
+        )
+        / s
+    )
+    if mV == 0.0:
+        T1 = (6.0 * me**2 * s + 3.0 * me**4 - s**2) / ((me**2 - s) * (-(me**2) + s + t))
+        T2 = 4 * me**4 / (s + t - me**2) ** 2
+        T3 = (t * (s - me**2) + (s + me**2) ** 2) / (s - me**2) ** 2
+    else:
+        T1 = (
+            2.0 * me**2 * (mV**2 - 3 * s) - 3 * me**4 - 2 * mV**2 * s + 2 * mV**4 + s**2
+        ) / ((me**2 - s) * (me**2 + mV**2 - s - t))
+        T2 = (2 * me**2 * (2 * me**2 + mV**2)) / (me**2 + mV**2 - s - t) ** 2
+        T3 = ((me**2 + s) * (me**2 + mV**2 + s) + t * (s - me**2)) / (me**2 - s) ** 2
+
+    return PF * jacobian * (T1 + T2 + T3)
+
+
+def c_dsigma_annihilation_dCT(x, Ee, mV, EgMin):
+    """Annihilation of a Positron and Electron into a Photon and a (Dark) Photon
+    e+ (Ee) + e- (me) -> gamma + gamma/V
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Ee (incident positron energy)
+        mV (Dark Vector Mass -- can be set to zero for SM Case)
+        EgMin (minimum lab-frame energy of the outgoing photons)
+    """
+    me = m_electron_pdg
+    ct = np.asarray(x, dtype=float)[:, 0]
+    s = 2.0 * me * (Ee + me)
+    if s < mV**2:
+        return np.zeros(len(ct))
+
+    ctMax = (
+        np.sqrt((Ee + me) / (Ee - me))
+        * (2 * me * (Ee - 2 * EgMin + me) - mV**2)
+        / (2 * me * (Ee + me) - mV**2)
+    )
+    b = np.sqrt(1.0 - 4.0 * me**2 / s)
+
+    return np.where(
+        ct > ctMax,
+        0.0,
+        4.0
+        * np.pi
+        * alpha_em_pdg**2
+        / (s * (1 - b**2 * ct**2))
+        * ((s - mV**2) / (2 * s) * (1 + ct**2) + 2.0 * mV**2 / (s - mV**2)),
+    )
+
+
+def c_dsigma_moller_dCT(x, Ee, DE):
+    """Moller Scattering of an Electron off an at-rest Electron
+    e- (Ee) + e- (me) -> e- + e-
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Ee (incident electron energy)
+        DE (minimum energy of the outgoing electrons)
+    """
+    me = m_electron_pdg
+    ct = np.asarray(x, dtype=float)[:, 0]
+    delta_ct_limit = 2.0 * DE / (Ee - me)
+    s = me**2 + 2 * Ee * me
+
+    allowed_kinematics = (ct > -1 + delta_ct_limit) & (ct < 1.0 - delta_ct_limit)
+    return np.where(
+        allowed_kinematics,
+        16
+        * np.pi**2
+        * alpha_em_pdg**2
+        * (
+            s**2 * (3 + ct**2) ** 2
+            - 8 * me**2 * s * (7 + ct**4)
+            + 16 * me**4 * (6 - 3 * ct**2 + ct**4)
+        )
+        / (8 * np.pi * s * (s - 4 * me**2) ** 2 * (1 - ct) ** 2 * (1 + ct) ** 2),
+        0.0,
+    )
+
+
+def c_dsigma_bhabha_dCT(x, Ee, DE):
+    """Bhabha Scattering of a Positron off an at-rest Electron
+    e+ (Ee) + e- (me) -> e+ + e-
+    Outgoing kinematics given by ct (cosine of the scattering angle)
+
+    Input parameters needed:
+        Ee (incident positron energy)
+        DE (minimum energy of the outgoing electrons)
+    """
+    me = m_electron_pdg
+    ct = np.asarray(x, dtype=float)[:, 0]
+    delta_ct_limit = 2.0 * DE / (Ee - me)
+    s = me**2 + 2 * Ee * me
+
+    allowed_kinematics = (ct > -1 + delta_ct_limit) & (ct < 1.0 - delta_ct_limit)
+    return np.where(
+        allowed_kinematics,
+        (
+            alpha_em_pdg**2
+            * np.pi
+            * (
+                256 * (-1 + ct) ** 2 * ct**2 * me**8
+                - 128 * (-1 + ct) * (1 + ct * (1 + ct) * (-3 + 2 * ct)) * me**6 * s
+                + 16 * (7 + ct * (2 + ct * (-5 + 6 * (-1 + ct) * ct))) * me**4 * s**2
+                - 8 * (7 + ct * (-3 + ct * (3 + ct * (-1 + 2 * ct)))) * me**2 * s**3
+                + (3 + ct**2) ** 2 * s**4
+            )
+        )
+        / (2 * (-1 + ct) ** 2 * s**3 * (-4 * me**2 + s) ** 2),
+        0.0,
+    )
+
+
+def fl_kf_c(x, beta):
+    """Kuraev-Fadin lepton structure function (see radiative_return.fl_kf)"""
+    return (beta / 16.0) * (
+        (8.0 + 3.0 * beta) * np.power(1.0 - x, beta / 2.0 - 1.0) - 4.0 * (1.0 + x)
+    )
+
+
+def fl_kf_scaled_c(x, beta):
+    """Kuraev-Fadin lepton structure function times (1-x)^(1-beta/2) (see radiative_return.fl_kf_scaled)"""
+    return (beta / 16.0) * (
+        (8.0 + 3.0 * beta) - 4.0 * (1.0 + x) * np.power(1.0 - x, 1.0 - beta / 2.0)
+    )
+
+
+def c_dsigma_radiative_return_du(x, Ee, mV):
+    """Radiative return cross-section e^+ e^- > V differential with respect to u = (1-x)^(beta/2)/umax,
+    where x is the fraction of initial CM momentum carried by one of beam particles
+
+    Input parameters needed:
+        Ee (incident positron energy)
+        mV (Dark Vector Mass)
+    """
+    me = m_electron_pdg
+    u0 = np.asarray(x, dtype=float)[:, 0]
+    s = 2.0 * me * (Ee + me)
+    y = mV**2 / s
+    if s < mV**2:
+        return np.zeros(len(u0))
+
+    beta = (2.0 * alpha_em_pdg / np.pi) * (np.log(s / me**2) - 1.0)
+    umax = np.power(1.0 - y, beta / 2.0)
+    betaf = np.sqrt(1.0 - 4.0 * (me**2) / (mV**2))
+    prefac = (
+        (4.0 * np.pi**2) * alpha_em_pdg * betaf * (3.0 / 2.0 - betaf**2 / 2.0) / s * umax
+    )
+
+    x1 = 1.0 - np.power(u0 * umax, 2.0 / beta)
+    x2 = y / x1
+    allowed_kinematics = (x2 < 1.0) & (x1 > 0.0) & (u0 < 1.0)
+    # transformed_lepton_luminosity_integrand(s, y, u0 * umax)
+    return np.where(
+        allowed_kinematics,
+        2.0
+        * prefac
+        * fl_kf_c(y / x1, beta)
+        * fl_kf_scaled_c(x1, beta)
+        * (1.0 / x1)
+        * (2.0 / beta),
+        0.0,
+    )
+
+
+def Gelastic_inelastic_over_tsquared_c(Z, A, t):
+    """Form factor squared of dark bremsstrahlung rescaled by 1/t^2 (see all_processes.Gelastic_inelastic_over_tsquared)"""
+    c1 = (111 * Z ** (-1.0 / 3.0) / m_electron_pdg) ** 2
+    c2 = 0.164 * A ** (-2.0 / 3.0)
+    Gel = (1.0 / (1.0 + c1 * t)) ** 2 / (1 + t / c2) ** 2
+    ap2 = (773.0 * Z ** (-2.0 / 3.0) / m_electron_pdg) ** 2
+    Ginel = (
+        Z
+        / (c1**2 * Z**2)
+        * (ap2 / (1.0 + ap2 * t)) ** 2
+        * ((1.0 + (mu_p**2 - 1.0) * t / (4.0 * m_proton_pdg**2)) / (1.0 + t / 0.71) ** 4)
+    )
+    return Z**2 * c1**2 * (Gel + Ginel)
+
+
+def c_dsig_dx_dcostheta_dark_brem_exact_tree_level(
+    x_list, Ebeam, mV, MTarget, Z, A, log_method
+):
+    """Exact Tree-Level Dark Photon Bremsstrahlung
+    e (ep) + Z -> e (epp) + V (w) + Z
+    result it dsigma/dx/dcostheta where x=E_darkphoton/E_beam and theta is angle between beam and dark photon
+
+    Input parameters needed:
+        Ebeam (incident electron energy)
+        mV (mass of dark photon)
+        MTarget (Target mass)
+        Z, A (Target charge and atomic mass number)
+        log_method (whether the kinematic parameters are x, log10(1-costheta), log10(ttilde),
+            as for event_info['Method'] = 'Log', or x, costheta, ttilde)
+    """
+    me = m_electron_pdg
+    x0, x1, x2 = np.asarray(x_list, dtype=float).T
+    if log_method:
+        x, l1mct, lttilde = x0, x1, x2
+        one_minus_costheta = 10**l1mct
+        costheta = 1.0 - one_minus_costheta
+        ttilde = 10**lttilde
+        Jacobian = one_minus_costheta * ttilde * np.log(10.0) ** 2
+    else:
+        x, costheta, ttilde = x0, x1, x2
+        Jacobian = 1.0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        k = np.sqrt((x * Ebeam) ** 2 - mV**2)
+        p = np.sqrt(Ebeam**2 - me**2)
+        V = np.sqrt(p**2 + k**2 - 2 * p * k * costheta)
+        utilde = -2 * (x * Ebeam**2 - k * p * costheta) + mV**2
+        # Recoil energy available to the target
+        EX = (1 - x) * Ebeam + MTarget
+        discr = utilde**2 + 4 * MTarget * utilde * EX + 4 * MTarget**2 * V**2
+
+        # NOTE: safe sqrt -- points with discr < 0 are killed afterwards
+        Qplus = np.fabs(
+            (V * (utilde + 2 * MTarget * EX) + EX * np.sqrt(np.abs(discr)))
+            / (2 * EX**2 - 2 * V**2)
+        )
+        Qminus = np.fabs(
+            (V * (utilde + 2 * MTarget * EX) - EX * np.sqrt(np.abs(discr)))
+            / (2 * EX**2 - 2 * V**2)
+        )
+        tplus = 2 * MTarget * (np.sqrt(MTarget**2 + Qplus**2) - MTarget)
+        tminus = 2 * MTarget * (np.sqrt(MTarget**2 + Qminus**2) - MTarget)
+
+        tconv = (
+            2
+            * MTarget
+            * (MTarget + Ebeam)
+            * np.sqrt(Ebeam**2 + me**2)
+            / (MTarget * (MTarget + 2 * Ebeam) + me**2)
+        ) ** 2
+        t = ttilde * tconv
+
+        q0 = -t / (2 * MTarget)
+        q = np.sqrt(t**2 / (4 * MTarget**2) + t)
+        costhetaq = -(V**2 + q**2 + me**2 - (Ebeam + q0 - x * Ebeam) ** 2) / (2 * V * q)
+
+        mVsq2mesq = mV**2 + 2 * me**2
+        Am2 = -8 * MTarget * (4 * Ebeam**2 * MTarget - t * (2 * Ebeam + MTarget)) * mVsq2mesq
+        A1 = 8 * MTarget**2 / utilde
+        Am1 = (8 / utilde) * (
+            MTarget**2
+            * (
+                2 * t * utilde
+                + utilde**2
+                + 4 * Ebeam**2 * (2 * (x - 1) * mVsq2mesq - t * ((x - 2) * x + 2))
+                + 2 * t * (-(mV**2) + 2 * me**2 + t)
+            )
+            - 2 * Ebeam * MTarget * t * ((1 - x) * utilde + (x - 2) * (mVsq2mesq + t))
+            + t**2 * (utilde - mV**2)
+        )
+        A0 = (8 / utilde**2) * (
+            MTarget**2 * (2 * t * utilde + (t - 4 * Ebeam**2 * (x - 1) ** 2) * mVsq2mesq)
+            + 2 * Ebeam * MTarget * t * (utilde - (x - 1) * mVsq2mesq)
+        )
+        Y = -t + 2 * q0 * Ebeam - 2 * q * p * (p - k * costheta) * costhetaq / V
+        W = Y**2 - 4 * q**2 * p**2 * k**2 * (1 - costheta**2) * (1 - costhetaq**2) / V**2
+
+        phi_integral = (A0 + Y * A1 + Am1 / np.sqrt(W) + Y * Am2 / W**1.5) / (
+            8 * MTarget**2
+        )
+        ans = (
+            Gelastic_inelastic_over_tsquared_c(Z, A, t)
+            * alpha_em_pdg**3
+            * k
+            * Ebeam
+            * phi_integral
+            / (p * np.sqrt(k**2 + p**2 - 2 * p * k * costheta))
+        )
+
+    # kinematic boundaries
+    allowed_kinematics = (
+        (x * Ebeam >= mV)
+        & (discr >= 0)
+        & (tplus > tminus)
+        & (t > tminus)
+        & (t < tplus)
+        & (np.fabs(costhetaq) <= 1.0)
+        & (W > 0)
+    )
+    return np.where(allowed_kinematics, ans * tconv * Jacobian, 0.0)
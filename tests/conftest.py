@@ -0,0 +1,70 @@
+"""Shared fixtures of the test suite.
+
+tests/data/library is a small library for graphite: 10 energies between 0.01 and 10 GeV for
+the SM processes, and 6 energies for the dark processes with mV = 0.01, 0.03, 0.1 and 0.3 GeV.
+It was built from the utilities directory with
+
+    python build_library.py -save_location=../tests/data/library/ -process all -process_targets graphite \\
+        -min_energy 0.01 -max_energy 10 -num_energy_pts 10 -neval 300 -n_trials 10
+    python build_library.py -save_location=../tests/data/library/ -process dark -process_targets graphite \\
+        -mV 0.01 0.03 0.1 0.3 -min_energy 0.01 -max_energy 10 -num_energy_pts 6 -neval 300 -n_trials 10
+
+(keeping only the library files).
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from PETITE.physical_constants import alpha_em, m_electron
+from PETITE.shower import diff_xsection_options
+
+LIBRARY_DIR = os.path.join(os.path.dirname(__file__), "data", "library") + "/"
+
+
+@pytest.fixture(scope="session")
+def library_dir():
+    """Directory of the fixture library (must not be modified)"""
+    return LIBRARY_DIR
+
+
+@pytest.fixture
+def library_copy(tmp_path):
+    """Copy of the fixture library that tests may modify"""
+    directory = str(tmp_path / "library") + "/"
+    shutil.copytree(LIBRARY_DIR, directory)
+    return directory
+
+
+def two_sample_z(a, b):
+    """z-scores of the differences between the means of the columns of two samples"""
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return (a.mean(axis=0) - b.mean(axis=0)) / np.sqrt(
+        a.var(axis=0, ddof=1) / len(a) + b.var(axis=0, ddof=1) / len(b)
+    )
+
+
+def analytic_cdf(shower, process, energy):
+    """CDF of cos(theta) of a one-dimensional process at energy, integrated from its
+    differential cross section on a grid refined toward both ends of the range"""
+    ct_min, ct_max = (limit[0] for limit in shower._one_dim_range(process, [energy]))
+    steps = np.geomspace(1e-10, 1.0, 20000) * (ct_max - ct_min)
+    ct = np.unique(np.concatenate([ct_min + steps, ct_max - steps, [ct_min, ct_max]]))
+    event_info = {
+        "E_inc": energy,
+        "m_e": m_electron,
+        "Z_T": shower.target.Z,
+        "A_T": shower.target.A,
+        "mT": shower.target.A,
+        "alpha_FS": alpha_em,
+        "mV": 0,
+        "Eg_min": shower._Egamma_min,
+        "Ee_min": shower._Ee_min,
+        "process": process,
+    }
+    integrand = diff_xsection_options[process](event_info, 1)
+    dsigma = np.nan_to_num(np.ravel(integrand(ct[:, np.newaxis])))
+    cdf = np.concatenate([[0.0], np.cumsum((dsigma[1:] + dsigma[:-1]) / 2 * np.diff(ct))])
+    return lambda x: np.interp(x, ct, cdf / cdf[-1])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from conftest import two_sample_z
+
+from PETITE.particle import Particle
+from PETITE.shower import Shower
+
+
+def shower_summaries(showers):
+    """Per shower: number of particles, of photons, electrons and positrons, and the sum of
+    the initial energies of its particles"""
+    summaries = []
+    for shower in showers:
+        PIDs = np.array([particle.get_ids()["PID"] for particle in shower])
+        energies = np.array([particle.get_p0()[0] for particle in shower])
+        summaries.append(
+            [
+                len(shower),
+                np.sum(PIDs == 22),
+                np.sum(PIDs == 11),
+                np.sum(PIDs == -11),
+                np.sum(energies),
+            ]
+        )
+    return np.array(summaries, dtype=float)
+
+
+@pytest.mark.parametrize("PID", [11, 22])
+def test_batched_engine_matches_scalar_engine(library_dir, PID):
+    n_showers = 100
+
+    def initial_particles():
+        return [
+            Particle([1.0, 0, 0, 1.0], [0, 0, 0], {"PID": PID}) for _ in range(n_showers)
+        ]
+
+    shower = Shower(library_dir, "graphite", 0.02, seed=1)
+    scalar = shower_summaries([shower.generate_shower(p0) for p0 in initial_particles()])
+    shower = Shower(library_dir, "graphite", 0.02, seed=2)
+    batched = shower_summaries(shower.generate_showers_batched(initial_particles()))
+
+    assert np.all(np.abs(two_sample_z(scalar, batched)) < 4)
+
+
+def test_batched_shower_bookkeeping(library_dir):
+    """Each shower starts with a copy of its initial particle, and every particle of the
+    showers above min_energy has ended"""
+    shower = Shower(library_dir, "graphite", 0.02, seed=3)
+    p0s = [Particle([E, 0, 0, E], [0, 0, 0], {"PID": 11}) for E in [0.01, 0.5, 2.0]]
+    showers = shower.generate_showers_batched(p0s)
+
+    assert len(showers) == 3
+    assert len(showers[0]) == 1  # below min_energy
+    for p0, particles in zip(p0s, showers):
+        np.testing.assert_array_equal(particles[0].get_p0(), p0.get_p0())
+    for particles in showers[1:]:
+        assert all(particle.get_ended() for particle in particles)
+    assert len(showers[2]) > len(showers[1]) > 1
@@ -0,0 +1,198 @@
+import contextlib
+import io
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from PETITE.dark_shower import DarkShower
+from PETITE.library import (
+    LIBRARY_PICKLES,
+    LazySampleInfo,
+    binary_cross_section_dict,
+    binary_sample_dict,
+    binary_xsec_interpolators,
+    convert_library,
+    load_binary_array,
+    publish_library,
+)
+from PETITE.shower import Shower
+
+
+def load_pickle(library_dir, file_name):
+    with open(os.path.join(library_dir, file_name), "rb") as f:
+        return pickle.load(f)
+
+
+def map_grid(adaptive_map):
+    """Grid of an adaptive map without the padding of its increments"""
+    grid = np.array(adaptive_map.grid)
+    return [grid[dim, : ninc + 1] for dim, ninc in enumerate(adaptive_map.ninc)]
+
+
+def assert_same_samples(samples, expected, targets):
+    """samples and expected are {process: [[E, sample_dict], ...]} structures"""
+    assert samples.keys() == expected.keys()
+    for process in expected:
+        assert len(samples[process]) == len(expected[process])
+        for (energy, sample_dict), (expected_energy, expected_dict) in zip(
+            samples[process], expected[process]
+        ):
+            assert energy == expected_energy
+            assert sample_dict["neval"] == expected_dict["neval"]
+            for key in ["Eg_min", "Ee_min"]:
+                assert sample_dict.get(key) == expected_dict.get(key)
+            for target in targets:
+                assert sample_dict["max_F"][target] == expected_dict["max_F"][target]
+                np.testing.assert_array_equal(
+                    sample_dict["max_F_strata"][target],
+                    expected_dict["max_F_strata"][target],
+                )
+            for grid, expected_grid in zip(
+                map_grid(sample_dict["adaptive_map"]),
+                map_grid(expected_dict["adaptive_map"]),
+            ):
+                np.testing.assert_array_equal(grid, expected_grid)
+
+
+@pytest.fixture
+def binary_dir(library_copy):
+    return convert_library(library_copy)
+
+
+def test_convert_library_round_trip(library_copy, binary_dir):
+    sm_maps = load_pickle(library_copy, "sm_maps.pkl")
+    targets = list(sm_maps["Brem"][0][1]["max_F"])
+    assert_same_samples(binary_sample_dict(binary_dir), sm_maps, targets)
+
+    sm_xsec = load_pickle(library_copy, "sm_xsec.pkl")
+    cross_sections = binary_cross_section_dict(binary_dir)
+    assert cross_sections.keys() == sm_xsec.keys()
+    for process in sm_xsec:
+        for target, table in sm_xsec[process].items():
+            np.testing.assert_array_equal(cross_sections[process][target], table)
+
+    xsec_interp = load_pickle(library_copy, "sm_xsec_interp.pkl")
+    invmfp_interp = load_pickle(library_copy, "sm_invmfp_interp.pkl")
+    nsigma, invmfp = binary_xsec_interpolators(binary_dir)
+    for process in xsec_interp:
+        for key in ["Emin", "Emax"]:
+            assert nsigma[process][key] == xsec_interp[process][key]
+        for target in targets:
+            for interpolator, expected in [
+                (nsigma[process][target], xsec_interp[process][target]),
+                (invmfp[process][target], invmfp_interp[process][target]),
+            ]:
+                energies = np.geomspace(expected.x[0], expected.x[-1], 50)
+                np.testing.assert_array_equal(interpolator(energies), expected(energies))
+
+    dark_maps = load_pickle(library_copy, "dark_maps.pkl")
+    dark_xsec = load_pickle(library_copy, "dark_xsec.pkl")
+    for mV in dark_maps:
+        assert_same_samples(binary_sample_dict(binary_dir, mV=mV), dark_maps[mV], targets)
+        dark_cross_sections = binary_cross_section_dict(binary_dir, mV=mV)
+        for process in dark_xsec[mV]:
+            for target, table in dark_xsec[mV][process].items():
+                np.testing.assert_array_equal(dark_cross_sections[process][target], table)
+
+
+def test_lazy_reads(binary_dir):
+    samples = binary_sample_dict(binary_dir, target="graphite")
+    sample_info = samples["Brem"][3][1]
+    assert isinstance(sample_info, LazySampleInfo)
+    assert list(sample_info["max_F"]) == ["graphite"]
+    # The adaptive map is only rebuilt when it is requested
+    assert "adaptive_map" not in sample_info._values
+    sample_info["adaptive_map"]
+    assert "adaptive_map" in sample_info._values
+    assert "adaptive_map" not in samples["Brem"][4][1]._values
+
+    # The arrays are memory-mapped and read-only
+    grids = load_binary_array(binary_dir, "sm_Brem_grids.npy")
+    assert isinstance(grids.base, np.memmap)
+    assert not grids.flags.writeable
+    # and shared between calls
+    assert binary_sample_dict(binary_dir, target="graphite") is samples
+
+
+def test_binary_shower_matches_pickle(library_copy, binary_dir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        pickled = Shower(library_copy, "graphite", 0.02)
+        binary = Shower(library_copy, "graphite", 0.02, library_format="binary")
+    assert_same_samples(binary._loaded_samples, pickled._loaded_samples, ["graphite"])
+
+    for process in ["Brem", "PairProd", "Ann", "Comp", "Moller", "Bhabha"]:
+        np.testing.assert_array_equal(
+            binary.load_cross_section(library_copy, process, "graphite"),
+            pickled.load_cross_section(library_copy, process, "graphite"),
+        )
+    energies = np.geomspace(0.01, 10.0, 40)
+    for attribute in ["_NSigmaBrem", "_NSigmaComp", "_interaction_integral_Ann"]:
+        np.testing.assert_array_equal(
+            getattr(binary, attribute)(energies), getattr(pickled, attribute)(energies)
+        )
+    # Interpolators built from the cross section tables
+    with contextlib.redirect_stdout(io.StringIO()):
+        pickled_tables, binary_tables = [
+            Shower(
+                library_copy,
+                "graphite",
+                0.02,
+                library_format=library_format,
+                load_xsec_interp=False,
+            )
+            for library_format in ["pickle", "binary"]
+        ]
+    for attribute in ["_NSigmaPP", "_NSigmaAnn", "_interaction_integral_Brem"]:
+        np.testing.assert_array_equal(
+            getattr(binary_tables, attribute)(energies),
+            getattr(pickled_tables, attribute)(energies),
+        )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for shower in [pickled, binary]:
+            np.random.seed(3)
+            shower.draws = shower.draw_samples(np.geomspace(0.05, 5.0, 30), "PairProd")
+    np.testing.assert_array_equal(binary.draws, pickled.draws)
+
+
+def test_binary_dark_shower_matches_pickle(library_copy, binary_dir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        pickled = DarkShower(library_copy, "graphite", 0.02, 0.1)
+        binary = DarkShower(library_copy, "graphite", 0.02, 0.1, library_format="binary")
+    assert_same_samples(
+        binary._loaded_dark_samples, pickled._loaded_dark_samples, ["graphite"]
+    )
+    np.testing.assert_array_equal(binary.get_DarkBremXSec(), pickled.get_DarkBremXSec())
+    np.testing.assert_array_equal(binary.get_DarkAnnXSec(), pickled.get_DarkAnnXSec())
+
+
+def test_publish_library(library_copy):
+    library_dir = publish_library(library_copy)
+    manifest_path = os.path.join(library_dir, "manifest.json")
+    assert os.path.exists(manifest_path)
+
+    # Up to date: not converted again
+    os.utime(manifest_path, (1.2e9, 1.2e9))
+    for file_name in LIBRARY_PICKLES:
+        os.utime(os.path.join(library_copy, file_name), (1.1e9, 1.1e9))
+    assert publish_library(library_copy) == library_dir
+    assert os.path.getmtime(manifest_path) == 1.2e9
+
+    # Converted again when a pickle is newer than the binary library
+    os.utime(os.path.join(library_copy, "sm_maps.pkl"), (1.3e9, 1.3e9))
+    publish_library(library_copy)
+    assert os.path.getmtime(manifest_path) > 1.3e9
+
+    # or when its format is outdated
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest["format_version"] = -1
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    os.utime(manifest_path, (1.4e9, 1.4e9))
+    publish_library(library_copy)
+    with open(manifest_path) as f:
+        assert json.load(f)["format_version"] != -1
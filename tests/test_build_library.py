@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "utilities"))
+build_library = pytest.importorskip("build_library")
+
+config = {
+    "save_location": "",
+    "process": ["Comp"],
+    "process_targets": ["graphite"],
+    "mV_list": [],
+    "min_energy": 0.01,
+    "max_energy": 1.0,
+    "num_energy_pts": 6,
+    "training_target": "hydrogen",
+    "mT": 1.0,
+    "neval": 100,
+    "n_trials": 1,
+    "n_strata": 2,
+    "warm_start": True,
+    "chain_length": 3,
+}
+
+
+def integrators(tasks):
+    return {
+        task["spec"]["E_inc"]: identifier
+        for identifier, task in tasks.items()
+        if task["kind"] == "integrator"
+    }
+
+
+def test_warm_start_ids_follow_their_seed(monkeypatch):
+    """Changing an energy of a chain changes the ids of the integrators trained from it,
+    and only those"""
+    grid = build_library.energy_grid("Comp", 0.0, 0.01, 1.0, 6)
+    tasks = integrators(build_library.expand_jobs(config))
+    assert integrators(build_library.expand_jobs(config)) == tasks
+
+    # The first chain (3 energies) is retrained, the second one does not depend on it
+    monkeypatch.setattr(build_library, "energy_grid", lambda *args: [0.011] + grid[1:])
+    changed = integrators(build_library.expand_jobs(config))
+    for energy in grid[1:3]:
+        assert changed[energy] != tasks[energy]
+    for energy in grid[3:]:
+        assert changed[energy] == tasks[energy]
+
+
+def test_refined_energy_id_follows_its_seed():
+    refinement = [[["Comp", 0.0, 0.015]]]
+    tasks = build_library.expand_jobs(config, refinement)
+    seeded = [task for task in tasks.values() if task["spec"]["E_inc"] == 0.015]
+    integrator = [task for task in seeded if task["kind"] == "integrator"][0]
+    seed_id = integrators(tasks)[min(integrators(tasks))]
+    assert integrator["spec"]["warm_start"]["seed"] == seed_id
+    assert integrator["seed"] == tasks[seed_id]["output"]
+
+
+def test_missing_seed_raises(tmp_path):
+    tasks = build_library.expand_jobs(config)
+    identifier, task = next(
+        (identifier, task)
+        for identifier, task in tasks.items()
+        if task["kind"] == "integrator" and "seed" in task
+    )
+    with pytest.raises(FileNotFoundError):
+        build_library.run_task(str(tmp_path) + "/", identifier, task)
@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+import time
+
+from PETITE.library import cached_dark_table, load_dark_table
+
+n_processes = 4
+
+
+def compute_table(marker_file, mV):
+    """Dark table whose computations are recorded in marker_file"""
+    with open(marker_file, "a") as f:
+        f.write(f"{os.getpid()} {mV}\n")
+    # Long enough for the other processes to ask for the table in the meantime
+    time.sleep(0.3)
+    return {"weights": [[1.0, mV]]}
+
+
+def request_table(table_dir, marker_file, mV, barrier, results):
+    barrier.wait()
+    table = cached_dark_table(
+        table_dir, "dark_weights", mV, "graphite", lambda: compute_table(marker_file, mV)
+    )
+    results.put((mV, table))
+
+
+def test_concurrent_requests_compute_once(tmp_path):
+    table_dir = str(tmp_path) + "/"
+    marker_file = str(tmp_path / "computed.txt")
+    masses = [0.01, 0.01, 0.01, 0.03]
+
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(len(masses))
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=request_table, args=(table_dir, marker_file, mV, barrier, results)
+        )
+        for mV in masses
+    ]
+    for process in processes:
+        process.start()
+    tables = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    # Each shard is computed by exactly one process, all of them get its table
+    with open(marker_file) as f:
+        computed = sorted(float(line.split()[1]) for line in f)
+    assert computed == [0.01, 0.03]
+    for mV, table in tables:
+        assert table == {"weights": [[1.0, mV]]}
+        assert load_dark_table(table_dir, "dark_weights", mV, "graphite") == table
+    assert not any(name.endswith(".tmp") for name in os.listdir(table_dir + "dark_tables"))
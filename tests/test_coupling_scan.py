@@ -0,0 +1,130 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from PETITE.dark_shower import DarkShower, coupling_scan, decay_in_volume_probability
+from PETITE.particle import Particle
+
+mV = 0.05
+
+
+def dark_particle(energy, direction, r0, weight):
+    """Dark vector of mass mV with energy along direction, produced at r0"""
+    direction = np.asarray(direction, dtype=float) / np.linalg.norm(direction)
+    p_abs = np.sqrt(energy**2 - mV**2)
+    return Particle(
+        np.concatenate([[energy], p_abs * direction]),
+        np.asarray(r0, dtype=float),
+        {"PID": 4900022, "mass": mV, "weight": weight},
+    )
+
+
+def decay_length(energy, ctau):
+    return np.sqrt(energy**2 - mV**2) / mV * ctau
+
+
+def test_decay_in_volume_probability():
+    z_min, z_max, ctau = 10.0, 30.0, 0.2
+    cases = [
+        # energy, direction, production point, probability for a single ctau
+        (2.0, [0, 0, 1], [0, 0, 0], None),
+        (5.0, [0.6, 0, 0.8], [0.1, 0, 1.0], None),
+        # produced inside the decay volume: only the exit plane matters
+        (1.0, [0, 0, 1], [0, 0, 18.0], 1 - np.exp(-12.0 / decay_length(1.0, ctau))),
+        # produced beyond the decay volume, or moving away from it
+        (3.0, [0, 0, 1], [0, 0, 35.0], 0.0),
+        (3.0, [0, 0.6, -0.8], [0, 0, 0], 0.0),
+    ]
+    particles = [dark_particle(E, d, r0, 1.0) for E, d, r0, _ in cases]
+    p4 = np.array([p.get_p0() for p in particles])
+    r0 = np.array([p.get_rf() for p in particles])
+    masses = np.full(len(particles), mV)
+
+    probability = decay_in_volume_probability(p4, r0, masses, ctau, z_min, z_max)
+    for (energy, direction, production, expected), computed in zip(cases, probability):
+        if expected is None:
+            cos_theta = direction[2] / np.linalg.norm(direction)
+            L_in = (z_min - production[2]) / cos_theta
+            L_out = (z_max - production[2]) / cos_theta
+            lam = decay_length(energy, ctau)
+            expected = np.exp(-L_in / lam) - np.exp(-L_out / lam)
+        assert computed == pytest.approx(expected, rel=1e-12, abs=1e-300)
+    assert 0.0 < probability[0] < 1.0
+
+    # One row per decay length
+    ctaus = np.array([0.05, 0.2, 3.0])
+    probabilities = decay_in_volume_probability(p4, r0, masses, ctaus, z_min, z_max)
+    assert probabilities.shape == (len(ctaus), len(particles))
+    np.testing.assert_allclose(probabilities[1], probability, rtol=1e-12)
+
+
+@pytest.fixture
+def dark_particles():
+    rng = np.random.default_rng(1)
+    particles = []
+    for _ in range(200):
+        energy = rng.uniform(0.5, 5.0)
+        direction = [rng.normal(0, 0.05), rng.normal(0, 0.05), 1.0]
+        production = [0, 0, rng.uniform(0, 2)]
+        particles.append(dark_particle(energy, direction, production, rng.uniform()))
+    return particles
+
+
+def test_stable_yields_scale_with_coupling_squared(dark_particles):
+    weights = np.array([p.get_ids()["weight"] for p in dark_particles])
+    couplings = np.geomspace(1e-6, 1e-2, 9).reshape(3, 3)
+    yields, acceptances = coupling_scan(dark_particles, couplings, reference_coupling=1e-4)
+    assert yields.shape == acceptances.shape == (3, 3)
+    np.testing.assert_allclose(yields, np.sum(weights) * (couplings / 1e-4) ** 2, rtol=1e-12)
+    np.testing.assert_array_equal(acceptances, 1.0)
+
+    # Selections change the acceptance, not the scaling
+    energies = np.array([p.get_p0()[0] for p in dark_particles])
+    selected = (energies > 1.0) & (energies < 3.0)
+    yields, acceptances = coupling_scan(
+        dark_particles, couplings, reference_coupling=1e-4, energy_cut=(1.0, 3.0)
+    )
+    np.testing.assert_allclose(
+        yields, np.sum(weights[selected]) * (couplings / 1e-4) ** 2, rtol=1e-12
+    )
+    np.testing.assert_allclose(acceptances, np.sum(weights[selected]) / np.sum(weights))
+
+
+def test_unstable_yields(dark_particles):
+    p4 = np.array([p.get_p0() for p in dark_particles])
+    r0 = np.array([p.get_rf() for p in dark_particles])
+    weights = np.array([p.get_ids()["weight"] for p in dark_particles])
+    couplings = np.geomspace(1e-6, 1e-2, 20)
+    ctau_reference, decay_volume = 1.0, (5.0, 50.0)
+
+    yields, acceptances = coupling_scan(
+        dark_particles,
+        couplings,
+        reference_coupling=1e-4,
+        ctau_reference=ctau_reference,
+        decay_volume=decay_volume,
+    )
+    for coupling, coupling_yield, acceptance in zip(couplings, yields, acceptances):
+        # The decay length scales as 1/coupling**2
+        ctau = ctau_reference * (1e-4 / coupling) ** 2
+        probability = decay_in_volume_probability(
+            p4, r0, np.full(len(p4), mV), ctau, *decay_volume
+        )
+        expected = np.sum(weights * probability)
+        assert coupling_yield == pytest.approx((coupling / 1e-4) ** 2 * expected, rel=1e-12)
+        assert acceptance == pytest.approx(expected / np.sum(weights), rel=1e-12)
+    # Small couplings decay beyond the volume, large ones before it
+    assert np.argmax(yields) not in [0, len(couplings) - 1]
+
+    with pytest.raises(ValueError):
+        coupling_scan(dark_particles, couplings, ctau_reference=ctau_reference)
+
+
+def test_dark_shower_reference_coupling(library_copy, dark_particles):
+    with contextlib.redirect_stdout(io.StringIO()):
+        shower = DarkShower(library_copy, "graphite", 0.02, 0.03, kinetic_mixing=1e-3)
+    weights = np.array([p.get_ids()["weight"] for p in dark_particles])
+    yields, _ = shower.coupling_scan(dark_particles, [1e-3, 2e-3])
+    np.testing.assert_allclose(yields, np.sum(weights) * np.array([1.0, 4.0]), rtol=1e-12)
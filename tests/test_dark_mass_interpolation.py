@@ -0,0 +1,127 @@
+import contextlib
+import io
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+
+from PETITE.dark_shower import DarkShower, build_dark_tables, interpolate_dark_table
+from PETITE.library import load_dark_table
+from PETITE.physical_constants import m_electron
+
+from conftest import two_sample_z
+
+# Library mass left out of the library and recovered from the others
+left_out_mass = 0.03
+
+
+@pytest.fixture(scope="module")
+def libraries(library_dir, tmp_path_factory):
+    """Copies of the fixture library with all masses and without left_out_mass, with the
+    dark tables of all their masses"""
+    full = str(tmp_path_factory.mktemp("full")) + "/"
+    shutil.copytree(library_dir, full, dirs_exist_ok=True)
+    reduced = str(tmp_path_factory.mktemp("reduced")) + "/"
+    shutil.copytree(library_dir, reduced, dirs_exist_ok=True)
+    for file_name in ["dark_maps.pkl", "dark_xsec.pkl"]:
+        with open(reduced + file_name, "rb") as f:
+            library = pickle.load(f)
+        del library[left_out_mass]
+        with open(reduced + file_name, "wb") as f:
+            pickle.dump(library, f)
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_dark_tables(full, "graphite", 0.02)
+        build_dark_tables(reduced, "graphite", 0.02)
+    return full, reduced
+
+
+def assert_close_to_table(interpolated, table, rtol):
+    """interpolated agrees with table (both [[E, value], ...]) at the energies of table,
+    interpolating in log space between the energies of interpolated"""
+    interpolated, table = np.asarray(interpolated), np.asarray(table)
+    nonzero = table[:, 1] > 0.0
+    values = np.exp(
+        np.interp(
+            np.log(table[nonzero, 0]),
+            np.log(interpolated[:, 0]),
+            np.log(np.maximum(interpolated[:, 1], 1e-300)),
+        )
+    )
+    np.testing.assert_allclose(values, table[nonzero, 1], rtol=rtol)
+
+
+@pytest.mark.parametrize("process", ["DarkBrem", "DarkAnn", "DarkComp"])
+def test_interpolated_cross_sections(library_dir, process):
+    with open(library_dir + "dark_xsec.pkl", "rb") as f:
+        cross_sections = pickle.load(f)
+    tables = {
+        mass: cross_sections[mass][process]["graphite"]
+        for mass in cross_sections
+        if mass != left_out_mass
+    }
+    # The fixture cross sections have statistical errors of ~10%
+    assert_close_to_table(
+        interpolate_dark_table(tables, process, left_out_mass),
+        cross_sections[left_out_mass][process]["graphite"],
+        rtol=0.3,
+    )
+
+
+@pytest.mark.parametrize("weights", ["brem_elec_weights", "brem_positron_weights"])
+def test_interpolated_weights(libraries, weights):
+    # The annihilation weights of the low-statistics fixture are not smooth enough in mass
+    # to be interpolated from its four masses
+    full, reduced = libraries
+    tables = {
+        mass: load_dark_table(reduced, "dark_weights", mass, "graphite")[weights]
+        for mass in [0.01, 0.1, 0.3]
+    }
+    assert_close_to_table(
+        interpolate_dark_table(tables, "DarkBrem", left_out_mass),
+        load_dark_table(full, "dark_weights", left_out_mass, "graphite")[weights],
+        rtol=0.35,
+    )
+
+
+def test_dark_brem_rescaling(libraries):
+    _, reduced = libraries
+    with contextlib.redirect_stdout(io.StringIO()):
+        shower = DarkShower(reduced, "graphite", 0.02, left_out_mass, mode="approx")
+    assert shower._mV_estimator == 0.01
+
+    Einc, E_estimator = 2.0, 1.5
+    rescale, jacobian = shower._dark_brem_rescaling(Einc, E_estimator)
+    edges = np.array(
+        [[0.01 / E_estimator, -3.0, -5.0], [1 - m_electron / E_estimator, -3.0, -5.0]]
+    )
+    np.testing.assert_allclose(
+        rescale(edges)[:, 0], [left_out_mass / Einc, 1 - m_electron / Einc]
+    )
+    np.testing.assert_array_equal(rescale(edges)[:, 1:], edges[:, 1:])
+    assert jacobian == pytest.approx(
+        (1 - m_electron / Einc - left_out_mass / Einc)
+        / (1 - m_electron / E_estimator - 0.01 / E_estimator)
+    )
+
+
+def test_samples_without_library_mass(libraries):
+    """DarkBrem samples of the left out mass drawn with the samples of the closest smaller
+    mass follow the distribution of those drawn with its own samples"""
+    full, reduced = libraries
+    with contextlib.redirect_stdout(io.StringIO()):
+        exact = DarkShower(full, "graphite", 0.02, left_out_mass)
+        approx = DarkShower(reduced, "graphite", 0.02, left_out_mass, mode="approx")
+        np.random.seed(1)
+        for Einc in [1.0, 3.0]:
+            samples = [
+                [shower.draw_dark_sample(Einc, process="DarkBrem") for _ in range(1500)]
+                for shower in [exact, approx]
+            ]
+            assert np.all(np.abs(two_sample_z(*samples)) < 4)
+
+
+def test_missing_library_mass_tables_raise(library_copy):
+    with pytest.raises(FileNotFoundError, match="build_dark_tables"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            DarkShower(library_copy, "graphite", 0.02, 0.05, mode="approx")
@@ -0,0 +1,109 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+import vegas
+from scipy import stats
+
+from PETITE.all_processes import integration_range
+from PETITE.physical_constants import alpha_em, m_electron
+from PETITE.shower import Shower, diff_xsection_options
+
+from conftest import analytic_cdf
+
+
+@pytest.fixture(scope="module")
+def shower(library_dir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Shower(library_dir, "graphite", 0.02, seed=4, energy_sampling="interpolate")
+
+
+def library_energies(shower, process):
+    return np.array([entry[0] for entry in shower._loaded_samples[process]])
+
+
+def test_LU_keys_at_or_above(shower):
+    energies = library_energies(shower, "Comp")
+    middle = np.sqrt(energies[:-1] * energies[1:])
+    np.testing.assert_array_equal(
+        shower.get_LU_keys(middle, "Comp"), np.arange(1, len(energies))
+    )
+    np.testing.assert_array_equal(
+        shower.get_LU_keys(energies, "Comp"), [1] + list(range(1, len(energies)))
+    )
+    np.testing.assert_array_equal(
+        shower.get_LU_keys([0.5 * energies[0], 2 * energies[-1]], "Comp"),
+        [1, len(energies) - 1],
+    )
+
+
+def test_envelope_scales(shower):
+    # The envelope of Compton scattering falls with energy: it is raised toward the
+    # envelope of the bin below
+    energies = library_energies(shower, "Comp")
+    sample_list = shower._loaded_samples["Comp"]
+    ratio = np.mean(shower.get_max_F_strata("Comp", 3, sample_list[3][1])) / np.mean(
+        shower.get_max_F_strata("Comp", 4, sample_list[4][1])
+    )
+    assert ratio > 1
+    scales = shower.get_envelope_scales(
+        "Comp", [energies[3], np.sqrt(energies[3] * energies[4]), energies[4]], 4
+    )
+    np.testing.assert_allclose(scales, [ratio, np.sqrt(ratio), 1.0])
+
+    # That of Moller scattering rises with energy: the envelope of the bin itself is kept
+    energies = library_energies(shower, "Moller")
+    scales = shower.get_envelope_scales(
+        "Moller", np.geomspace(energies[3], energies[4], 5), 4
+    )
+    np.testing.assert_array_equal(scales, 1.0)
+
+
+@pytest.mark.parametrize("process", ["Comp", "Moller"])
+def test_one_dim_samples_follow_cross_section(shower, process):
+    energies = library_energies(shower, process)
+    for energy in [np.sqrt(energies[2] * energies[3]), 1.3 * energies[6]]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples = shower.draw_samples(np.full(4000, energy), process)[:, 0]
+        assert stats.kstest(samples, analytic_cdf(shower, process, energy)).pvalue > 1e-3
+
+
+@pytest.mark.parametrize("process", ["Brem", "PairProd"])
+def test_samples_follow_exact_energy(shower, process):
+    """The means of the sampled variables match those of VEGAS trained at the exact energy,
+    with few points above the interpolated envelope"""
+    np.random.seed(5)
+    energies = library_energies(shower, process)
+    energy = np.sqrt(energies[6] * energies[7])
+    event_info = {
+        "E_inc": energy,
+        "m_e": m_electron,
+        "Z_T": shower.target.Z,
+        "A_T": shower.target.A,
+        "mT": shower.target.A,
+        "alpha_FS": alpha_em,
+        "mV": 0,
+        "Eg_min": shower._Egamma_min,
+        "Ee_min": shower._Ee_min,
+        "process": process,
+    }
+    integrand = diff_xsection_options[process](event_info, 4)
+    integrator = vegas.Integrator(integration_range(event_info, process))
+    integrator(integrand, nitn=10, neval=20000)
+    points, weights = [], []
+    for _ in range(10):
+        for x, wgt in integrator.random_batch():
+            points.append(x)
+            weights.append(wgt * integrand(x))
+    points, weights = np.concatenate(points), np.concatenate(weights)
+    reference = np.sum(points * weights[:, np.newaxis], axis=0) / np.sum(weights)
+
+    violations_before = sum(shower.get_max_F_violations().values())
+    with contextlib.redirect_stdout(io.StringIO()):
+        samples = shower.draw_samples(np.full(3000, energy), process)
+    violations = sum(shower.get_max_F_violations().values()) - violations_before
+
+    z = (samples.mean(axis=0) - reference) / (samples.std(axis=0) / np.sqrt(len(samples)))
+    assert np.all(np.abs(z) < 4)
+    assert violations < 0.02 * len(samples)
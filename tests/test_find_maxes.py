@@ -0,0 +1,83 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import vegas
+
+from PETITE.shower import Shower
+from PETITE.targets import Target
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "utilities"))
+find_maxes = pytest.importorskip("find_maxes")
+
+
+def toy_integrand(x):
+    """Peaked in x[0], rising in x[1]: the marginal of x[1] has mean 9/16"""
+    return np.exp(-((x[:, 0] - 0.3) ** 2) / 0.01) * (1 + x[:, 1] ** 2)
+
+
+@pytest.fixture(scope="module")
+def toy_sample_dict():
+    np.random.seed(1)
+    integrator = vegas.Integrator([[0, 1], [0, 1]])
+    integrator(vegas.batchintegrand(toy_integrand), nitn=5, neval=2000)
+    max_F_strata = find_maxes.find_max_F_strata(
+        lambda x: toy_integrand(x)[np.newaxis, :], integrator.map, 16, 30000
+    )[0]
+    return {
+        "adaptive_map": integrator.map,
+        "neval": 300,
+        "max_F_strata": {"graphite": max_F_strata},
+    }
+
+
+def strata_sampler():
+    """Shower with only the state used by _draw_from_strata"""
+    shower = Shower.__new__(Shower)
+    shower.target = Target("graphite")
+    shower._maxF_fudge_global = 1
+    shower._max_n_integrators = 100
+    shower._max_F_violations = {}
+    shower._max_F_corrections = {}
+    return shower
+
+
+def test_max_F_strata_bounds_integrand(toy_sample_dict):
+    """The envelope is above jac*f at (almost) every point of a dense scan"""
+    adaptive_map = toy_sample_dict["adaptive_map"]
+    max_F_strata = toy_sample_dict["max_F_strata"]["graphite"]
+    y = np.random.uniform(size=(400000, 2))
+    x, jac = np.empty_like(y), np.empty(len(y))
+    adaptive_map.map(y, x, jac)
+    strata = tuple(np.floor(y * 16).astype(int).T)
+    assert np.mean(jac * toy_integrand(x) > max_F_strata[strata]) < 1e-4
+
+
+def test_draw_from_strata_distribution(toy_sample_dict):
+    np.random.seed(2)
+    shower = strata_sampler()
+    samples, sampcounts = [], 0
+    for _ in range(4000):
+        sample, counts = shower._draw_from_strata(
+            "toy", 0, toy_sample_dict, [toy_integrand]
+        )
+        samples.append(sample[0])
+        sampcounts += counts[0]
+    samples = np.array(samples)
+
+    assert sum(shower.get_max_F_violations().values()) < 1e-3 * sampcounts
+
+    assert abs(np.mean(samples[:, 1]) - 9 / 16) < 4 * np.std(samples[:, 1]) / np.sqrt(4000)
+    bins = np.linspace(0, 1, 11)
+    counts, _ = np.histogram(samples[:, 0], bins=bins)
+    grid = np.linspace(0, 1, 100001)
+    density = np.exp(-((grid - 0.3) ** 2) / 0.01)
+    expected = np.array(
+        [density[(grid >= lo) & (grid < hi)].sum() for lo, hi in zip(bins[:-1], bins[1:])]
+    )
+    expected *= len(samples) / expected.sum()
+    populated = expected > 5
+    chi2 = np.sum((counts[populated] - expected[populated]) ** 2 / expected[populated])
+    # 99.9% quantile of chi2 with up to 7 degrees of freedom
+    assert chi2 < 24.3
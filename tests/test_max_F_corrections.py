@@ -0,0 +1,109 @@
+import multiprocessing
+import pickle
+
+import numpy as np
+import pytest
+
+from PETITE.library import write_max_F_corrections
+from PETITE.shower import Shower
+
+
+@pytest.fixture
+def shower(library_dir):
+    return Shower(library_dir, "graphite", 0.02, seed=1)
+
+
+def test_violations_raise_max_F(shower):
+    sample_dict = shower._loaded_samples["Comp"][3][1]
+    max_F = sample_dict["max_F"]["graphite"]
+
+    shower._check_max_F("Comp", 3, sample_dict, np.array([0.5, 2.0, 3.0]) * max_F, max_F)
+    assert shower.get_max_F_violations() == {("Comp", 3): 2}
+    assert shower.get_max_F("Comp", 3, sample_dict) == 3.0 * max_F
+
+    # Points below the raised envelope are not violations, other energy bins are untouched
+    shower._check_max_F("Comp", 3, sample_dict, np.array([2.5 * max_F]), 3.0 * max_F)
+    shower._check_max_F("Comp", 3, sample_dict, np.array([4.0 * max_F]), 3.0 * max_F)
+    assert shower.get_max_F_violations() == {("Comp", 3): 3}
+    assert shower.get_max_F("Comp", 3, sample_dict) == 4.0 * max_F
+    other_dict = shower._loaded_samples["Comp"][4][1]
+    assert shower.get_max_F("Comp", 4, other_dict) == other_dict["max_F"]["graphite"]
+    # The library itself is not modified
+    assert sample_dict["max_F"]["graphite"] == max_F
+
+
+def test_violations_raise_max_F_strata(shower):
+    sample_dict = shower._loaded_samples["Moller"][2][1]
+    max_F_strata = np.array(sample_dict["max_F_strata"]["graphite"])
+    strata = np.array([0, 5, 5, 7])
+    wgt_fs = max_F_strata[strata] * np.array([2.0, 0.5, 3.0, 1.5])
+
+    shower._check_max_F(
+        "Moller", 2, sample_dict, wgt_fs, max_F_strata[strata], strata=strata
+    )
+    assert shower.get_max_F_violations() == {("Moller", 2): 3}
+    expected = max_F_strata.copy()
+    expected[[0, 5, 7]] = wgt_fs[[0, 2, 3]]
+    np.testing.assert_array_equal(
+        shower.get_max_F_strata("Moller", 2, sample_dict), expected
+    )
+
+
+def test_sampling_raises_low_envelopes(library_copy):
+    """Envelopes lowered below jac*f are raised to the values met while sampling"""
+    with open(library_copy + "sm_maps.pkl", "rb") as f:
+        library = pickle.load(f)
+    originals = []
+    for _, sample_dict in library["Comp"]:
+        originals.append(np.array(sample_dict["max_F_strata"]["graphite"]))
+        sample_dict["max_F_strata"]["graphite"] = 0.3 * originals[-1]
+    with open(library_copy + "sm_maps.pkl", "wb") as f:
+        pickle.dump(library, f)
+
+    shower = Shower(library_copy, "graphite", 0.02, seed=2)
+    energy = library["Comp"][3][0]
+    LU_Key = shower.get_LU_keys([energy], "Comp")[0]
+    shower.draw_samples(np.full(200, energy), "Comp")
+    assert list(shower.get_max_F_violations()) == [("Comp", LU_Key)]
+    raised = shower.get_max_F_strata(
+        "Comp", LU_Key, shower._loaded_samples["Comp"][LU_Key][1]
+    )
+    assert np.all(raised >= 0.3 * originals[LU_Key])
+    assert np.sum(raised) > 0.9 * np.sum(originals[LU_Key])
+
+    # Saved corrections are read back by later showers
+    assert shower.save_max_F_corrections() == 1
+    later = Shower(library_copy, "graphite", 0.02)
+    np.testing.assert_array_equal(
+        later._loaded_samples["Comp"][LU_Key][1]["max_F_strata"]["graphite"], raised
+    )
+
+
+def _write_corrections(arguments):
+    file_name, process, LU_Keys = arguments
+    with open(file_name, "rb") as f:
+        library = pickle.load(f)
+    for LU_Key in LU_Keys:
+        max_F = library[process][LU_Key][1]["max_F"]["graphite"]
+        write_max_F_corrections(
+            file_name, {(process, LU_Key): {"max_F": 2 * max_F}}, "graphite"
+        )
+
+
+def test_concurrent_writers_keep_all_corrections(library_copy):
+    file_name = library_copy + "sm_maps.pkl"
+    with open(file_name, "rb") as f:
+        before = pickle.load(f)
+
+    jobs = [(file_name, process, list(range(10))) for process in ["Comp", "Moller", "Bhabha"]]
+    with multiprocessing.get_context("fork").Pool(len(jobs)) as pool:
+        pool.map(_write_corrections, jobs)
+
+    with open(file_name, "rb") as f:
+        after = pickle.load(f)
+    for _, process, LU_Keys in jobs:
+        for LU_Key in LU_Keys:
+            assert (
+                after[process][LU_Key][1]["max_F"]["graphite"]
+                == 2 * before[process][LU_Key][1]["max_F"]["graphite"]
+            )
@@ -0,0 +1,112 @@
+import contextlib
+import io
+import pickle
+
+import numpy as np
+import pytest
+import vegas
+from scipy.interpolate import interp1d
+
+from PETITE.dark_shower import DarkShower
+from PETITE.shower import Shower
+
+
+def assert_same(original, restored, path="shower"):
+    """Recursively compares two attribute values, interpolators by their data and values"""
+    assert type(restored) is type(original), path
+    if isinstance(original, dict):
+        assert restored.keys() == original.keys(), path
+        for key in original:
+            assert_same(original[key], restored[key], f"{path}[{key!r}]")
+    elif isinstance(original, (list, tuple)):
+        assert len(restored) == len(original), path
+        for ii, (item, restored_item) in enumerate(zip(original, restored)):
+            assert_same(item, restored_item, f"{path}[{ii}]")
+    elif isinstance(original, interp1d):
+        np.testing.assert_array_equal(restored.x, original.x, err_msg=path)
+        np.testing.assert_array_equal(restored.y, original.y, err_msg=path)
+        assert vars(restored).keys() == vars(original).keys(), path
+        x = np.linspace(original.x[0], original.x[-1], 7)
+        if getattr(original, "xspace", "linear") == "log":
+            x = 10**x
+        np.testing.assert_array_equal(restored(x), original(x), err_msg=path)
+    elif isinstance(original, vegas.AdaptiveMap):
+        np.testing.assert_array_equal(restored.ninc, original.ninc, err_msg=path)
+        for dim, ninc in enumerate(original.ninc):
+            np.testing.assert_array_equal(
+                np.array(restored.grid)[dim, : ninc + 1],
+                np.array(original.grid)[dim, : ninc + 1],
+                err_msg=path,
+            )
+    elif isinstance(original, vegas.Integrator):
+        assert_same(original.map, restored.map, path)
+    elif isinstance(original, np.ndarray):
+        np.testing.assert_array_equal(restored, original, err_msg=path)
+    elif hasattr(original, "__dict__") and not callable(original):
+        assert_same(vars(original), vars(restored), path)
+    else:
+        assert restored == original, path
+
+
+def stored_objects(value):
+    """Types of the objects stored in a snapshot, besides containers and arrays"""
+    if isinstance(value, dict):
+        return set().union(*map(stored_objects, value.values()), set())
+    if isinstance(value, (list, tuple)):
+        return set().union(*map(stored_objects, value), set())
+    return {type(value)}
+
+
+def round_trip(shower, path, include_samples=False):
+    shower.snapshot(path, include_samples=include_samples)
+    return type(shower).from_snapshot(path)
+
+
+def assert_same_draws(original, restored, process, energies):
+    np.random.seed(7)
+    original_draws = original.draw_samples(energies, process)
+    np.random.seed(7)
+    np.testing.assert_array_equal(restored.draw_samples(energies, process), original_draws)
+
+
+@pytest.mark.parametrize("include_samples", [False, True])
+def test_shower_round_trip(library_dir, tmp_path, include_samples):
+    with contextlib.redirect_stdout(io.StringIO()):
+        shower = Shower(library_dir, "graphite", 0.02, seed=1, one_dim_sampling="table")
+        shower.draw_samples(np.geomspace(0.05, 5.0, 20), "Comp")
+    shower._get_sample_integrator("Brem", 3)
+
+    path = str(tmp_path / "shower.snap")
+    restored = round_trip(shower, path, include_samples)
+    assert_same(vars(shower), vars(restored))
+    assert set(restored._sample_tables) == {"Comp"}
+    assert list(restored._sample_integrators) == [("Brem", 3)]
+
+    with open(path, "rb") as snapshot_file:
+        state = pickle.load(snapshot_file)["state"]
+    assert not any(
+        issubclass(stored, (interp1d, vegas.AdaptiveMap, vegas.Integrator))
+        for stored in stored_objects(state)
+    )
+
+    energies = np.geomspace(0.05, 5.0, 50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert_same_draws(shower, restored, "Comp", energies)
+        assert_same_draws(shower, restored, "Brem", energies)
+
+
+def test_dark_shower_round_trip(library_copy, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        shower = DarkShower(library_copy, "graphite", 0.02, 0.03)
+
+    restored = round_trip(shower, str(tmp_path / "dark_shower.snap"))
+    assert_same(vars(shower), vars(restored))
+
+    energies = np.geomspace(0.5, 5.0, 20)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert_same_draws(shower, restored, "Brem", energies)
+        np.random.seed(7)
+        original_draws = [shower.draw_dark_sample(E, process="DarkBrem") for E in energies]
+        np.random.seed(7)
+        restored_draws = [restored.draw_dark_sample(E, process="DarkBrem") for E in energies]
+    np.testing.assert_array_equal(restored_draws, original_draws)
@@ -0,0 +1,61 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from PETITE.shower import Shower, table_sampling_processes
+
+from conftest import analytic_cdf
+
+
+@pytest.fixture(scope="module")
+def showers(library_dir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            one_dim_sampling: Shower(
+                library_dir, "graphite", 0.02, seed=3, one_dim_sampling=one_dim_sampling
+            )
+            for one_dim_sampling in ["table", "nearest_table", "vegas"]
+        }
+
+
+def draw(shower, process, energy, n_samples):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return shower.draw_samples(np.full(n_samples, energy), process)[:, 0]
+
+
+def library_energies(shower, process):
+    return np.array([entry[0] for entry in shower._loaded_samples[process]])
+
+
+@pytest.mark.parametrize("process", table_sampling_processes)
+@pytest.mark.parametrize("one_dim_sampling", ["table", "vegas"])
+def test_samples_follow_cross_section(showers, process, one_dim_sampling):
+    """At library energies and between them (including the bins next to the threshold
+    of Moller and Bhabha scattering)"""
+    shower = showers[one_dim_sampling]
+    energies = library_energies(shower, process)
+    n_samples = 20000 if one_dim_sampling == "table" else 4000
+    for energy in [energies[4], np.sqrt(energies[0] * energies[1]), 1.3 * energies[6]]:
+        samples = draw(shower, process, energy, n_samples)
+        assert stats.kstest(samples, analytic_cdf(shower, process, energy)).pvalue > 1e-3
+
+
+@pytest.mark.parametrize("process", table_sampling_processes)
+def test_nearest_table_rescales_library_energy(showers, process):
+    """nearest_table draws the distribution of the library energy of the look up key,
+    rescaled from its cos(theta) range onto that of the incoming energy"""
+    shower = showers["nearest_table"]
+    energies = library_energies(shower, process)
+    for energy in [energies[4], 1.3 * energies[6]]:
+        table_energy = energies[shower.get_LU_keys([energy], process)[0]]
+        ct_min, ct_max = (limit[0] for limit in shower._one_dim_range(process, [energy]))
+        table_min, table_max = (
+            limit[0] for limit in shower._one_dim_range(process, [table_energy])
+        )
+        cdf = analytic_cdf(shower, process, table_energy)
+
+        u = (draw(shower, process, energy, 20000) - ct_min) / (ct_max - ct_min)
+        assert stats.kstest(u, lambda v: cdf(table_min + v * (table_max - table_min))).pvalue > 1e-3
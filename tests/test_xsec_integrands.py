@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from PETITE import xsec_integrands_numpy
+from PETITE.physical_constants import m_electron
+
+xsec_integrands = pytest.importorskip("PETITE.xsec_integrands")
+
+rng = np.random.default_rng(20240601)
+
+
+def uniform_batch(low, high, n=2000):
+    """(n, len(low)) batch of points drawn uniformly in [low, high], as passed by vegas"""
+    low, high = np.atleast_1d(low), np.atleast_1d(high)
+    return rng.uniform(low, high, size=(n, len(low)))
+
+
+def assert_kernels_agree(kernel, x, *args, rtol=1e-12):
+    """The compiled and the NumPy versions of kernel give the same values, with
+    the same NaN and zero patterns"""
+    x = np.ascontiguousarray(x, dtype=float)
+    compiled = np.asarray(getattr(xsec_integrands, kernel)(x, *args))
+    reference = np.asarray(getattr(xsec_integrands_numpy, kernel)(x, *args))
+
+    assert compiled.shape == reference.shape == (len(x),)
+    np.testing.assert_array_equal(np.isnan(compiled), np.isnan(reference))
+    np.testing.assert_array_equal(compiled == 0.0, reference == 0.0)
+    np.testing.assert_allclose(compiled, reference, rtol=rtol, atol=0.0)
+
+
+# cos(theta) points on and next to the edges of the integration range
+edge_ct = np.array([[-1.0], [-1.0 + 1e-12], [-0.5], [0.0], [0.5], [1.0 - 1e-12], [1.0]])
+
+
+@pytest.mark.parametrize("Eg", [0.002, 0.1, 10.0, 1000.0])
+@pytest.mark.parametrize("mV", [0.0, 0.001, 0.01, 0.1])
+def test_compton(Eg, mV):
+    for x in [uniform_batch(-1.0, 1.0), edge_ct]:
+        assert_kernels_agree("c_dsigma_compton_dCT", x, Eg, mV)
+
+
+@pytest.mark.parametrize("Ee", [0.002, 0.1, 10.0, 1000.0])
+@pytest.mark.parametrize("mV", [0.0, 0.001, 0.01, 0.1])
+def test_annihilation(Ee, mV):
+    for x in [uniform_batch(-1.0, 1.0), edge_ct]:
+        assert_kernels_agree("c_dsigma_annihilation_dCT", x, Ee, mV, 0.001)
+
+
+@pytest.mark.parametrize("kernel", ["c_dsigma_moller_dCT", "c_dsigma_bhabha_dCT"])
+@pytest.mark.parametrize("Ee", [0.02, 1.0, 100.0])
+def test_moller_bhabha(kernel, Ee):
+    DE = 0.005
+    delta_ct_limit = 2.0 * DE / (Ee - m_electron)
+    edges = np.array(
+        [[-1.0 + delta_ct_limit], [1.0 - delta_ct_limit], [-1.0], [0.0], [1.0]]
+    )
+    for x in [uniform_batch(-1.0, 1.0), edges]:
+        assert_kernels_agree(kernel, x, Ee, DE)
+
+
+@pytest.mark.parametrize("Ee", [0.5, 10.0, 1000.0])
+@pytest.mark.parametrize("mV", [0.003, 0.03, 0.3, 2.0])
+def test_radiative_return(Ee, mV):
+    assert_kernels_agree("c_dsigma_radiative_return_du", uniform_batch(0.0, 1.0), Ee, mV)
+    # next to u = 1 the structure function is evaluated at 1 - y/x1 ~ 1e-11, where
+    # last-digit differences of pow are amplified by (1 - y/x1)^(beta/2 - 1)
+    edges = np.array([[0.0], [1e-12], [0.5], [1.0 - 1e-12], [1.0]])
+    assert_kernels_agree("c_dsigma_radiative_return_du", edges, Ee, mV, rtol=1e-3)
+
+
+@pytest.mark.parametrize("Ebeam", [0.1, 10.0, 1000.0])
+@pytest.mark.parametrize("mV", [0.003, 0.03, 0.3])
+@pytest.mark.parametrize("Z, A, MTarget", [(6.0, 12.0, 11.178), (82.0, 207.2, 193.729)])
+def test_dark_brem_exact(Ebeam, mV, Z, A, MTarget):
+    args = (Ebeam, mV, MTarget, Z, A)
+    # x, log10(1 - costheta), log10(ttilde). NumPy's 10**x and C's pow(10, x) differ in
+    # the last digit for a few percent of the points, which the cancellation in
+    # p - k costheta at small angles amplifies up to ~1e-6
+    log_points = uniform_batch([0.0, -12.0, -20.0], [1.0, np.log10(2.0), 0.0])
+    log_edges = np.array([[0.0, -12.0, -20.0], [1.0, np.log10(2.0), 0.0], [0.5, -6.0, -10.0]])
+    for x in [log_points, log_edges]:
+        assert_kernels_agree(
+            "c_dsig_dx_dcostheta_dark_brem_exact_tree_level", x, *args, True, rtol=1e-5
+        )
+
+    # x, costheta, ttilde (the small-angle edge point has the same cancellation)
+    points = uniform_batch([0.0, -1.0, 0.0], [1.0, 1.0, 1.0])
+    assert_kernels_agree(
+        "c_dsig_dx_dcostheta_dark_brem_exact_tree_level", points, *args, False
+    )
+    edges = np.array([[0.0, -1.0, 0.0], [1.0, 1.0, 1.0], [0.5, 1.0 - 1e-9, 1e-12]])
+    assert_kernels_agree(
+        "c_dsig_dx_dcostheta_dark_brem_exact_tree_level", edges, *args, False, rtol=1e-9
+    )
+
+
+def test_dark_ann_shape():
+    """DarkAnn integrand returns one value per point, shape (n,) rather than (n, 1)"""
+    from PETITE.all_processes import dsigma_radiative_return_du
+
+    integrand = dsigma_radiative_return_du({"E_inc": 10.0, "mV": 0.03}, ndim=1)
+    values = integrand(uniform_batch(0.0, 1.0, n=100))
+    assert np.shape(values) == (100,)
+    assert np.all(values >= 0.0) and np.any(values > 0.0)
+
+    below_threshold = dsigma_radiative_return_du({"E_inc": 0.001, "mV": 0.3}, ndim=1)
+    np.testing.assert_array_equal(below_threshold(uniform_batch(0.0, 1.0, n=10)), 0.0)
@@ -0,0 +1,765 @@
+""" Parallel, resumable build of the PETITE library: sm_maps.pkl, sm_xsec.pkl (and the interpolators of
+    create_xsec_interp), dark_maps.pkl and dark_xsec.pkl.
+
+    The build is split into tasks: one per (process, energy, mV) to train a VEGAS integrator, and one per
+    (process, energy, mV, target) to process it with find_maxes. The tasks are listed in a manifest
+    (build_manifest.json in save_location) and all run on a single process pool. Every completed task is
+    appended to a log (build_log.jsonl), so an interrupted build resumes where it stopped, and a build with
+    additional targets, energies or masses only runs the new tasks and rewrites the library files they enter.
+
+    Typical usage:
+
+    python build_library.py -save_location=../data/ -process all -process_targets graphite lead -n_processes=8
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import argparse
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
+import vegas
+
+import find_maxes
+from generate_integrators import create_xsec_interp
+
+from PETITE.all_processes import (
+    vegas_integration,
+    vegas_training,
+    vegas_integrator_options,
+    rescaled_adaptive_map,
+    map_displacement,
+)
+from PETITE.physical_constants import m_electron, alpha_em
+from PETITE.targets import target_information
+
+sm_processes = ["PairProd", "Brem", "Comp", "Ann", "Moller", "Bhabha"]
+dark_processes = ["DarkBrem", "DarkAnn", "DarkComp"]
+
+MANIFEST_FILE = "build_manifest.json"
+LOG_FILE = "build_log.jsonl"
+BUILD_DIR = "build/"
+
+
+def energy_grid(process, mV, min_energy, max_energy, num_energy_pts):
+    """Incoming energies at which the integrators of a process are trained (same grids as
+    script_generateintegrators.py)
+    Input:
+        process: string of process name
+        mV: dark vector mass in GeV (ignored for SM processes)
+        min_energy, max_energy: energy range in GeV (the dark grids start at the threshold)
+        num_energy_pts: number of energies
+    Output:
+        list of energies in GeV
+    """
+    energy_list = np.geomspace(min_energy, max_energy, num_energy_pts)
+    if process == "DarkBrem":
+        energy_list = np.geomspace(1.25 * mV, max_energy, num_energy_pts)
+    elif process == "DarkAnn":
+        ER0 = (mV**2 - 2 * m_electron**2) / (2 * m_electron)
+        Emax = np.max([max_energy, 100 * ER0])
+        energy_list = ER0 * (
+            1 + np.geomspace(1e-4, (Emax - ER0) / ER0, num_energy_pts)
+        )
+    elif process == "DarkComp":
+        Eg0 = mV * (1 + mV / (2 * m_electron))
+        Emax = np.max([max_energy, 100 * Eg0])
+        energy_list = Eg0 * (
+            1 + np.geomspace(1e-4, (Emax - Eg0) / Eg0, num_energy_pts)
+        )
+    return [float(energy) for energy in energy_list]
+
+
+def task_id(kind, spec):
+    """Identifier of a task, which changes with any of the parameters it depends on"""
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    return kind + "_" + digest[:16]
+
+
+def expand_jobs(config, refinement=None):
+    """Expand a build configuration into the full list of tasks
+    Input:
+        config: dictionary with keys
+            'save_location': directory of the library
+            'process': list of processes (SM and/or dark)
+            'process_targets': list of target materials to process the integrators for
+            'mV_list': list of dark vector masses in GeV (dark processes only)
+            'min_energy', 'max_energy', 'num_energy_pts': incoming energy grid (see energy_grid)
+            'training_target', 'mT': target the dark integrators are trained on, and its mass
+            'neval', 'n_trials', 'n_strata': find_maxes parameters
+            'warm_start', 'chain_length' (optional): train the integrators in chains of chain_length
+                consecutive energies, each starting from the map of the previous one (see vegas_training)
+        refinement: list of the energies added to the grid at each level of refinement, each a list of
+            [process, mV, energy] (see refine_energy_grid)
+    Output:
+        dictionary {task id: task}, each task a dictionary with its 'kind' ('integrator' or 'find_max'),
+        its parameters 'spec', the file it writes, 'output', and for find_max the integrator file it
+        reads, 'input'. Warm-started integrators also have the 'chain' they are trained in and, except
+        for the first of a chain, the integrator file they start from, 'seed' (whose task id is part
+        of their spec). An energy added by the refinement starts from the integrator of the energy
+        below it on the grid it refines, and is a chain of its own
+    """
+    warm_start = config.get("warm_start", False)
+    chain_length = config.get("chain_length", 10)
+    tasks = {}
+
+    def add_energy(process, mV, energy, training_target, mT, warm_start_spec):
+        """Add the integrator and find_max tasks of an energy, returns the id of the integrator"""
+        integrator_spec = {
+            "process": process,
+            "mV": mV,
+            "E_inc": energy,
+            "training_target": training_target,
+            "mT": mT,
+            "vegas_options": vegas_integrator_options[process],
+        }
+        if warm_start:
+            integrator_spec["warm_start"] = warm_start_spec
+        integrator_id = task_id("integrator", integrator_spec)
+        tasks[integrator_id] = {
+            "kind": "integrator",
+            "spec": integrator_spec,
+            "output": BUILD_DIR + "integrator/" + process + "/" + integrator_id + ".p",
+        }
+        for target in config["process_targets"]:
+            find_max_spec = {
+                "process": process,
+                "mV": mV,
+                "E_inc": energy,
+                "target": target,
+                "neval": config["neval"],
+                "n_trials": config["n_trials"],
+                "n_strata": config["n_strata"],
+                "integrator": integrator_id,
+            }
+            find_max_id = task_id("find_max", find_max_spec)
+            tasks[find_max_id] = {
+                "kind": "find_max",
+                "spec": find_max_spec,
+                "input": tasks[integrator_id]["output"],
+                "output": BUILD_DIR + "find_max/" + process + "/" + find_max_id + ".p",
+            }
+        return integrator_id
+
+    for process in config["process"]:
+        if process in dark_processes:
+            masses = [float(mV) for mV in config["mV_list"]]
+            training_target = config["training_target"]
+            mT = config["mT"]
+        else:
+            masses = [0.0]
+            training_target = "hydrogen"
+            mT = target_information["hydrogen"]["mT"]
+        for mV in masses:
+            energies = energy_grid(
+                process,
+                mV,
+                config["min_energy"],
+                config["max_energy"],
+                config["num_energy_pts"],
+            )
+            # Integrator ids of the energies on the grid
+            grid = {}
+            previous_integrator_id = None
+            for energy_index, energy in enumerate(energies):
+                # The id of the integrator a task starts from enters its own id, so that a change
+                # of the grid retrains every integrator downstream of it
+                warm_start_spec = {
+                    "chain_length": chain_length,
+                    "chain_index": energy_index % chain_length,
+                }
+                if energy_index % chain_length > 0:
+                    warm_start_spec["seed"] = previous_integrator_id
+                integrator_id = add_energy(
+                    process, mV, energy, training_target, mT, warm_start_spec
+                )
+                if warm_start:
+                    tasks[integrator_id]["chain"] = (
+                        f"{process}/{mV!r}/{energy_index // chain_length}"
+                    )
+                    if energy_index % chain_length > 0:
+                        tasks[integrator_id]["seed"] = tasks[previous_integrator_id][
+                            "output"
+                        ]
+                grid[energy] = integrator_id
+                previous_integrator_id = integrator_id
+
+            for level in refinement or []:
+                refined_grid = dict(grid)
+                for level_process, level_mV, energy in level:
+                    if level_process != process or level_mV != mV:
+                        continue
+                    seed_energy = max(E for E in grid if E < energy)
+                    integrator_id = add_energy(
+                        process,
+                        mV,
+                        energy,
+                        training_target,
+                        mT,
+                        {"seed_energy": seed_energy, "seed": grid[seed_energy]},
+                    )
+                    if warm_start:
+                        tasks[integrator_id]["seed"] = tasks[grid[seed_energy]]["output"]
+                    refined_grid[energy] = integrator_id
+                grid = refined_grid
+    return tasks
+
+
+def _write_atomic(file_name, write, mode="wb"):
+    """Write a file through a temporary file, so that it is either complete or absent"""
+    temporary_file_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(temporary_file_name, mode) as f:
+        write(f)
+    os.replace(temporary_file_name, file_name)
+
+
+def write_manifest(save_location, config, tasks, refinement=None):
+    """Save the configuration, the refinement of the energy grids and the list of tasks of the build
+    to save_location/build_manifest.json"""
+    _write_atomic(
+        save_location + MANIFEST_FILE,
+        lambda f: json.dump(
+            {"config": config, "refinement": refinement or [], "tasks": tasks}, f, indent=1
+        ),
+        mode="w",
+    )
+
+
+def completed_tasks(save_location):
+    """Ids of the tasks recorded as completed in save_location/build_log.jsonl (a line cut short by
+    an interrupted build is ignored)"""
+    completed = set()
+    if not os.path.exists(save_location + LOG_FILE):
+        return completed
+    with open(save_location + LOG_FILE) as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["task"])
+            except (ValueError, KeyError):
+                continue
+    return completed
+
+
+def run_task(save_location, identifier, task):
+    """Run a single task (in a worker process) and save its result to its output file
+    Input:
+        save_location: directory of the library
+        identifier: id of the task
+        task: dictionary with 'kind', 'spec', 'output', and 'input' or 'seed' (see expand_jobs)
+    Output:
+        identifier, so that the caller can record the task as completed
+    """
+    spec = task["spec"]
+    process = spec["process"]
+    if task["kind"] == "integrator":
+        params = {
+            "E_inc": spec["E_inc"],
+            "mV": spec["mV"],
+            "A_T": target_information[spec["training_target"]]["A_T"],
+            "Z_T": target_information[spec["training_target"]]["Z_T"],
+            "mT": spec["mT"],
+            "m_e": m_electron,
+            "alpha_FS": alpha_em,
+        }
+        if "warm_start" in spec:
+            adaptive_map = None
+            if "seed" in task:
+                if not os.path.exists(save_location + task["seed"]):
+                    raise FileNotFoundError(
+                        f"{identifier} starts from {save_location + task['seed']}, "
+                        "which has not been trained"
+                    )
+                with open(save_location + task["seed"], "rb") as f:
+                    adaptive_map = pickle.load(f)[1]
+            VEGAS_integrator, _, _ = vegas_training(
+                params, process, adaptive_map=adaptive_map
+            )
+        else:
+            VEGAS_integrator = vegas_integration(params, process, mode="Pickle")
+        params["process"] = process
+        result = [params, VEGAS_integrator.map]
+    elif task["kind"] == "find_max":
+        return run_find_max_tasks(save_location, [(identifier, task)])[0]
+    else:
+        raise ValueError("Unknown task kind " + str(task["kind"]))
+
+    output = save_location + task["output"]
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    _write_atomic(output, lambda f: pickle.dump(result, f))
+    return identifier
+
+
+def run_find_max_tasks(save_location, job):
+    """Run find_max tasks that read the same integrator file (one per target), in a single scan over
+    all their targets (see find_maxes.do_find_max_work), and save their results to their output files
+    Input:
+        save_location: directory of the library
+        job: list of (identifier, task) with the same 'input' and find_maxes parameters
+    Output:
+        ids of the tasks
+    """
+    spec = job[0][1]["spec"]
+    process = spec["process"]
+    with open(save_location + job[0][1]["input"], "rb") as f:
+        process_file = pickle.load(f)
+    fm_params = {
+        "process": process,
+        "process_targets": [task["spec"]["target"] for _, task in job],
+        "neval": spec["neval"],
+        "n_trials": spec["n_trials"],
+        "n_strata": spec["n_strata"],
+        "diff_xsec": find_maxes.process_info[process]["diff_xsection"],
+    }
+    if process in dark_processes:
+        fm_params["mV"] = spec["mV"]
+    sampling, cross_section, _ = find_maxes.do_find_max_work(fm_params, process_file)
+
+    for identifier, task in job:
+        target = task["spec"]["target"]
+        sampling_target = dict(sampling[1])
+        sampling_target["max_F"] = {target: sampling[1]["max_F"][target]}
+        sampling_target["max_F_strata"] = {target: sampling[1]["max_F_strata"][target]}
+        result = {
+            "sampling": [sampling[0], sampling_target],
+            "cross_section": cross_section[target],
+        }
+        output = save_location + task["output"]
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        _write_atomic(output, lambda f: pickle.dump(result, f))
+    return [identifier for identifier, _ in job]
+
+
+def _run_job(arguments):
+    """Run a list of tasks in order (e.g. the integrators of a chain, see expand_jobs)
+    Output:
+        ids of the tasks"""
+    save_location, job = arguments
+    if job[0][1]["kind"] == "find_max":
+        return run_find_max_tasks(save_location, job)
+    return [run_task(save_location, identifier, task) for identifier, task in job]
+
+
+def assemble_library(save_location, tasks, libraries):
+    """Gather the results of the find_max tasks into the library files
+    Input:
+        save_location: directory of the library
+        tasks: dictionary of tasks (see expand_jobs)
+        libraries: the files to write, among 'sm' (sm_maps.pkl, sm_xsec.pkl and the interpolators of
+            create_xsec_interp) and 'dark' (dark_maps.pkl and dark_xsec.pkl)
+    """
+    maps = {"sm": {}, "dark": {}}
+    cross_sections = {"sm": {}, "dark": {}}
+    for task in tasks.values():
+        if task["kind"] != "find_max":
+            continue
+        spec = task["spec"]
+        library = "dark" if spec["process"] in dark_processes else "sm"
+        if library not in libraries:
+            continue
+        with open(save_location + task["output"], "rb") as f:
+            result = pickle.load(f)
+        library_maps, library_cross_sections = maps[library], cross_sections[library]
+        if library == "dark":
+            library_maps = library_maps.setdefault(spec["mV"], {})
+            library_cross_sections = library_cross_sections.setdefault(spec["mV"], {})
+        energy, sampling = result["sampling"]
+        # Entries of the same energy for different targets share the adaptive map
+        entry = library_maps.setdefault(spec["process"], {}).setdefault(
+            energy, dict(sampling, max_F={}, max_F_strata={})
+        )
+        entry["max_F"].update(sampling["max_F"])
+        entry["max_F_strata"].update(sampling["max_F_strata"])
+        library_cross_sections.setdefault(spec["process"], {}).setdefault(
+            spec["target"], []
+        ).append([energy, result["cross_section"]])
+
+    for library in libraries:
+        mass_maps, mass_cross_sections = [maps[library]], [cross_sections[library]]
+        if library == "dark":
+            mass_maps = maps[library].values()
+            mass_cross_sections = cross_sections[library].values()
+        # Entries ordered by energy, as in the files of find_maxes.py
+        for process_maps in mass_maps:
+            for process, entries in process_maps.items():
+                process_maps[process] = [
+                    [energy, entries[energy]] for energy in sorted(entries)
+                ]
+        for process_cross_sections in mass_cross_sections:
+            for target_cross_sections in process_cross_sections.values():
+                for table in target_cross_sections.values():
+                    table.sort()
+
+        for file_name, dictionary in [
+            (library + "_maps.pkl", maps[library]),
+            (library + "_xsec.pkl", cross_sections[library]),
+        ]:
+            _write_atomic(
+                save_location + file_name, lambda f: pickle.dump(dictionary, f)
+            )
+            print("Saved " + save_location + file_name)
+        if library == "sm":
+            create_xsec_interp({"save_location": save_location})
+
+
+def linear_interpolation_errors(energies, values):
+    """Relative error, in the middle of each interval of energies, of the linear interpolation of
+    values (as in create_xsec_interp), estimated from the second divided differences at its ends"""
+    slopes = np.diff(values) / np.diff(energies)
+    curvature = np.zeros(len(energies))
+    if len(energies) > 2:
+        curvature[1:-1] = 2 * np.diff(slopes) / (energies[2:] - energies[:-2])
+        curvature[0], curvature[-1] = curvature[1], curvature[-2]
+    error = np.maximum(np.abs(curvature[:-1]), np.abs(curvature[1:])) * np.diff(energies) ** 2 / 8
+    scale = np.maximum(np.abs(values[:-1]), np.abs(values[1:]))
+    return np.divide(error, scale, out=np.zeros(len(error)), where=scale > 0)
+
+
+def nearest_energy_errors(values):
+    """Relative error, in the middle of each interval of energies, of taking values at the nearest
+    energy of the grid (as for the max_F of the samples, see Shower.draw_sample)"""
+    scale = np.maximum(np.abs(values[:-1]), np.abs(values[1:]))
+    return np.divide(
+        np.abs(np.diff(values)) / 2, scale, out=np.zeros(len(scale)), where=scale > 0
+    )
+
+
+def refine_energy_grid(save_location, tasks, tolerance, map_tolerance=None):
+    """Energies to add to the grids of the library, in the middle (in log) of the intervals where the
+    linear interpolation of the cross sections, the nearest-energy max_F (see linear_interpolation_errors
+    and nearest_energy_errors; the mean of max_F_strata is used when available) or the nearest-energy
+    adaptive maps are not accurate enough
+    Input:
+        save_location: directory of the library
+        tasks: dictionary of tasks (see expand_jobs), whose find_max tasks are all completed
+        tolerance: largest relative error of the cross sections and max_F
+        map_tolerance: largest displacement of the adaptive maps in the middle of an interval (half the
+            map_displacement between its ends, in the y-space of the maps), None to ignore the maps
+    Output:
+        list of [process, mV, energy] (see expand_jobs)
+    """
+    entries = {}
+    for task in tasks.values():
+        if task["kind"] != "find_max":
+            continue
+        spec = task["spec"]
+        with open(save_location + task["output"], "rb") as f:
+            result = pickle.load(f)
+        energy, sampling = result["sampling"]
+        entry = entries.setdefault((spec["process"], spec["mV"]), {}).setdefault(
+            energy, {"adaptive_map": sampling["adaptive_map"], "cross_section": {}, "max_F": {}}
+        )
+        entry["cross_section"][spec["target"]] = result["cross_section"]
+        # The stratified envelope (see find_maxes.find_max_F_strata) varies with the energy as max_F,
+        # with much smaller fluctuations
+        if "max_F_strata" in sampling:
+            entry["max_F"][spec["target"]] = np.mean(sampling["max_F_strata"][spec["target"]])
+        else:
+            entry["max_F"].update(sampling["max_F"])
+
+    refinement = []
+    for (process, mV), process_entries in entries.items():
+        energies = np.array(sorted(process_entries))
+        if len(energies) < 2:
+            continue
+        errors = np.zeros(len(energies) - 1)
+        for target in process_entries[energies[0]]["cross_section"]:
+            cross_sections = np.array(
+                [process_entries[E]["cross_section"][target] for E in energies]
+            )
+            max_F = np.array([process_entries[E]["max_F"][target] for E in energies])
+            errors = np.maximum(
+                errors, linear_interpolation_errors(energies, cross_sections) / tolerance
+            )
+            errors = np.maximum(errors, nearest_energy_errors(max_F) / tolerance)
+        if map_tolerance is not None:
+            maps = [process_entries[E]["adaptive_map"] for E in energies]
+            maps = [m.map if isinstance(m, vegas.Integrator) else m for m in maps]
+            for ii in range(len(energies) - 1):
+                grid = np.array(maps[ii + 1].grid)
+                igrange = [
+                    [grid[dim, 0], grid[dim, maps[ii + 1].ninc[dim]]]
+                    for dim in range(maps[ii + 1].dim)
+                ]
+                rescaled_map = rescaled_adaptive_map(maps[ii], igrange)
+                if rescaled_map is not None:
+                    errors[ii] = max(
+                        errors[ii],
+                        map_displacement(rescaled_map, maps[ii + 1]) / 2 / map_tolerance,
+                    )
+        refinement += [
+            [process, mV, float(np.sqrt(energies[ii] * energies[ii + 1]))]
+            for ii in np.flatnonzero(errors > 1)
+        ]
+    return refinement
+
+
+def _run_tasks(save_location, pending, pool, log):
+    """Run the pending tasks, on pool if given, and record them in log as they complete"""
+    # The integrators are trained before the find_max tasks that read them. The integrators of a
+    # chain (see expand_jobs) are trained in order, in a single job, and the targets of an integrator
+    # are processed in a single job
+    for kind in ["integrator", "find_max"]:
+        jobs = {}
+        for identifier, task in pending.items():
+            if task["kind"] == kind:
+                job_key = task.get("chain", task.get("input", identifier))
+                jobs.setdefault(job_key, []).append((identifier, task))
+        wave = [(save_location, job) for job in jobs.values()]
+        n_tasks = sum(len(job) for _, job in wave)
+        if pool is None:
+            results = map(_run_job, wave)
+        else:
+            results = pool.imap_unordered(_run_job, wave)
+        n_done = 0
+        for identifiers in results:
+            for identifier in identifiers:
+                log.write((json.dumps({"task": identifier}) + "\n").encode())
+            log.flush()
+            os.fsync(log.fileno())
+            n_done_before, n_done = n_done, n_done + len(identifiers)
+            if n_done // 100 > n_done_before // 100 or n_done == n_tasks:
+                print(f"{n_done}/{n_tasks} {kind} tasks completed")
+
+
+def build_library(config, n_processes=None, max_tasks_per_child=20):
+    """Build the library described by config, running only the tasks that are not yet completed
+    Input:
+        config: build configuration (see expand_jobs), with the optional keys
+            'refine_tolerance': if given, the energy grids are refined (see refine_energy_grid) until
+                the cross sections and max_F are accurate to refine_tolerance
+            'refine_map_tolerance': tolerance on the adaptive maps for the refinement (None to ignore them)
+            'refine_levels': largest number of refinements of the grids
+        n_processes: number of worker processes (all CPUs if None; 1 runs the tasks in this process)
+        max_tasks_per_child: number of tasks after which a worker process is replaced, which bounds
+            the memory held by the workers
+    Output:
+        number of tasks run
+    """
+    save_location = os.path.join(config["save_location"], "")
+    os.makedirs(save_location, exist_ok=True)
+    refine_tolerance = config.get("refine_tolerance")
+    refinement = []
+
+    pool = None
+    n_run = 0
+    libraries = []
+    with open(save_location + LOG_FILE, "ab+") as log:
+        # Terminate a line cut short by an interrupted build
+        if log.seek(0, os.SEEK_END) > 0:
+            log.seek(-1, os.SEEK_END)
+            if log.read(1) != b"\n":
+                log.write(b"\n")
+        # Each refinement of the grids only adds energies, whose tasks run after those of the
+        # previous grids (and are found completed when the build is run again)
+        while True:
+            tasks = expand_jobs(config, refinement)
+            write_manifest(save_location, config, tasks, refinement)
+
+            completed = completed_tasks(save_location)
+            pending = {
+                identifier: task
+                for identifier, task in tasks.items()
+                if identifier not in completed
+                or not os.path.exists(save_location + task["output"])
+            }
+            print(
+                f"{len(tasks)} tasks in the manifest, {len(tasks) - len(pending)} already completed"
+            )
+            # Library files entered by the tasks run now
+            for library, processes in [("sm", sm_processes), ("dark", dark_processes)]:
+                if library not in libraries and any(
+                    task["spec"]["process"] in processes for task in pending.values()
+                ):
+                    libraries.append(library)
+
+            if pool is None and n_processes != 1 and len(pending) > 0:
+                pool = Pool(processes=n_processes, maxtasksperchild=max_tasks_per_child)
+            _run_tasks(save_location, pending, pool, log)
+            n_run += len(pending)
+
+            if refine_tolerance is None or len(refinement) >= config.get("refine_levels", 3):
+                break
+            level = refine_energy_grid(
+                save_location,
+                tasks,
+                refine_tolerance,
+                config.get("refine_map_tolerance"),
+            )
+            if len(level) == 0:
+                break
+            print(f"Refinement {len(refinement) + 1}: adding {len(level)} energies")
+            refinement.append(level)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # Library files that are missing
+    for library, processes in [("sm", sm_processes), ("dark", dark_processes)]:
+        if library not in libraries and any(
+            task["spec"]["process"] in processes for task in tasks.values()
+        ):
+            if not (
+                os.path.exists(save_location + library + "_maps.pkl")
+                and os.path.exists(save_location + library + "_xsec.pkl")
+            ):
+                libraries.append(library)
+
+    assemble_library(save_location, tasks, libraries)
+    return n_run
+
+
+if __name__ == "__main__":
+    startTime = datetime.now()
+    parser = argparse.ArgumentParser(
+        description="Build (or update) the PETITE library of integrators and cross sections",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-save_location",
+        type=str,
+        default="../data/",
+        help="directory of the library (path relative to the utilities directory)",
+    )
+    parser.add_argument(
+        "-process",
+        nargs="+",
+        type=str,
+        default=["all"],
+        help='list of processes, "all" for all SM processes and "dark" for all dark processes \
+        (choose from "PairProd", "Brem", "Comp", "Ann", "Moller", "Bhabha", "DarkBrem", "DarkAnn", "DarkComp")',
+    )
+    parser.add_argument(
+        "-process_targets",
+        nargs="+",
+        type=str,
+        default=["graphite"],
+        help="list of targets to process for shower code",
+    )
+    parser.add_argument(
+        "-mV",
+        nargs="+",
+        type=float,
+        default=[0.003, 0.010, 0.030, 0.100, 0.300, 1.000],
+        help="dark vector masses in GeV (dark processes only)",
+    )
+    parser.add_argument(
+        "-min_energy", type=float, default=0.0016, help="minimum initial energy (in GeV)"
+    )
+    parser.add_argument(
+        "-max_energy", type=float, default=100.0, help="maximum initial energy (in GeV)"
+    )
+    parser.add_argument(
+        "-num_energy_pts",
+        type=int,
+        default=100,
+        help="number of initial energy values to evaluate, scan is done in log space",
+    )
+    parser.add_argument(
+        "-training_target",
+        type=str,
+        default="hydrogen",
+        help="target on which to train the dark integrators",
+    )
+    parser.add_argument(
+        "-mT",
+        type=float,
+        default=200.0,
+        help="target mass in GeV used to train the dark integrators",
+    )
+    parser.add_argument(
+        "-neval", type=int, default=300, help="neval value to provide to VEGAS in find_maxes"
+    )
+    parser.add_argument(
+        "-n_trials",
+        type=int,
+        default=100,
+        help="number of evaluations to perform for estimating cross-section",
+    )
+    parser.add_argument(
+        "-n_strata",
+        type=int,
+        default=None,
+        help="number of strata per dimension for the stratified max_F envelopes (default depends on the process dimensionality)",
+    )
+    parser.add_argument(
+        "-warm_start",
+        action="store_true",
+        help="train each energy starting from the integrator of the previous one, stopping once it has settled",
+    )
+    parser.add_argument(
+        "-chain_length",
+        type=int,
+        default=10,
+        help="number of consecutive energies trained in sequence with -warm_start (chains run in parallel)",
+    )
+    parser.add_argument(
+        "-refine_tolerance",
+        type=float,
+        default=None,
+        help="refine the energy grids until the cross sections and max_F are accurate to this relative tolerance (no refinement by default)",
+    )
+    parser.add_argument(
+        "-refine_map_tolerance",
+        type=float,
+        default=0.05,
+        help="largest displacement of the adaptive maps between an energy and the nearest energy of the grid, for -refine_tolerance",
+    )
+    parser.add_argument(
+        "-refine_levels",
+        type=int,
+        default=3,
+        help="largest number of refinements of the energy grids, for -refine_tolerance",
+    )
+    parser.add_argument(
+        "-n_processes",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "-max_tasks_per_child",
+        type=int,
+        default=20,
+        help="number of tasks after which a worker process is replaced",
+    )
+
+    args = parser.parse_args()
+    print(args)
+
+    processes = []
+    for process in args.process:
+        if process == "all":
+            processes += sm_processes
+        elif process == "dark":
+            processes += dark_processes
+        elif process in sm_processes + dark_processes:
+            processes.append(process)
+        else:
+            raise ValueError("Process '" + process + "' not in list of available processes.")
+    config = {
+        "save_location": args.save_location,
+        "process": processes,
+        "process_targets": args.process_targets,
+        "mV_list": args.mV,
+        "min_energy": args.min_energy,
+        "max_energy": args.max_energy,
+        "num_energy_pts": args.num_energy_pts,
+        "training_target": args.training_target,
+        "mT": args.mT,
+        "neval": args.neval,
+        "n_trials": args.n_trials,
+        "n_strata": args.n_strata,
+        "warm_start": args.warm_start,
+        "chain_length": args.chain_length,
+        "refine_tolerance": args.refine_tolerance,
+        "refine_map_tolerance": args.refine_map_tolerance,
+        "refine_levels": args.refine_levels,
+    }
+    build_library(
+        config, n_processes=args.n_processes, max_tasks_per_child=args.max_tasks_per_child
+    )
+
+    print("Run Time of Script:  ", datetime.now() - startTime)
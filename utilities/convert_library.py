@@ -0,0 +1,35 @@
+""" Convert the pickled libraries (sm_maps.pkl, sm_xsec.pkl, ...) into the binary library format.
+
+    The binary library is a directory of .npy files plus a manifest.json, see PETITE/library.py.
+    Start a shower from it with Shower(..., library_format="binary").
+
+    Typical usage:
+
+    python convert_library.py -dict_dir='/Users/johndoe/PETITE/data/'
+"""
+
+import argparse
+
+from PETITE.library import convert_library, BINARY_LIBRARY_DIR
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert pickled libraries into the binary library format",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-dict_dir",
+        type=str,
+        help="directory containing the pickled libraries",
+        required=True,
+    )
+    parser.add_argument(
+        "-library_dir",
+        type=str,
+        default=None,
+        help="output directory, defaults to <dict_dir>/" + BINARY_LIBRARY_DIR,
+    )
+    args = parser.parse_args()
+
+    library_dir = convert_library(args.dict_dir, args.library_dir)
+    print("Binary library written to " + library_dir)
@@ -17,8 +17,11 @@ import pickle
 import copy
 import numpy as np
 from scipy.interpolate import interp1d
+from scipy.ndimage import maximum_filter
 import argparse
 from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
 import vegas
 
 # from tqdm import tqdm
@@ -48,6 +51,13 @@ process_info = {
     "DarkComp": {"diff_xsection": proc.dsigma_compton_dCT},
 }
 
+# Default number of strata per dimension of the max_F_strata envelopes, by dimensionality of the integrand
+n_strata_options = {1: 32, 2: 16, 3: 6, 4: 4}
+# Smallest number of points scanned in each stratum, and factor by which the (neighbourhood)
+# maxima are raised, so that the envelopes bound jac*f in (almost) all of the stratum
+min_points_per_stratum = 64
+max_F_strata_margin = 1.1
+
 
 def get_file_names(path):
     """Get the names of all the files in a directory.
@@ -67,9 +77,58 @@ def get_file_names(path):
     return (pickle_files, readme_file)
 
 
+def target_event_info(event_info, tm, params):
+    """Copy of event_info for target material tm (and dark vector mass params['mV'], if given)"""
+    event_info_target = copy.deepcopy(event_info)
+    event_info_target["Z_T"] = target_information[tm]["Z_T"]
+    event_info_target["A_T"] = target_information[tm]["A_T"]
+    event_info_target["mT"] = target_information[tm]["mT"]
+    if "mV" in params:
+        event_info_target["mV"] = params["mV"]
+    return event_info_target
+
+
+def find_max_F_strata(integrand, adaptive_map, n_strata, n_points):
+    """Find the maximum of the integrand in each stratum of a coarse grid over the unit hypercube
+    (the VEGAS y-space of adaptive_map), used as a piecewise-constant envelope for accept-reject sampling.
+    A random scan underestimates the maximum of each stratum, so the envelope of a stratum is the
+    largest maximum found in it and its neighbours, times max_F_strata_margin.
+    Input:
+        integrand: integrand of the process for each target material (see proc.multi_target_integrand)
+        adaptive_map: VEGAS adaptive map of the process for this incoming energy
+        n_strata: number of strata per dimension
+        n_points: total number of points to scan, spread evenly over the strata (at least
+            min_points_per_stratum in each)
+    Output:
+        array of shape (n_targets,) + (n_strata,)*dim with the envelope of jac*f in each stratum, where
+        jac is the jacobian of adaptive_map at the y-space point and f the integrand at the mapped point
+    """
+    dim = adaptive_map.dim
+    n_cells = n_strata**dim
+    n_per_cell = max(n_points // n_cells, min_points_per_stratum)
+    strata = np.repeat(np.arange(n_cells), n_per_cell)
+    y = (
+        np.transpose(np.unravel_index(strata, (n_strata,) * dim))
+        + np.random.uniform(size=(len(strata), dim))
+    ) / n_strata
+    x = np.empty_like(y)
+    jac = np.empty(len(y))
+    adaptive_map.map(y, x, jac)
+
+    FF = np.nan_to_num(jac * integrand(x))
+    max_F_strata = np.maximum(FF.reshape(len(FF), n_cells, n_per_cell).max(axis=2), 0.0)
+    max_F_strata = maximum_filter(
+        max_F_strata.reshape((len(FF),) + (n_strata,) * dim),
+        size=(1,) + (3,) * dim,
+        mode="nearest",
+    )
+    return max_F_strata_margin * max_F_strata
+
+
 # do the find max work on an individual file
 def do_find_max_work(params, process_file):
     """Find the maximum value of the integrand for a given process_file.
+    All target materials are done in a single scan (see proc.multi_target_integrand).
     Input:
         params: dictionary of parameters for the process
         process_file: array of event_info and integrand which was read from a file (0.p, 1.p, ...)
@@ -77,6 +136,7 @@ def do_find_max_work(params, process_file):
         samp_dict: dictionary of information about the sampling, containing:
             'neval': number of evaluations used in VEGAS (neval)
             'max_F': maximum value of the integrand (max_F)
+            'max_F_strata': maximum value of the integrand in each stratum of the unit hypercube (see find_max_F_strata)
             'Eg_min': minimum energy of the outgoing photon (Eg_min) if it was specified in the event_info
             'Ee_min': minimum energy of the outgoing electron (Ee_min) if it was specified in the event_info
             'adaptive_map': adaptive map used in the sampling (adaptive_map)
@@ -92,50 +152,36 @@ def do_find_max_work(params, process_file):
     )  # nstrat=nstrat_options[params['process']])
     save_copy = copy.deepcopy(integrand_or_map)
 
-    max_F_TM = {}
-    xSec = {}
-    for tm in params["process_targets"]:
-        xSec[tm] = 0.0
-        max_F_TM[tm] = 0.0
+    targets = params["process_targets"]
+    target_integrand = proc.multi_target_integrand(
+        diff_xsec,
+        [target_event_info(event_info, tm, params) for tm in targets],
+        event_info["process"],
+    )
+
+    max_F = np.zeros(len(targets))
+    xSec = np.zeros(len(targets))
     integrand.set(max_nhcube=1, neval=params["neval"])
     for trial_number in range(params["n_trials"]):
         for x_batch, wgt_batch in integrand.random_batch():  # scan over integrand
-            # for x, wgt in zip(x_batch, wgt_batch):
-            #     for tm in params["process_targets"]:
-            #         event_info_target = copy.deepcopy(event_info)
-            #         event_info_target["Z_T"] = target_information[tm]["Z_T"]
-            #         event_info_target["A_T"] = target_information[tm]["A_T"]
-            #         event_info_target["mT"] = target_information[tm]["mT"]
-            #         if "mV" in params:
-            #             event_info_target["mV"] = params["mV"]
-            #         MM = wgt * batch_f(np.array([x]))
-            #         if MM > max_F_TM[tm]:
-            #             max_F_TM[tm] = MM
-            #         xSec[tm] += np.sum(MM) / params["n_trials"]
-
-            for tm in params["process_targets"]:
-                event_info_target = copy.deepcopy(event_info)
-                event_info_target["Z_T"] = target_information[tm]["Z_T"]
-                event_info_target["A_T"] = target_information[tm]["A_T"]
-                event_info_target["mT"] = target_information[tm]["mT"]
-                if "mV" in params:
-                    event_info_target["mV"] = params["mV"]
-                MM = wgt_batch * diff_xsec(
-                    event_info_target,
-                    len(
-                        proc.integration_range(
-                            event_info_target, event_info_target["process"]
-                        )
-                    ),
-                )(x_batch)
-                MMmax = np.max(MM)
-                if MMmax > max_F_TM[tm]:
-                    max_F_TM[tm] = MMmax
-                xSec[tm] += np.sum(MM) / params["n_trials"]
+            MM = wgt_batch * target_integrand(x_batch)
+            max_F = np.fmax(max_F, np.fmax.reduce(MM, axis=1))
+            xSec += np.sum(MM, axis=1) / params["n_trials"]
+
+    # Stratified envelopes, on the y-space of the saved adaptive map
+    adaptive_map = save_copy.map if isinstance(save_copy, vegas.Integrator) else save_copy
+    n_strata = params.get("n_strata") or n_strata_options[adaptive_map.dim]
+    max_F_strata = find_max_F_strata(
+        target_integrand,
+        adaptive_map,
+        n_strata,
+        params["n_trials"] * params["neval"],
+    )
 
     samp_dict_info = {
         "neval": params["neval"],
-        "max_F": {tm: max_F_TM[tm] for tm in params["process_targets"]},
+        "max_F": {tm: max_F[i] for i, tm in enumerate(targets)},
+        "max_F_strata": {tm: max_F_strata[i] for i, tm in enumerate(targets)},
         "adaptive_map": save_copy,
     }
     if "Eg_min" in event_info.keys():
@@ -144,7 +190,24 @@ def do_find_max_work(params, process_file):
         samp_dict_info["Ee_min"] = event_info["Ee_min"]
     samp_dict = [event_info["E_inc"], samp_dict_info]
     # xSec_dict = [event_info['E_inc'], xSec]
-    return (samp_dict, xSec, event_info["E_inc"])
+    return (
+        samp_dict,
+        {tm: xSec[i] for i, tm in enumerate(targets)},
+        event_info["E_inc"],
+    )
+
+
+def find_max_work_list(params, adaptive_maps):
+    """Run do_find_max_work on each of the adaptive_maps (one per energy), in parallel over
+    params['n_processes'] processes (all available CPUs if None, serially if 1)
+    Output:
+        list of the outputs of do_find_max_work, in the order of adaptive_maps
+    """
+    n_processes = params.get("n_processes")
+    if n_processes == 1 or len(adaptive_maps) < 2:
+        return [do_find_max_work(params, adaptive_map) for adaptive_map in adaptive_maps]
+    with Pool(n_processes) as pool:
+        return pool.map(partial(do_find_max_work, params), adaptive_maps)
 
 
 def main(params):
@@ -154,6 +217,8 @@ def main(params):
             'process': list of processes to be run
             'Z_T': list of target materials to be run
             'neval': number of evaluations used in VEGAS
+            'n_strata': number of strata per dimension for max_F_strata (None for n_strata_options)
+            'n_processes': number of processes over which the energies are run in parallel (see find_max_work_list)
             'save_location': path to the mother directory whose subdirs contain the adaptive maps
             # add all needed parameters here!
     """
@@ -228,10 +293,9 @@ def main(params):
 
         # =====------ FIND MAX ------=====####
         # loop over all adaptive_map in adaptive_maps
-        for adaptive_map in adaptive_maps:
-            sampling, cross_section, incoming_energy = do_find_max_work(
-                params, adaptive_map
-            )
+        for sampling, cross_section, incoming_energy in find_max_work_list(
+            params, adaptive_maps
+        ):
             # Append sampling dictionary to final sampling dictionary
             final_sampling_dict[process].append(sampling)
 
@@ -260,6 +324,8 @@ def main_dark(params):
             'process': list of processes to be run
             'Z_T': list of target materials to be run
             'neval': number of evaluations used in VEGAS
+            'n_strata': number of strata per dimension for max_F_strata (None for n_strata_options)
+            'n_processes': number of processes over which the energies are run in parallel (see find_max_work_list)
             'save_location': path to the mother directory whose subdirs contain the adaptive maps
             # add all needed parameters here!
     """
@@ -347,10 +413,9 @@ def main_dark(params):
 
             # =====------ FIND MAX ------=====####
             # loop over all adaptive_map in adaptive_maps
-            for adaptive_map in adaptive_maps:
-                sampling, cross_section, incoming_energy = do_find_max_work(
-                    fm_params, adaptive_map
-                )
+            for sampling, cross_section, incoming_energy in find_max_work_list(
+                fm_params, adaptive_maps
+            ):
                 # Append sampling dictionary to final sampling dictionary
                 final_sampling_dict[mV][process].append(sampling)
                 # Append incoming energy and cross section dictionary to final cross section dictionary for each target material
@@ -429,6 +494,20 @@ if __name__ == "__main__":
         required=True,
     )
 
+    parser.add_argument(
+        "-n_strata",
+        type=int,
+        default=None,
+        help="number of strata per dimension for the stratified max_F envelopes (default depends on the process dimensionality)",
+    )
+
+    parser.add_argument(
+        "-n_processes",
+        type=int,
+        default=None,
+        help="number of processes over which the energies are run in parallel (default: all CPUs)",
+    )
+
     args = parser.parse_args()
     print(args)
     if "all" in args.process:
@@ -445,6 +524,8 @@ if __name__ == "__main__":
         "verbosity_mode": args.verbosity,
         "neval": args.neval,
         "n_trials": args.n_trials,
+        "n_strata": args.n_strata,
+        "n_processes": args.n_processes,
     }
     main(params)
 
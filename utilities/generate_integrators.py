@@ -6,7 +6,7 @@ import numpy as np
 import os
 
 from scipy.interpolate import interp1d
-from scipy.integrate import quad
+from scipy.integrate import cumulative_trapezoid
 
 from glob import glob
 
@@ -16,7 +16,7 @@ from functools import partial
 import argparse
 import datetime
 
-from PETITE.all_processes import vegas_integration
+from PETITE.all_processes import vegas_integration, vegas_training
 from PETITE.physical_constants import m_electron, alpha_em, GeVsqcm2
 from PETITE.targets import target_information, Target
 
@@ -91,7 +91,49 @@ def run_vegas_in_parallel(
     return ()
 
 
-def make_integrators(params, process, paralellize=True, overwrite=False):
+def run_vegas_chain(
+    params, process, verbosity_mode, process_directory, energy_indices, overwrite=False
+):
+    """Train the integrators of consecutive energies in order, starting each from the adaptive map
+    of the previous one and stopping once it has settled (see vegas_training), and save them as
+    run_vegas_in_parallel does. An integrator that already exists seeds the next one.
+    Input:
+        params, process, verbosity_mode, process_directory: as for run_vegas_in_parallel
+        energy_indices: consecutive indices of energies in initial_energy_list
+    Output:
+        number of integrand evaluations used
+    """
+    adaptive_map = None
+    n_evaluations = 0
+    for energy_index in energy_indices:
+        file_name = process_directory + process + "_" + str(energy_index) + ".p"
+        if os.path.exists(file_name) and not overwrite:
+            print("Already generated integrator for this point\n")
+            with open(file_name, "rb") as f:
+                adaptive_map = pickle.load(f)[1]
+            continue
+        energy_params = dict(params)
+        energy_params["E_inc"] = params["initial_energy_list"][energy_index]
+        if params["verbosity"]:
+            print("Starting VEGAS for energy index ", energy_index)
+        VEGAS_integrator, _, n_evaluations_energy = vegas_training(
+            energy_params, process, adaptive_map=adaptive_map, verbose=verbosity_mode
+        )
+        n_evaluations += n_evaluations_energy
+        adaptive_map = VEGAS_integrator.map
+
+        energy_params["process"] = process
+        object_to_save = [energy_params, VEGAS_integrator.map]
+        pickle.dump(object_to_save, open(file_name, "wb"))
+        if params["verbosity"]:
+            print("File created: " + file_name)
+
+    return n_evaluations
+
+
+def make_integrators(
+    params, process, paralellize=True, overwrite=False, warm_start=False, chain_length=10
+):
     """
     Generate vegas integrator pickles for a given process and set of parameters.
     Input:
@@ -99,6 +141,9 @@ def make_integrators(params, process, paralellize=True, overwrite=False):
         process: string of process name
         paralellize: boolean to run in parallel or not
         overwrite: boolean to overwrite existing files or not
+        warm_start: boolean to train the energies in chains of chain_length consecutive energies,
+            each starting from the adaptive map of the previous one (see run_vegas_chain)
+        chain_length: number of energies in each chain (chains are trained in parallel)
     """
     if "mV" not in params:
         mV = 0.0
@@ -156,7 +201,27 @@ def make_integrators(params, process, paralellize=True, overwrite=False):
     if not (os.path.exists(process_directory)):
         os.system("mkdir -p " + process_directory)
 
-    if paralellize:
+    if warm_start:
+        chains = [
+            energy_index_list[first : first + chain_length]
+            for first in range(0, len(energy_index_list), chain_length)
+        ]
+        run_chain = partial(
+            run_vegas_chain,
+            params,
+            process,
+            verbosity_mode,
+            process_directory,
+            overwrite=overwrite,
+        )
+        if paralellize:
+            pool = Pool()
+            n_evaluations = sum(pool.map(run_chain, chains))
+        else:
+            n_evaluations = sum(map(run_chain, chains))
+        if verbosity_mode:
+            print("Integrand evaluations used in training: ", n_evaluations)
+    elif paralellize:
         # pool parallelizes the generation of integrators
         pool = Pool()
         _ = pool.map(
@@ -327,17 +392,10 @@ def create_xsec_interp(params):
                 bounds_error=False,
             )
 
-            # Integral of inverse mean free path from E_min to E_max
-            inv_mfp = np.array(
-                [
-                    quad(
-                        final_xsec_dict_interp[process][target],
-                        E[0],
-                        E[i],
-                        full_output=1,
-                    )[0]
-                    for i in range(len(E))
-                ]
+            # Integral of inverse mean free path from E_min to E_max, exact for the
+            # piecewise-linear interpolation above
+            inv_mfp = cumulative_trapezoid(
+                final_xsec_dict_interp[process][target](E), E, initial=0.0
             )
             inv_mfp_dict_interp[process][target] = interp1d(
                 E, inv_mfp, fill_value=0.0, bounds_error=False
@@ -396,7 +454,12 @@ def main(args):
             )
             training_params.update({"mV": 0})
             training_params.update({"initial_energy_list": initial_energy_list})
-            make_integrators(training_params, process)
+            make_integrators(
+                training_params,
+                process,
+                warm_start=args.warm_start,
+                chain_length=args.chain_length,
+            )
             # stitch integrators for different energies together
             stitch_integrators(training_params["save_location"] + "/" + process + "/")
             cleanup(training_params["save_location"] + "/" + process + "/")
@@ -414,7 +477,12 @@ def main(args):
             )
             training_params.update({"mV": mV})
             training_params.update({"initial_energy_list": initial_energy_list})
-            make_integrators(training_params, process)
+            make_integrators(
+                training_params,
+                process,
+                warm_start=args.warm_start,
+                chain_length=args.chain_length,
+            )
             # stitch integrators for different energies together (add mV to the name of output file)
             stitch_integrators(
                 training_params["save_location"]
@@ -508,6 +576,18 @@ if __name__ == "__main__":
         "-run_find_maxes", type=bool, default=True, help="run Find_Maxes.py after done"
     )
 
+    parser.add_argument(
+        "-warm_start",
+        action="store_true",
+        help="train each energy starting from the integrator of the previous one, stopping once it has settled",
+    )
+    parser.add_argument(
+        "-chain_length",
+        type=int,
+        default=10,
+        help="number of consecutive energies trained in sequence with -warm_start (chains run in parallel)",
+    )
+
     parser.add_argument("-verbosity", type=bool, default=False, help="verbosity mode")
     # stich integrators
     parser.add_argument(